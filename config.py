@@ -22,25 +22,83 @@ RMT_SUBEXT = ['.srt', '.ass', '.ssa']
 # 默认Headers
 DEFAULT_HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/98.0.4758.102 Safari/537.36"}
+# 每个站点共享连接池的最大连接数
+HTTP_POOL_SIZE = 10
+# HTTP请求默认超时时间，秒
+HTTP_TIMEOUT = 10
+# HTTP请求失败时的最大尝试次数
+HTTP_RETRIES = 3
+# HTTP请求重试的退避基数，秒，按指数递增
+HTTP_RETRY_BACKOFF = 1
+# 服务端要求的Retry-After等待时间上限，秒
+HTTP_RETRY_AFTER_MAX = 30
 # 电视剧动漫的分类genre_ids
 ANIME_GENREIDS = ['16']
 # 默认过滤的文件大小，150M
 RMT_MIN_FILESIZE = 150 * 1024 * 1024
+# 复制文件时每次处理的数据块大小，也是复制进度的更新粒度，64M
+RMT_COPY_CHUNK_SIZE = 64 * 1024 * 1024
+# 复制文件时临时文件的后缀，复制完成后重命名为正式文件名，中断时保留用于续传
+RMT_COPY_TEMP_EXT = ".nastool.part"
+# 每个磁盘同时复制的文件数，未配置copy_threads时使用
+RMT_COPY_THREADS = 2
 # PT删种检查时间间隔
 AUTO_REMOVE_TORRENTS_INTERVAL = 1800
 # PT转移文件检查时间间隔，
 PT_TRANSFER_INTERVAL = 300
 # TMDB信息缓存定时保存时间
 METAINFO_SAVE_INTERVAL = 600
+# TMDB信息缓存内存中保留的热点条数
+METAINFO_CACHE_SIZE = 2000
+# TMDB未识别到的缓存有效期，过期后会重新查询，1天
+METAINFO_NONE_EXPIRE = 86400
+# TMDB详情缓存有效期，连载中的电视剧6小时
+TMDB_DETAILS_EXPIRE = 6 * 3600
+# TMDB详情缓存有效期，已完结的电视剧及电影30天
+TMDB_DETAILS_ENDED_EXPIRE = 30 * 86400
+# TMDB详情缓存内存中保留的条数，详情数据较大，只保留少量热点
+TMDB_DETAILS_CACHE_SIZE = 200
+# 名称识别结果在内存中缓存的条数
+METAINFO_PARSE_CACHE_SIZE = 5000
+# 每个识别进程至少分配的文件数，文件数量不足时不启用多进程识别
+METAINFO_PARSE_PROCESS_MIN = 500
+# 批量识别时并发查询TMDB的线程数
+TMDB_SEARCH_THREADS = 8
+# 媒体库文件索引全量校对时间间隔，6小时
+LIBRARY_INDEX_INTERVAL = 6 * 3600
+# 媒体服务器媒体库快照有效期，过期后全量刷新，30分钟
+MEDIA_SERVER_SNAPSHOT_EXPIRE = 1800
+# 分页查询媒体服务器媒体库时每页的条数
+MEDIA_SERVER_PAGE_SIZE = 1000
 # 配置文件定时生效时间
 RELOAD_CONFIG_INTERVAL = 600
+# 目录监控已处理文件的记录条数上限
+SYNC_FILES_MAX = 100000
+# 目录监控已处理文件的记录有效期，1天
+SYNC_FILES_EXPIRE = 86400
+# 目录监控合并文件事件的检查间隔，秒
+SYNC_EVENT_CHECK_INTERVAL = 2
+# 目录监控的文件大小和修改时间保持不变多久后才认为已写入完成，秒
+SYNC_FILE_STABLE_TIME = 30
 # SYNC目录同步聚合转移时间
 SYNC_TRANSFER_INTERVAL = 300
+# SYNC目录同步并发转移的线程数，同一设备上的目录依次转移，不同设备上的并行转移
+SYNC_TRANSFER_THREADS = 4
+# 并发下载RSS的站点数
+RSS_FETCH_THREADS = 5
+# 并发访问PT站点签到、刷新流量的线程数
+PT_SITE_THREADS = 5
+# PT站点流量数据后台刷新时间间隔，12小时
+PT_SITE_DATA_INTERVAL = 12 * 3600
 # RSS队列中处理时间间隔
 RSS_SEARCH_INTERVAL = 300
 # fanart的api，用于拉取封面图片
 FANART_MOVIE_API_URL = 'https://webservice.fanart.tv/v3/movies/%s?api_key=d2d31f9ecabea050fc7d68aa3146015f'
 FANART_TV_API_URL = 'https://webservice.fanart.tv/v3/tv/%s?api_key=d2d31f9ecabea050fc7d68aa3146015f'
+# fanart图片缓存有效期，7天
+FANART_IMAGE_EXPIRE = 7 * 86400
+# 后台预取fanart图片的线程数
+FANART_PREFETCH_THREADS = 2
 # 日志级别
 LOG_LEVEL = logging.INFO
 # 定义一个列表用来保存最近的日志，以便查看
@@ -1,7 +1,7 @@
 from urllib.parse import urlencode
-import requests
 
 from config import Config
+from utils.http_utils import RequestUtils
 
 
 class ServerChan:
@@ -39,7 +39,7 @@ class ServerChan:
             if not self.__sckey:
                 return False, "参数未配置"
             sc_url = "https://sctapi.ftqq.com/%s.send?%s" % (self.__sckey, urlencode(values))
-            res = requests.get(sc_url, timeout=10)
+            res = RequestUtils().get_res(sc_url)
             if res:
                 ret_json = res.json()
                 errno = ret_json['code']
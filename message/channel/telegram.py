@@ -1,10 +1,10 @@
 from threading import Lock
 from urllib.parse import urlencode
-import requests
 
 import log
 from config import Config
 from utils.functions import singleton
+from utils.http_utils import RequestUtils
 
 lock = Lock()
 WEBHOOK_STATUS = False
@@ -90,7 +90,7 @@ class Telegram:
                 values = {"chat_id": chat_id, "text": caption, "parse_mode": "HTML"}
                 sc_url = "https://api.telegram.org/bot%s/sendMessage?" % self.__telegram_token
 
-            res = requests.get(sc_url + urlencode(values), timeout=10, proxies=self.__config.get_proxies())
+            res = RequestUtils(proxies=self.__config.get_proxies()).get_res(sc_url + urlencode(values))
             if res:
                 ret_json = res.json()
                 errno = ret_json['ok']
@@ -126,7 +126,7 @@ class Telegram:
                 self.__del_bot_webhook()
             values = {"url": self.__webhook_url, "allowed_updates": ["message"]}
             sc_url = "https://api.telegram.org/bot%s/setWebhook?" % self.__telegram_token
-            res = requests.get(sc_url + urlencode(values), timeout=10, proxies=self.__config.get_proxies())
+            res = RequestUtils(proxies=self.__config.get_proxies()).get_res(sc_url + urlencode(values))
             if res:
                 json = res.json()
                 if json.get("ok"):
@@ -142,7 +142,7 @@ class Telegram:
         :return: 状态：1-存在且相等，2-存在不相等，3-不存在，0-网络出错
         """
         sc_url = "https://api.telegram.org/bot%s/getWebhookInfo" % self.__telegram_token
-        res = requests.get(sc_url, timeout=10, proxies=self.__config.get_proxies())
+        res = RequestUtils(proxies=self.__config.get_proxies()).get_res(sc_url)
         if res and res.json():
             if res.json().get("ok"):
                 webhook_url = res.json().get("result", {}).get("url") or ""
@@ -163,7 +163,7 @@ class Telegram:
         :return: 是否成功
         """
         sc_url = "https://api.telegram.org/bot%s/deleteWebhook" % self.__telegram_token
-        res = requests.get(sc_url, timeout=10, proxies=self.__config.get_proxies())
+        res = RequestUtils(proxies=self.__config.get_proxies()).get_res(sc_url)
         if res and res.json() and res.json().get("ok"):
             return True
         else:
@@ -1,11 +1,11 @@
 from datetime import datetime
 import json
 import threading
-import requests
 
 import log
 from config import Config
 from utils.functions import singleton
+from utils.http_utils import RequestUtils
 
 lock = threading.Lock()
 
@@ -53,7 +53,7 @@ class WeChat(object):
             try:
                 token_url = "https://qyapi.weixin.qq.com/cgi-bin/gettoken?corpid=%s&corpsecret=%s" \
                             % (self.__corpid, self.__corpsecret)
-                res = requests.get(token_url, timeout=10)
+                res = RequestUtils().get_res(token_url)
                 if res:
                     ret_json = res.json()
                     if ret_json['errcode'] == 0:
@@ -102,8 +102,8 @@ class WeChat(object):
         }
         headers = {'content-type': 'application/json'}
         try:
-            res = requests.post(message_url, data=json.dumps(req_json, ensure_ascii=False).encode('utf-8'),
-                                headers=headers)
+            res = RequestUtils(headers=headers).post_res(message_url,
+                                                         data=json.dumps(req_json, ensure_ascii=False).encode('utf-8'))
             if res:
                 ret_json = res.json()
                 if ret_json['errcode'] == 0:
@@ -149,8 +149,8 @@ class WeChat(object):
         }
         headers = {'content-type': 'application/json'}
         try:
-            res = requests.post(message_url, data=json.dumps(req_json, ensure_ascii=False).encode('utf-8'),
-                                headers=headers)
+            res = RequestUtils(headers=headers).post_res(message_url,
+                                                         data=json.dumps(req_json, ensure_ascii=False).encode('utf-8'))
             if res:
                 ret_json = res.json()
                 if ret_json['errcode'] == 0:
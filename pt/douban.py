@@ -53,7 +53,7 @@ class DouBan:
                             cookie = requests.utils.dict_from_cookiejar(cookies)
                 except Exception as err:
                     log.warn(f"【DOUBAN】获取cookie失败:{format(err)}")
-            self.req = RequestUtils(headers=user_agent, cookies=cookie)
+            self.req = RequestUtils(headers=user_agent, cookies=cookie, verify=False)
 
     def get_all_douban_movies(self):
         """
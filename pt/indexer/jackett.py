@@ -1,13 +1,14 @@
 import re
 from xml.dom.minidom import parse
 import xml.dom.minidom
-import requests
 import log
 from config import Config
 from pt.torrent import Torrent
+from rmt.fanart import Fanart
 from rmt.media import Media
 from rmt.metainfo import MetaInfo
 from utils.functions import str_filesize
+from utils.http_utils import RequestUtils
 from utils.sqls import get_config_search_rule
 from utils.types import MediaType
 from concurrent.futures.thread import ThreadPoolExecutor
@@ -52,7 +53,7 @@ class Jackett:
         if not self.__api_key or not self.__indexers:
             return False
         api_url = "%sapi?apikey=%s&t=search&q=%s" % (self.__indexers[0], self.__api_key, "ASDFGHJKL")
-        res = requests.get(api_url, timeout=10)
+        res = RequestUtils().get_res(api_url)
         if res and res.status_code == 200:
             if res.text.find("Invalid API Key") == -1:
                 return True
@@ -131,15 +132,12 @@ class Jackett:
             return []
         else:
             log.warn("【JACKETT】%s 返回数据：%s" % (indexer_name, len(result_array)))
-        # 从检索结果中匹配符合资源条件的记录
-        index_sucess = 0
+        # 先按做种数、过滤规则、类型筛选，再批量识别媒体信息
+        filter_items = []
         for item in result_array:
             torrent_name = item.get('title')
-            enclosure = item.get('enclosure')
-            size = item.get('size')
             description = item.get('description')
             seeders = item.get('seeders')
-            peers = item.get('peers')
 
             # 合匹配模式下，过滤掉做种数为0的
             if whole_word and not seeders:
@@ -157,9 +155,24 @@ class Jackett:
             if mtype and meta_info.type not in [MediaType.MOVIE, MediaType.UNKNOWN] and mtype == MediaType.MOVIE:
                 log.info("【JACKETT】%s 是 %s，类型不匹配" % (torrent_name, meta_info.type.value))
                 continue
+            filter_items.append((item, res_order))
+
+        # 批量识别媒体信息，相同的媒体只查询一次TMDB
+        media_infos = self.media.get_media_infos([(item.get('title'), item.get('description')) for item, _ in filter_items])
+        # 检索结果展示时需要图片，在后台预取
+        Fanart().prefetch(media_infos)
+
+        # 从检索结果中匹配符合资源条件的记录
+        index_sucess = 0
+        for (item, res_order), media_info in zip(filter_items, media_infos):
+            torrent_name = item.get('title')
+            enclosure = item.get('enclosure')
+            size = item.get('size')
+            description = item.get('description')
+            seeders = item.get('seeders')
+            peers = item.get('peers')
 
             # 识别媒体信息
-            media_info = self.media.get_media_info(title=torrent_name, subtitle=description)
             if not media_info or not media_info.tmdb_info:
                 log.info("【JACKETT】%s 未查询到媒体信息" % torrent_name)
                 continue
@@ -232,11 +245,7 @@ class Jackett:
         ret_array = []
         if not url:
             return ret_array
-        try:
-            ret = requests.get(url, timeout=30)
-        except Exception as e2:
-            log.console(str(e2))
-            return []
+        ret = RequestUtils(timeout=30).get_res(url)
         if ret:
             ret_xml = ret.text
             try:
@@ -1,12 +1,13 @@
 import re
 
-import requests
 import log
 from config import Config
 from pt.torrent import Torrent
+from rmt.fanart import Fanart
 from rmt.media import Media
 from rmt.metainfo import MetaInfo
 from utils.functions import str_filesize
+from utils.http_utils import RequestUtils
 from utils.sqls import get_config_search_rule
 from utils.types import MediaType
 
@@ -51,7 +52,7 @@ class Prowlarr:
         if not self.__api_key or not self.__host:
             return False
         api_url = "%sapi/v1/search?apikey=%s&Query=%s" % (self.__host, self.__api_key, "ASDFGHJKL")
-        res = requests.get(api_url, timeout=10)
+        res = RequestUtils().get_res(api_url)
         if res and res.status_code == 200:
             return True
         return False
@@ -85,17 +86,12 @@ class Prowlarr:
             return []
         else:
             log.warn("【PROWLARR】返回数据：%s" % len(result_array))
-        # 从检索结果中匹配符合资源条件的记录
-        index_sucess = 0
+        # 先按做种数、过滤规则、类型筛选，再批量识别媒体信息
+        filter_items = []
         for item in result_array:
-            indexer_name = item.get('indexer')
-            indexerId = 100 - item.get('indexerId')
             torrent_name = item.get('title')
-            enclosure = item.get('enclosure')
-            size = item.get('size')
             description = item.get('description')
             seeders = item.get('seeders')
-            peers = item.get('peers')
 
             # 合匹配模式下，过滤掉做种数为0的
             if whole_word and not seeders:
@@ -113,9 +109,26 @@ class Prowlarr:
             if mtype and meta_info.type not in [MediaType.MOVIE, MediaType.UNKNOWN] and mtype == MediaType.MOVIE:
                 log.info("【PROWLARR】%s 是 %s，类型不匹配" % (torrent_name, meta_info.type.value))
                 continue
+            filter_items.append((item, res_order))
+
+        # 批量识别媒体信息，相同的媒体只查询一次TMDB
+        media_infos = self.media.get_media_infos([(item.get('title'), item.get('description')) for item, _ in filter_items])
+        # 检索结果展示时需要图片，在后台预取
+        Fanart().prefetch(media_infos)
+
+        # 从检索结果中匹配符合资源条件的记录
+        index_sucess = 0
+        for (item, res_order), media_info in zip(filter_items, media_infos):
+            indexer_name = item.get('indexer')
+            indexerId = 100 - item.get('indexerId')
+            torrent_name = item.get('title')
+            enclosure = item.get('enclosure')
+            size = item.get('size')
+            description = item.get('description')
+            seeders = item.get('seeders')
+            peers = item.get('peers')
 
             # 识别媒体信息
-            media_info = self.media.get_media_info(title=torrent_name, subtitle=description)
             if not media_info or not media_info.tmdb_info:
                 log.info("【PROWLARR】%s 未查询到媒体信息" % torrent_name)
                 continue
@@ -188,11 +201,7 @@ class Prowlarr:
         ret_array = []
         if not url:
             return ret_array
-        try:
-            ret = requests.get(url, timeout=30)
-        except Exception as e2:
-            log.console(str(e2))
-            return []
+        ret = RequestUtils(timeout=30).get_res(url)
         if ret:
             results = ret.json()
             for item in results:
@@ -1,11 +1,17 @@
 import ipaddress
+import time
+from threading import Lock
 
 import log
-from config import Config
+from config import Config, MEDIA_SERVER_SNAPSHOT_EXPIRE
 from pt.mediaserver.emby import Emby
 from pt.mediaserver.jellyfin import Jellyfin
 from pt.mediaserver.plex import Plex
 
+lock = Lock()
+# 媒体服务器媒体库快照，所有实例共用
+LIBRARY_SNAPSHOT = {}
+
 
 class MediaServer:
     server = None
@@ -109,6 +115,16 @@ class MediaServer:
         """
         if not self.server:
             return None
+        snapshot = self.__get_library_snapshot()
+        if snapshot:
+            exists_episodes = set()
+            series = snapshot.get("tvs").get((meta_info.title, int(season_number))) or {}
+            if meta_info.year:
+                exists_episodes = series.get(str(meta_info.year)) or set()
+            elif series:
+                exists_episodes = next(iter(series.values()))
+            total_episodes = [episode for episode in range(1, episode_count + 1)]
+            return list(set(total_episodes).difference(exists_episodes))
         return self.server.get_no_exists_episodes(meta_info,
                                                   season_number,
                                                   episode_count)
@@ -122,6 +138,12 @@ class MediaServer:
         """
         if not self.server:
             return None
+        snapshot = self.__get_library_snapshot()
+        if snapshot:
+            years = snapshot.get("movies").get(title) or set()
+            if year:
+                return [{'title': title, 'year': str(year)}] if str(year) in years else []
+            return [{'title': title, 'year': next(iter(years))}] if years else []
         return self.server.get_movies(title, year)
 
     def refresh_library_by_items(self, items):
@@ -132,3 +154,68 @@ class MediaServer:
         if not self.server:
             return
         return self.server.refresh_library_by_items(items)
+
+    def __get_library_snapshot(self):
+        """
+        获取媒体库快照，过期时分页全量拉取重建，避免每部影片、每一季都单独查询媒体服务器
+        :return: {"movies": {名称: {年份}}, "tvs": {(名称, 季号): {年份: {集号}}}, "series": {SeriesId: (名称, 年份)}}，
+                 媒体服务器不支持或查询失败时返回None
+        """
+        global LIBRARY_SNAPSHOT
+        if not hasattr(self.server, "get_library_items"):
+            return None
+        server_type = self.server.__class__.__name__
+        with lock:
+            if LIBRARY_SNAPSHOT.get("server") == server_type \
+                    and time.time() - LIBRARY_SNAPSHOT.get("time", 0) < MEDIA_SERVER_SNAPSHOT_EXPIRE:
+                return LIBRARY_SNAPSHOT.get("data")
+            library_items = self.server.get_library_items()
+            if library_items is None:
+                # 获取失败时在有效期内按原方式逐个查询
+                LIBRARY_SNAPSHOT = {"server": server_type, "time": time.time(), "data": None}
+                return None
+            snapshot = {"movies": {}, "tvs": {}, "series": library_items.get("series") or {}}
+            for name, year in library_items.get("movies") or []:
+                snapshot["movies"].setdefault(name, set()).add(year)
+            for series_id, season, episode in library_items.get("episodes") or []:
+                self.__add_snapshot_episode(snapshot, series_id, season, episode)
+            LIBRARY_SNAPSHOT = {"server": server_type, "time": time.time(), "data": snapshot}
+            log.info("【MEDIASERVER】媒体库快照已更新，电影：%s，电视剧：%s" % (
+                len(snapshot.get("movies")), len(snapshot.get("series"))))
+            return snapshot
+
+    @staticmethod
+    def __add_snapshot_episode(snapshot, series_id, season, episode):
+        series = snapshot.get("series").get(series_id)
+        if not series:
+            return False
+        name, year = series
+        snapshot["tvs"].setdefault((name, int(season)), {}).setdefault(year, set()).add(int(episode))
+        return True
+
+    def update_library_snapshot(self, action, item):
+        """
+        根据媒体服务器的媒体库事件增量更新快照，无法增量处理的事件使快照过期
+        :param action: 事件，new为新入库
+        :param item: 事件中的媒体信息
+        """
+        if not self.server:
+            return
+        server_type = self.server.__class__.__name__
+        with lock:
+            snapshot = LIBRARY_SNAPSHOT.get("data")
+            if not snapshot or LIBRARY_SNAPSHOT.get("server") != server_type:
+                return
+            updated = False
+            if action == "new" and item:
+                if item.get("Type") == "Movie" and item.get("Name"):
+                    snapshot["movies"].setdefault(item.get("Name"), set()).add(str(item.get("ProductionYear")))
+                    updated = True
+                elif item.get("Type") == "Episode" \
+                        and item.get("ParentIndexNumber") is not None and item.get("IndexNumber") is not None:
+                    updated = self.__add_snapshot_episode(snapshot,
+                                                          item.get("SeriesId"),
+                                                          item.get("ParentIndexNumber"),
+                                                          item.get("IndexNumber"))
+            if not updated:
+                LIBRARY_SNAPSHOT["time"] = 0
@@ -1,7 +1,7 @@
-import requests
 import log
-from config import Config
+from config import Config, MEDIA_SERVER_PAGE_SIZE
 from utils.functions import get_local_time
+from utils.http_utils import RequestUtils
 from utils.types import MediaType
 
 
@@ -37,7 +37,7 @@ class Emby:
             return []
         req_url = "%semby/Library/SelectableMediaFolders?api_key=%s" % (self.__host, self.__apikey)
         try:
-            res = requests.get(req_url, timeout=10)
+            res = RequestUtils().get_res(req_url)
             if res:
                 return res.json()
             else:
@@ -55,7 +55,7 @@ class Emby:
             return 0
         req_url = "%semby/Users/Query?api_key=%s" % (self.__host, self.__apikey)
         try:
-            res = requests.get(req_url, timeout=10)
+            res = RequestUtils().get_res(req_url)
             if res:
                 return res.json().get("TotalRecordCount")
             else:
@@ -74,7 +74,7 @@ class Emby:
         req_url = "%semby/System/ActivityLog/Entries?api_key=%s&Limit=%s" % (self.__host, self.__apikey, num)
         ret_array = []
         try:
-            res = requests.get(req_url, timeout=10)
+            res = RequestUtils().get_res(req_url)
             if res:
                 ret_json = res.json()
                 items = ret_json.get('Items')
@@ -108,7 +108,7 @@ class Emby:
             return {}
         req_url = "%semby/Items/Counts?api_key=%s" % (self.__host, self.__apikey)
         try:
-            res = requests.get(req_url, timeout=10)
+            res = RequestUtils().get_res(req_url)
             if res:
                 return res.json()
             else:
@@ -130,7 +130,7 @@ class Emby:
         req_url = "%semby/Items?IncludeItemTypes=Series&Fields=ProductionYear&StartIndex=0&Recursive=true&SearchTerm=%s&Limit=10&IncludeSearchTypes=false&api_key=%s" % (
             self.__host, name, self.__apikey)
         try:
-            res = requests.get(req_url, timeout=10)
+            res = RequestUtils().get_res(req_url)
             if res:
                 res_items = res.json().get("Items")
                 if res_items:
@@ -155,7 +155,7 @@ class Emby:
         req_url = "%semby/Items?IncludeItemTypes=Movie&Fields=ProductionYear&StartIndex=0&Recursive=true&SearchTerm=%s&Limit=10&IncludeSearchTypes=false&api_key=%s" % (
             self.__host, title, self.__apikey)
         try:
-            res = requests.get(req_url, timeout=20)
+            res = RequestUtils(timeout=20).get_res(req_url)
             if res:
                 res_items = res.json().get("Items")
                 if res_items:
@@ -192,7 +192,7 @@ class Emby:
         req_url = "%semby/Shows/%s/Episodes?Season=%s&IsMissing=false&api_key=%s" % (
             self.__host, item_id, season, self.__apikey)
         try:
-            res_json = requests.get(req_url, timeout=20)
+            res_json = RequestUtils(timeout=20).get_res(req_url)
             if res_json:
                 res_items = res_json.json().get("Items")
                 exists_episodes = []
@@ -220,6 +220,53 @@ class Emby:
         total_episodes = [episode for episode in range(1, total_num + 1)]
         return list(set(total_episodes).difference(set(exists_episodes)))
 
+    def get_library_items(self):
+        """
+        分页查询Emby中的全部电影、电视剧和集，用于建立媒体库快照
+        :return: {"movies": [(名称, 年份)], "series": {SeriesId: (名称, 年份)}, "episodes": [(SeriesId, 季号, 集号)]}，出错时返回None
+        """
+        if not self.__host or not self.__apikey:
+            return None
+        movies = self.__get_library_items_by_type("Movie")
+        series = self.__get_library_items_by_type("Series")
+        episodes = self.__get_library_items_by_type("Episode")
+        if movies is None or series is None or episodes is None:
+            return None
+        return {
+            "movies": [(item.get("Name"), str(item.get("ProductionYear"))) for item in movies],
+            "series": {item.get("Id"): (item.get("Name"), str(item.get("ProductionYear"))) for item in series},
+            "episodes": [(item.get("SeriesId"), item.get("ParentIndexNumber"), item.get("IndexNumber"))
+                         for item in episodes
+                         if item.get("ParentIndexNumber") is not None and item.get("IndexNumber") is not None]
+        }
+
+    def __get_library_items_by_type(self, item_type):
+        """
+        分页查询Emby中某一类型的全部媒体
+        :param item_type: Movie、Series、Episode
+        :return: 媒体列表，出错时返回None
+        """
+        ret_items = []
+        start_index = 0
+        while True:
+            req_url = "%semby/Items?IncludeItemTypes=%s&Fields=ProductionYear,IndexNumber,ParentIndexNumber&Recursive=true&IsMissing=false&StartIndex=%s&Limit=%s&api_key=%s" % (
+                self.__host, item_type, start_index, MEDIA_SERVER_PAGE_SIZE, self.__apikey)
+            try:
+                res = RequestUtils(timeout=60).get_res(req_url)
+                if not res:
+                    log.error("【EMBY】Items 未获取到返回数据")
+                    return None
+                res_json = res.json()
+            except Exception as e:
+                log.error("【EMBY】连接Items出错：" + str(e))
+                return None
+            res_items = res_json.get("Items") or []
+            ret_items.extend(res_items)
+            start_index += len(res_items)
+            if not res_items or start_index >= (res_json.get("TotalRecordCount") or 0):
+                break
+        return ret_items
+
     def get_image_by_id(self, item_id, image_type):
         """
         根据ItemId从Emby查询图片地址
@@ -231,7 +278,7 @@ class Emby:
             return None
         req_url = "%semby/Items/%s/RemoteImages?api_key=%s" % (self.__host, item_id, self.__apikey)
         try:
-            res = requests.get(req_url, timeout=10)
+            res = RequestUtils().get_res(req_url)
             if res:
                 images = res.json().get("Images")
                 for image in images:
@@ -253,7 +300,7 @@ class Emby:
             return False
         req_url = "%semby/Items/%s/Refresh?Recursive=true&api_key=%s" % (self.__host, item_id, self.__apikey)
         try:
-            res = requests.post(req_url, timeout=10)
+            res = RequestUtils().post_res(req_url)
             if res:
                 return True
         except Exception as e:
@@ -269,7 +316,7 @@ class Emby:
             return False
         req_url = "%semby/Library/Refresh?api_key=%s" % (self.__host, self.__apikey)
         try:
-            res = requests.post(req_url, timeout=10)
+            res = RequestUtils().post_res(req_url)
             if res:
                 return True
         except Exception as e:
@@ -1,8 +1,8 @@
 import re
-import requests
 import log
-from config import Config
+from config import Config, MEDIA_SERVER_PAGE_SIZE
 from utils.functions import singleton, get_local_time
+from utils.http_utils import RequestUtils
 from utils.types import MediaType
 
 
@@ -41,7 +41,7 @@ class Jellyfin:
             return []
         req_url = "%sLibrary/MediaFolders?api_key=%s" % (self.__host, self.__apikey)
         try:
-            res = requests.get(req_url, timeout=10)
+            res = RequestUtils().get_res(req_url)
             if res:
                 return res.json().get("Items")
             else:
@@ -59,7 +59,7 @@ class Jellyfin:
             return 0
         req_url = "%sUsers?api_key=%s" % (self.__host, self.__apikey)
         try:
-            res = requests.get(req_url, timeout=10)
+            res = RequestUtils().get_res(req_url)
             if res:
                 return len(res.json())
             else:
@@ -77,7 +77,7 @@ class Jellyfin:
             return
         req_url = "%sUsers?api_key=%s" % (self.__host, self.__apikey)
         try:
-            res = requests.get(req_url, timeout=10)
+            res = RequestUtils().get_res(req_url)
             if res:
                 users = res.json()
                 for user in users:
@@ -98,7 +98,7 @@ class Jellyfin:
         req_url = "%sSystem/ActivityLog/Entries?api_key=%s&Limit=%s" % (self.__host, self.__apikey, num)
         ret_array = []
         try:
-            res = requests.get(req_url, timeout=10)
+            res = RequestUtils().get_res(req_url)
             if res:
                 ret_json = res.json()
                 items = ret_json.get('Items')
@@ -131,7 +131,7 @@ class Jellyfin:
             return None
         req_url = "%sItems/Counts?api_key=%s" % (self.__host, self.__apikey)
         try:
-            res = requests.get(req_url, timeout=10)
+            res = RequestUtils().get_res(req_url)
             if res:
                 return res.json()
             else:
@@ -150,7 +150,7 @@ class Jellyfin:
         req_url = "%sUsers/%s/Items?api_key=%s&searchTerm=%s&IncludeItemTypes=Series&Limit=10&Recursive=true" % (
             self.__host, self.__user, self.__apikey, name)
         try:
-            res = requests.get(req_url, timeout=10)
+            res = RequestUtils().get_res(req_url)
             if res:
                 res_items = res.json().get("Items")
                 if res_items:
@@ -179,7 +179,7 @@ class Jellyfin:
         req_url = "%sShows/%s/Seasons?api_key=%s&userId=%s" % (
             self.__host, series_id, self.__apikey, self.__user)
         try:
-            res = requests.get(req_url, timeout=10)
+            res = RequestUtils().get_res(req_url)
             if res:
                 res_items = res.json().get("Items")
                 if res_items:
@@ -203,7 +203,7 @@ class Jellyfin:
         req_url = "%sUsers/%s/Items?api_key=%s&searchTerm=%s&IncludeItemTypes=Movie&Limit=10&Recursive=true" % (
             self.__host, self.__user, self.__apikey, title)
         try:
-            res = requests.get(req_url, timeout=20)
+            res = RequestUtils(timeout=20).get_res(req_url)
             if res:
                 res_items = res.json().get("Items")
                 if res_items:
@@ -237,7 +237,7 @@ class Jellyfin:
         req_url = "%sShows/%s/Episodes?seasonId=%s&&userId=%s&isMissing=false&api_key=%s" % (
             self.__host, series_id, season_id, self.__user, self.__apikey)
         try:
-            res_json = requests.get(req_url, timeout=20)
+            res_json = RequestUtils(timeout=20).get_res(req_url)
             if res_json:
                 res_items = res_json.json().get("Items")
                 exists_episodes = []
@@ -265,6 +265,53 @@ class Jellyfin:
         total_episodes = [episode for episode in range(1, total_num + 1)]
         return list(set(total_episodes).difference(set(exists_episodes)))
 
+    def get_library_items(self):
+        """
+        分页查询Jellyfin中的全部电影、电视剧和集，用于建立媒体库快照
+        :return: {"movies": [(名称, 年份)], "series": {SeriesId: (名称, 年份)}, "episodes": [(SeriesId, 季号, 集号)]}，出错时返回None
+        """
+        if not self.__host or not self.__apikey or not self.__user:
+            return None
+        movies = self.__get_library_items_by_type("Movie")
+        series = self.__get_library_items_by_type("Series")
+        episodes = self.__get_library_items_by_type("Episode")
+        if movies is None or series is None or episodes is None:
+            return None
+        return {
+            "movies": [(item.get("Name"), str(item.get("ProductionYear"))) for item in movies],
+            "series": {item.get("Id"): (item.get("Name"), str(item.get("ProductionYear"))) for item in series},
+            "episodes": [(item.get("SeriesId"), item.get("ParentIndexNumber"), item.get("IndexNumber"))
+                         for item in episodes
+                         if item.get("ParentIndexNumber") is not None and item.get("IndexNumber") is not None]
+        }
+
+    def __get_library_items_by_type(self, item_type):
+        """
+        分页查询Jellyfin中某一类型的全部媒体
+        :param item_type: Movie、Series、Episode
+        :return: 媒体列表，出错时返回None
+        """
+        ret_items = []
+        start_index = 0
+        while True:
+            req_url = "%sUsers/%s/Items?IncludeItemTypes=%s&Fields=ProductionYear,IndexNumber,ParentIndexNumber&Recursive=true&IsMissing=false&StartIndex=%s&Limit=%s&api_key=%s" % (
+                self.__host, self.__user, item_type, start_index, MEDIA_SERVER_PAGE_SIZE, self.__apikey)
+            try:
+                res = RequestUtils(timeout=60).get_res(req_url)
+                if not res:
+                    log.error("【JELLYFIN】Items 未获取到返回数据")
+                    return None
+                res_json = res.json()
+            except Exception as e:
+                log.error("【JELLYFIN】连接Items出错：" + str(e))
+                return None
+            res_items = res_json.get("Items") or []
+            ret_items.extend(res_items)
+            start_index += len(res_items)
+            if not res_items or start_index >= (res_json.get("TotalRecordCount") or 0):
+                break
+        return ret_items
+
     def get_image_by_id(self, item_id, image_type):
         """
         根据ItemId从Jellyfin查询图片地址
@@ -276,7 +323,7 @@ class Jellyfin:
             return None
         req_url = "%sItems/%s/RemoteImages?api_key=%s" % (self.__host, item_id, self.__apikey)
         try:
-            res = requests.get(req_url, timeout=10)
+            res = RequestUtils().get_res(req_url)
             if res:
                 images = res.json().get("Images")
                 for image in images:
@@ -298,7 +345,7 @@ class Jellyfin:
             return False
         req_url = "%sLibrary/Refresh?api_key=%s" % (self.__host, self.__apikey)
         try:
-            res = requests.post(req_url, timeout=10)
+            res = RequestUtils().post_res(req_url)
             if res:
                 return True
         except Exception as e:
@@ -119,6 +119,33 @@ class Plex:
         total_episodes = [episode for episode in range(1, total_num + 1)]
         return list(set(total_episodes).difference(set(exists_episodes)))
 
+    def get_library_items(self):
+        """
+        查询Plex中的全部电影、电视剧和集，用于建立媒体库快照
+        :return: {"movies": [(名称, 年份)], "series": {ratingKey: (名称, 年份)}, "episodes": [(ratingKey, 季号, 集号)]}，出错时返回None
+        """
+        if not self.__plex:
+            return None
+        movies = []
+        series = {}
+        episodes = []
+        try:
+            for section in self.__plex.library.sections():
+                if section.type == "movie":
+                    for movie in section.all():
+                        movies.append((movie.title, str(movie.year)))
+                elif section.type == "show":
+                    for show in section.all():
+                        series[str(show.ratingKey)] = (show.title, str(show.year))
+                    for episode in section.searchEpisodes():
+                        if episode.seasonNumber is None or episode.index is None:
+                            continue
+                        episodes.append((str(episode.grandparentRatingKey), episode.seasonNumber, episode.index))
+        except Exception as e:
+            log.error("【PLEX】获取媒体库数据出错：%s" % str(e))
+            return None
+        return {"movies": movies, "series": series, "episodes": episodes}
+
     @staticmethod
     def get_image_by_id(item_id, image_type):
         """
@@ -1,17 +1,21 @@
-import requests
-from xml.dom.minidom import parse
-import xml.dom.minidom
+import hashlib
+import time
+from concurrent.futures.thread import ThreadPoolExecutor
+from xml.etree import ElementTree
+
 import log
-from config import Config
+from config import Config, RSS_FETCH_THREADS, DEFAULT_HEADERS
 from pt.searcher import Searcher
 from pt.torrent import Torrent
 from utils.functions import is_chinese
+from utils.http_utils import RequestUtils
 from message.send import Message
 from pt.downloader import Downloader
 from rmt.media import Media
-from utils.sqls import get_rss_movies, get_rss_tvs, insert_rss_torrents, \
-    get_config_site, is_torrent_rssd, get_config_rss_rule, delete_rss_movie, delete_rss_tv, update_rss_tv_lack, \
-    update_rss_movie_state, update_rss_tv_state
+from utils.sqls import get_rss_movies, get_rss_tvs, insert_rss_torrents, get_rss_match_index, \
+    get_config_site, get_rss_torrent_key, get_rssd_torrent_keys, is_torrent_rssd_by_url, get_config_rss_rule, \
+    delete_rss_movie, delete_rss_tv, update_rss_tv_lack, update_rss_movie_state, update_rss_tv_state, \
+    get_rss_cursor, update_rss_cursor
 from utils.types import MediaType, SearchType
 
 
@@ -52,25 +56,23 @@ class Rss:
         log.info("【RSS】开始RSS订阅...")
 
         # 读取关键字配置
-        movie_keys = get_rss_movies(state='R')
-        if not movie_keys:
+        movie_index, tv_index = get_rss_match_index(state='R')
+        if not movie_index:
             log.warn("【RSS】未订阅电影")
         else:
-            log.info("【RSS】电影订阅清单：%s" % " ".join('%s' % key[0] for key in movie_keys))
+            log.info("【RSS】电影订阅清单：%s" % " ".join('%s' % key[0] for key in movie_index))
 
-        tv_keys = get_rss_tvs(state='R')
-        if not tv_keys:
+        if not tv_index:
             log.warn("【RSS】未订阅电视剧")
         else:
-            log.info("【RSS】电视剧订阅清单：%s" % " ".join('%s' % key[0] for key in tv_keys))
+            log.info("【RSS】电视剧订阅清单：%s" % " ".join('%s' % key[0] for key in tv_index))
 
-        if not movie_keys and not tv_keys:
+        if not movie_index and not tv_index:
             return
 
         # 代码站点配置优先级的序号
         order_seq = 100
-        rss_download_torrents = []
-        rss_no_exists = {}
+        rss_jobs = []
         for site_info in self.__sites:
             if not site_info:
                 continue
@@ -87,18 +89,35 @@ class Rss:
                 res_type = {"include": include, "exclude": exclude, "size":  site_info[8], "note": self.__rss_rule}
             else:
                 res_type = None
+            rss_jobs.append((order_seq, rss_job, rssurl, res_type))
+        if not rss_jobs:
+            return
 
-            # 开始下载RSS
-            log.info("【RSS】正在处理：%s" % rss_job)
-            rss_result = self.parse_rssxml(rssurl)
+        # 并发下载所有站点的RSS，按站点优先级顺序处理
+        executor = ThreadPoolExecutor(max_workers=min(RSS_FETCH_THREADS, len(rss_jobs)))
+        fetch_tasks = [executor.submit(self.__fetch_rss, rss_job, rssurl, get_rss_cursor(rssurl))
+                       for _, rss_job, rssurl, _ in rss_jobs]
+        executor.shutdown(wait=False)
+        rss_download_torrents = []
+        rss_no_exists = {}
+        # 本轮新处理的种子，结束后批量写入数据库
+        rss_torrents = []
+        rssd_keys = set()
+        for (order_seq, rss_job, rssurl, res_type), fetch_task in zip(rss_jobs, fetch_tasks):
+            rss_result, rss_cursor = fetch_task.result()
             if len(rss_result) == 0:
-                log.warn("【RSS】%s 未下载到数据" % rss_job)
+                if rss_cursor:
+                    update_rss_cursor(rssurl, rss_cursor)
                 continue
-            else:
-                log.info("【RSS】%s 获取数据：%s" % (rss_job, len(rss_result)))
-
+            process_start = time.time()
+            # 已经处理过的种子链接不再识别
+            rss_result = [res for res in rss_result if not is_torrent_rssd_by_url(res.get('enclosure'))]
+            # 批量识别种子名称，相同的媒体只查询一次TMDB
+            media_infos = self.media.get_media_infos([(res.get('title'), res.get('description')) for res in rss_result])
+            # 批量查询是否已经处理过
+            rssd_keys.update(get_rssd_torrent_keys([media_info for media_info in media_infos if media_info]))
             res_num = 0
-            for res in rss_result:
+            for res, media_info in zip(rss_result, media_infos):
                 try:
                     # 种子名
                     torrent_name = res.get('title')
@@ -110,18 +129,17 @@ class Rss:
                     size = res.get('size')
 
                     log.info("【RSS】开始处理：%s" % torrent_name)
-                    # 识别种子名称，开始检索TMDB
-                    media_info = self.media.get_media_info(title=torrent_name, subtitle=description)
                     if not media_info or not media_info.tmdb_info:
                         log.info("【RSS】%s 未查询到媒体信息" % torrent_name)
                         continue
                     # 检查这个名字是不是下过了
-                    if is_torrent_rssd(media_info):
+                    rss_torrent_key = get_rss_torrent_key(media_info)
+                    if rss_torrent_key in rssd_keys:
                         log.info("【RSS】%s%s 已成功订阅过，跳过..." % (
                             media_info.get_title_string(), media_info.get_season_episode_string()))
                         continue
                     # 检查种子名称或者标题是否匹配
-                    match_flag = Torrent.is_torrent_match_rss(media_info, movie_keys, tv_keys)
+                    match_flag = Torrent.is_torrent_match_rss(media_info, movie_index, tv_index)
                     if match_flag:
                         log.info("【RSS】%s: %s %s %s 匹配成功" % (media_info.type.value,
                                                              media_info.get_title_string(),
@@ -168,8 +186,9 @@ class Rss:
                                                 res_order=res_order,
                                                 size=size,
                                                 description=description)
-                    # 插入数据库
-                    insert_rss_torrents(media_info)
+                    # 记录已处理，本轮结束后批量插入数据库
+                    rss_torrents.append(media_info)
+                    rssd_keys.add(rss_torrent_key)
                     # 加入下载列表
                     if media_info not in rss_download_torrents:
                         rss_download_torrents.append(media_info)
@@ -177,7 +196,16 @@ class Rss:
                 except Exception as e:
                     log.error("【RSS】错误：%s" % str(e))
                     continue
-            log.info("【RSS】%s 处理结束，匹配到 %s 个有效资源" % (rss_job, res_num))
+            # 记录处理进度，下次只处理新增的种子
+            update_rss_cursor(rssurl, rss_cursor)
+            log.info("【RSS】%s 处理结束，匹配到 %s 个有效资源，处理耗时 %.1f 秒" % (rss_job, res_num, time.time() - process_start))
+            # 输出过滤规则的累计命中次数，便于发现从不生效的规则
+            if res_type:
+                rule_stats = Torrent.get_resource_rules(res_type).get_stats()
+                if rule_stats:
+                    log.info("【RSS】%s 过滤规则累计命中次数：%s" % (rss_job, "，".join(
+                        "%s %s：%s" % (stat.get("type"), stat.get("rule"), stat.get("count")) for stat in rule_stats)))
+        insert_rss_torrents(rss_torrents)
         log.info("【RSS】所有RSS处理结束，共 %s 个有效资源" % len(rss_download_torrents))
         # 去重择优后开始添加下载
         download_items, left_medias = self.downloader.check_and_add_pt(SearchType.RSS, rss_download_torrents, rss_no_exists)
@@ -286,66 +314,101 @@ class Rss:
                             update_rss_tv_lack(name, year, season, len(no_exist_item.get("episodes")))
                         break
 
+    def __fetch_rss(self, rss_job, rssurl, rss_cursor):
+        """
+        下载并解析一个站点的RSS，在线程池中执行
+        :return: 新增的种子信息列表、新的游标
+        """
+        log.info("【RSS】正在下载：%s" % rss_job)
+        fetch_start = time.time()
+        try:
+            rss_result, rss_cursor = self.parse_rssxml(rssurl, rss_cursor)
+        except Exception as e:
+            log.error("【RSS】%s 下载出错：%s" % (rss_job, str(e)))
+            return [], None
+        fetch_cost = time.time() - fetch_start
+        if rss_result:
+            log.info("【RSS】%s 新增数据：%s，下载耗时 %.1f 秒" % (rss_job, len(rss_result), fetch_cost))
+        elif rss_cursor:
+            log.info("【RSS】%s 没有新增数据，下载耗时 %.1f 秒" % (rss_job, fetch_cost))
+        else:
+            log.warn("【RSS】%s 未下载到数据，下载耗时 %.1f 秒" % (rss_job, fetch_cost))
+        return rss_result, rss_cursor
+
     @staticmethod
-    def parse_rssxml(url):
+    def parse_rssxml(url, rss_cursor=None):
         """
-        解析RSS订阅URL，获取RSS中的种子信息
+        解析RSS订阅URL，获取RSS中的种子信息，只返回上次处理后新增的种子
         :param url: RSS地址
-        :return: 种子信息列表
+        :param rss_cursor: 上次处理的游标，包括ETag、Last-Modified及上次处理过的种子链接摘要
+        :return: 新增的种子信息列表、新的游标，下载或解析失败时游标为None
         """
         ret_array = []
         if not url:
-            return []
+            return [], None
+        headers = DEFAULT_HEADERS.copy()
+        seen_items = set()
+        if rss_cursor:
+            if rss_cursor.get("etag"):
+                headers["If-None-Match"] = rss_cursor.get("etag")
+            if rss_cursor.get("last_modified"):
+                headers["If-Modified-Since"] = rss_cursor.get("last_modified")
+            seen_items = rss_cursor.get("items") or set()
+        ret = RequestUtils(headers=headers, timeout=30).get_res(url, stream=True)
+        if ret is None:
+            return [], None
+        # 没有更新
+        if ret.status_code == 304:
+            ret.close()
+            return [], rss_cursor
+        if not ret:
+            ret.close()
+            return [], None
+        items = set()
         try:
-            ret = requests.get(url, timeout=30)
+            # 流式解析XML，处理完一个item就释放
+            ret.raw.decode_content = True
+            for _, item in ElementTree.iterparse(ret.raw):
+                if item.tag != "item":
+                    continue
+                try:
+                    # 标题
+                    title = item.findtext("title")
+                    if not title:
+                        continue
+                    # 种子链接
+                    enclosure = ""
+                    # 大小
+                    size = 0
+                    enclosure_node = item.find("enclosure")
+                    if enclosure_node is not None:
+                        enclosure = enclosure_node.get("url")
+                        size = enclosure_node.get("length")
+                    if not enclosure:
+                        continue
+                    # 上次已经处理过的不再处理
+                    item_hash = hashlib.md5(enclosure.encode("utf-8")).hexdigest()
+                    items.add(item_hash)
+                    if item_hash in seen_items:
+                        continue
+                    if size and size.isdigit():
+                        size = int(size)
+                    else:
+                        size = 0
+                    # 描述
+                    description = item.findtext("description") or ""
+                    tmp_dict = {'title': title, 'enclosure': enclosure, 'size': size, 'description': description}
+                    ret_array.append(tmp_dict)
+                except Exception as e1:
+                    log.console(str(e1))
+                    continue
+                finally:
+                    item.clear()
         except Exception as e2:
             log.console(str(e2))
-            return []
-        if ret:
-            ret_xml = ret.text
-            try:
-                # 解析XML
-                dom_tree = xml.dom.minidom.parseString(ret_xml)
-                rootNode = dom_tree.documentElement
-                items = rootNode.getElementsByTagName("item")
-                for item in items:
-                    try:
-                        # 标题
-                        title = ""
-                        tagNames = item.getElementsByTagName("title")
-                        if tagNames:
-                            firstChild = tagNames[0].firstChild
-                            if firstChild:
-                                title = firstChild.data
-                        if not title:
-                            continue
-                        # 种子链接
-                        enclosure = ""
-                        # 大小
-                        size = 0
-                        tagNames = item.getElementsByTagName("enclosure")
-                        if tagNames:
-                            enclosure = tagNames[0].getAttribute("url")
-                            size = tagNames[0].getAttribute("length")
-                        if not enclosure:
-                            continue
-                        if size and size.isdigit():
-                            size = int(size)
-                        else:
-                            size = 0
-                        # 描述
-                        description = ""
-                        tagNames = item.getElementsByTagName("description")
-                        if tagNames:
-                            firstChild = tagNames[0].firstChild
-                            if firstChild:
-                                description = firstChild.data
-                        tmp_dict = {'title': title, 'enclosure': enclosure, 'size': size, 'description': description}
-                        ret_array.append(tmp_dict)
-                    except Exception as e1:
-                        log.console(str(e1))
-                        continue
-            except Exception as e2:
-                log.console(str(e2))
-                return ret_array
-        return ret_array
+            return ret_array, None
+        finally:
+            ret.close()
+        return ret_array, {"etag": ret.headers.get("ETag"),
+                           "last_modified": ret.headers.get("Last-Modified"),
+                           "items": items}
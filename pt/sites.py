@@ -1,15 +1,18 @@
 import re
+from concurrent.futures.thread import ThreadPoolExecutor
 from datetime import datetime
-
-import requests
+from threading import Lock
 
 import log
-from config import Config
+from config import Config, PT_SITE_THREADS
 from utils.functions import singleton, num_filesize
 from utils.http_utils import RequestUtils
 from utils.sqls import get_config_site
 
 
+lock = Lock()
+
+
 @singleton
 class Sites:
     __sites_data = {}
@@ -19,7 +22,6 @@ class Sites:
 
     def __init__(self):
         self.init_config()
-        self.refresh_pt_data()
 
     def init_config(self):
         config = Config()
@@ -29,51 +31,79 @@ class Sites:
             self.__pt_sites = get_config_site()
             self.__user_agent = app.get('user_agent')
 
+    def run_schedule(self):
+        """
+        定时刷新PT站流量数据，页面只读取刷新后的缓存
+        """
+        try:
+            self.init_config()
+            self.refresh_pt_data(force=True)
+        except Exception as err:
+            log.error("【RUN】执行任务refresh_pt_data出错：%s" % str(err))
+
     def refresh_pt_data(self, force=False):
         """
-        刷新PT站下载上传量
+        刷新PT站下载上传量，各站点并发获取
         """
         if not self.__pt_sites:
             return
         if not force and self.__last_update_time and (datetime.now() - self.__last_update_time).days < 0.5:
             return
-        self.__sites_data = {}
-        for site_info in self.__pt_sites:
-            if not site_info:
-                continue
-            site_name = site_info[1]
-            site_url = site_info[4]
-            site_cookie = site_info[5]
-            try:
-                res = RequestUtils(headers=self.__user_agent, cookies=site_cookie).get_res(url=site_url)
-                if res and res.status_code == 200:
-                    html_text = res.text
-                    if not html_text:
-                        continue
-                    upload_match = re.search(r"上[传傳]量[:：<>/a-z=\"\s#;]+([0-9,.\s]+[KMGTP]B)", html_text, flags=re.IGNORECASE)
-                    download_match = re.search(r"下[载載]量[:：<>/a-z=\"\s#;]+([0-9,.\s]+[KMGTP]B)", html_text, flags=re.IGNORECASE)
-                    if not upload_match or not download_match:
-                        continue
-                    # 上传量
-                    upload_text = upload_match.group(1)
-                    upload = num_filesize(upload_text.strip())
-                    # 下载量
-                    download_text = download_match.group(1)
-                    download = num_filesize(download_text.strip())
-                    if not self.__sites_data.get(site_name):
-                        self.__sites_data[site_name] = {"upload": upload, "download": download}
-                elif not res:
-                    log.error("【PT】站点 %s 连接失败：%s" % (site_name, site_url))
-                else:
-                    log.error("【PT】站点 %s 获取流量信息失败，状态码：%s" % (site_name, res.status_code))
-            except Exception as e:
-                log.error("【PT】站点 %s 获取流量信息失败：%s" % (site_name, str(e)))
-        # 更新时间
-        if self.__sites_data:
-            self.__last_update_time = datetime.now()
+        site_infos = [site_info for site_info in self.__pt_sites if site_info]
+        if not site_infos:
+            return
+        if not lock.acquire(blocking=False):
+            # 已经在刷新中
+            return
+        try:
+            sites_data = {}
+            with ThreadPoolExecutor(max_workers=min(PT_SITE_THREADS, len(site_infos))) as executor:
+                for site_name, site_data in executor.map(self.__get_site_data, site_infos):
+                    if site_data and not sites_data.get(site_name):
+                        sites_data[site_name] = site_data
+            # 整体替换，刷新过程中页面读取的仍是上一次的数据
+            self.__sites_data = sites_data
+            # 更新时间
+            if sites_data:
+                self.__last_update_time = datetime.now()
+        finally:
+            lock.release()
+
+    def __get_site_data(self, site_info):
+        """
+        获取一个PT站的上传下载量
+        :return: 站点名称，{"upload": 上传量, "download": 下载量}，获取失败时为None
+        """
+        site_name = site_info[1]
+        site_url = site_info[4]
+        site_cookie = site_info[5]
+        try:
+            res = RequestUtils(headers=self.__user_agent, cookies=site_cookie, verify=False).get_res(url=site_url)
+            if res and res.status_code == 200:
+                html_text = res.text
+                if not html_text:
+                    return site_name, None
+                upload_match = re.search(r"上[传傳]量[:：<>/a-z=\"\s#;]+([0-9,.\s]+[KMGTP]B)", html_text, flags=re.IGNORECASE)
+                download_match = re.search(r"下[载載]量[:：<>/a-z=\"\s#;]+([0-9,.\s]+[KMGTP]B)", html_text, flags=re.IGNORECASE)
+                if not upload_match or not download_match:
+                    return site_name, None
+                # 上传量
+                upload_text = upload_match.group(1)
+                upload = num_filesize(upload_text.strip())
+                # 下载量
+                download_text = download_match.group(1)
+                download = num_filesize(download_text.strip())
+                return site_name, {"upload": upload, "download": download}
+            elif not res:
+                log.error("【PT】站点 %s 连接失败：%s" % (site_name, site_url))
+            else:
+                log.error("【PT】站点 %s 获取流量信息失败，状态码：%s" % (site_name, res.status_code))
+        except Exception as e:
+            log.error("【PT】站点 %s 获取流量信息失败：%s" % (site_name, str(e)))
+        return site_name, None
 
     def get_pt_date(self):
         """
-        获取PT站上传下载量
+        获取PT站上传下载量，只读取后台刷新的缓存
         """
         return self.__sites_data
@@ -1,10 +1,10 @@
 import os.path
 
-import requests
 from pythonopensubtitles.opensubtitles import OpenSubtitles
 
 import log
 from config import Config
+from utils.http_utils import RequestUtils
 from utils.types import MediaType
 
 
@@ -146,7 +146,7 @@ class Subtitle:
                     "is_bluray": item.get("bluray")
                 }
                 try:
-                    res = requests.post(req_url, headers={"Authorization": "Bearer %s" % self.__api_key}, json=params, timeout=10)
+                    res = RequestUtils(headers={"Authorization": "Bearer %s" % self.__api_key}).post_res(req_url, json=params)
                     if not res or res.status_code != 200:
                         log.error("【SUBTITLE】调用ChineseSubFinder API失败！")
                     else:
@@ -1,6 +1,10 @@
 import re
+from functools import lru_cache
+from threading import Lock
+
 import cn2an
 
+import log
 from utils.functions import str_filesize
 from utils.types import MediaType
 
@@ -8,36 +12,20 @@ from utils.types import MediaType
 class Torrent:
 
     @staticmethod
-    def is_torrent_match_rss(media_info, movie_keys, tv_keys):
+    def is_torrent_match_rss(media_info, movie_index, tv_index):
         """
         判断种子是否命中订阅
         :param media_info: 已识别的种子媒体信息
-        :param movie_keys: 电影订阅清单
-        :param tv_keys: 电视剧订阅清单
+        :param movie_index: 电影订阅索引{(名称, 年份)}
+        :param tv_index: 电视剧订阅索引{(名称, 年份, 季)}
         :return: 命中状态
         """
         if media_info.type == MediaType.MOVIE:
-            for key_info in movie_keys:
-                if not key_info:
-                    continue
-                name = key_info[0]
-                year = key_info[1]
-                # 匹配标题和年份
-                if name == media_info.title and str(year) == str(media_info.year):
-                    return True
+            # 匹配标题和年份
+            return (media_info.title, str(media_info.year)) in movie_index
         else:
-            # 匹配种子标题
-            for key_info in tv_keys:
-                if not key_info:
-                    continue
-                name = key_info[0]
-                year = key_info[1]
-                season = key_info[2]
-                # 匹配标题和年份和季
-                if name == media_info.title and str(year) == str(
-                        media_info.year) and season == media_info.get_season_string():
-                    return True
-        return False
+            # 匹配标题和年份和季
+            return (media_info.title, str(media_info.year), media_info.get_season_string()) in tv_index
 
     @staticmethod
     def is_torrent_match_size(media_info, types, t_size):
@@ -119,50 +107,32 @@ class Torrent:
             return True, 0
         if not title:
             return False, 0
-        # 必须包括的项
-        includes = types.get('include')
-        if includes:
-            if isinstance(includes, str):
-                includes = [includes]
-            include_flag = True
-            for include in includes:
-                if not include:
-                    continue
-                re_res = re.search(r'%s' % include.strip(), title, re.IGNORECASE)
-                if not re_res:
-                    include_flag = False
-            if not include_flag:
-                return False, 0
+        return Torrent.get_resource_rules(types).check(title, subtitle)
 
-        # 不能包含的项
-        excludes = types.get('exclude')
-        if excludes:
-            if isinstance(excludes, str):
-                excludes = [excludes]
-            exclude_flag = False
-            exclude_count = 0
-            for exclude in excludes:
-                if not exclude:
-                    continue
-                exclude_count += 1
-                re_res = re.search(r'%s' % exclude.strip(), title, re.IGNORECASE)
-                if not re_res:
-                    exclude_flag = True
-            if exclude_count != 0 and not exclude_flag:
-                return False, 0
-
-        # 优先包含的项
-        notes = types.get('note')
-        res_order = 0
-        if notes:
-            res_seq = 100
-            for note in notes:
-                res_seq = res_seq - 1
-                if re.search(r"%s" % note, "%s%s" % (title, subtitle), re.IGNORECASE):
-                    res_order = res_seq
-                    break
+    @staticmethod
+    def get_resource_rules(types):
+        """
+        获取预编译的过滤规则，规则内容不变时重复使用
+        :param types: 配置文件中的配置规则
+        :return: ResourceRules
+        """
+        includes = types.get('include') or []
+        if isinstance(includes, str):
+            includes = [includes]
+        excludes = types.get('exclude') or []
+        if isinstance(excludes, str):
+            excludes = [excludes]
+        notes = types.get('note') or []
+        if isinstance(notes, str):
+            notes = [notes]
+        return _compile_resource_rules(tuple(includes), tuple(excludes), tuple(notes))
 
-        return True, res_order
+    @staticmethod
+    def clear_resource_rules():
+        """
+        过滤规则配置变化时清除已编译的规则
+        """
+        _compile_resource_rules.cache_clear()
 
     @staticmethod
     def get_keyword_from_string(content):
@@ -279,3 +249,76 @@ class Torrent:
                 can_download_list.append(media_name)
                 can_download_list_item.append(t_item)
         return can_download_list_item
+
+
+class ResourceRules:
+    """
+    预编译的资源过滤规则，同时记录每条规则的命中次数
+    """
+    __includes = []
+    __excludes = []
+    __notes = []
+    __stats = {}
+
+    def __init__(self, includes, excludes, notes):
+        self.__lock = Lock()
+        self.__stats = {}
+        # 必须包括的项，全部匹配才通过
+        self.__includes = [self.__compile_rule('include', include.strip()) for include in includes if include]
+        # 不能包含的项，全部匹配时不通过
+        self.__excludes = [self.__compile_rule('exclude', exclude.strip()) for exclude in excludes if exclude]
+        # 优先包含的项，越靠前优先级越高
+        self.__notes = [self.__compile_rule('note', note) for note in notes if note is not None]
+
+    def __compile_rule(self, rule_type, rule):
+        self.__stats[(rule_type, rule)] = 0
+        try:
+            return rule, re.compile(rule, re.IGNORECASE)
+        except re.error as e:
+            log.warn("【RULE】过滤规则 %s 格式错误，按普通字符串匹配：%s" % (rule, str(e)))
+            return rule, re.compile(re.escape(rule), re.IGNORECASE)
+
+    def __hit(self, rule_type, rule):
+        with self.__lock:
+            self.__stats[(rule_type, rule)] += 1
+
+    def check(self, title, subtitle):
+        """
+        检查种子是否匹配规则
+        :return: 是否匹配，匹配的优先值，值越大越优先
+        """
+        for rule, rule_re in self.__includes:
+            if not rule_re.search(title):
+                return False, 0
+            self.__hit('include', rule)
+        if self.__excludes:
+            exclude_hits = [rule for rule, rule_re in self.__excludes if rule_re.search(title)]
+            for rule in exclude_hits:
+                self.__hit('exclude', rule)
+            if len(exclude_hits) == len(self.__excludes):
+                return False, 0
+        res_order = 0
+        if self.__notes:
+            title_string = "%s%s" % (title, subtitle)
+            res_seq = 100
+            for rule, rule_re in self.__notes:
+                res_seq = res_seq - 1
+                if rule_re.search(title_string):
+                    self.__hit('note', rule)
+                    res_order = res_seq
+                    break
+        return True, res_order
+
+    def get_stats(self):
+        """
+        查询每条规则的命中次数
+        :return: [{"type": 规则类型, "rule": 规则, "count": 命中次数}]
+        """
+        with self.__lock:
+            return [{"type": rule_type, "rule": rule, "count": count}
+                    for (rule_type, rule), count in self.__stats.items()]
+
+
+@lru_cache(maxsize=64)
+def _compile_resource_rules(includes, excludes, notes):
+    return ResourceRules(includes, excludes, notes)
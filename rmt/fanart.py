@@ -0,0 +1,97 @@
+from concurrent.futures.thread import ThreadPoolExecutor
+from threading import Lock
+
+import log
+from config import Config, FANART_MOVIE_API_URL, FANART_TV_API_URL, FANART_PREFETCH_THREADS
+from utils.functions import singleton
+from utils.http_utils import RequestUtils
+from utils.meta_helper import MetaHelper
+from utils.types import MediaType
+
+lock = Lock()
+
+
+@singleton
+class Fanart:
+    """
+    Fanart图片查询，结果持久化缓存，只在需要图片时才查询，也可以在后台批量预取
+    """
+    meta = None
+    __executor = None
+    __prefetching = set()
+
+    def __init__(self):
+        self.meta = MetaHelper()
+        self.__executor = ThreadPoolExecutor(max_workers=FANART_PREFETCH_THREADS, thread_name_prefix="fanart")
+        self.__prefetching = set()
+
+    @staticmethod
+    def __get_image_type(search_type):
+        return "MOV" if search_type == MediaType.MOVIE else "TV"
+
+    def get_image(self, search_type, tmdbid):
+        """
+        查询Fanart图片，优先使用缓存
+        :param search_type: 媒体类型
+        :param tmdbid: TMDB的ID
+        :return: 图片地址，没有时返回空字符串
+        """
+        if not search_type or not tmdbid:
+            return ""
+        image_type = self.__get_image_type(search_type)
+        image_url = self.meta.get_fanart_image(image_type, tmdbid)
+        if image_url is not None:
+            return image_url
+        image_url = self.__fetch_image(image_type, tmdbid)
+        if image_url is not None:
+            self.meta.update_fanart_image(image_type, tmdbid, image_url)
+        return image_url or ""
+
+    def prefetch(self, media_infos):
+        """
+        在后台批量预取Fanart图片，不阻塞调用方
+        :param media_infos: 已识别的媒体信息列表
+        """
+        for media_info in media_infos:
+            if not media_info or not media_info.tmdb_id or not media_info.type:
+                continue
+            key = (self.__get_image_type(media_info.type), int(media_info.tmdb_id))
+            with lock:
+                if key in self.__prefetching:
+                    continue
+                self.__prefetching.add(key)
+            self.__executor.submit(self.__prefetch_image, media_info.type, key)
+
+    def __prefetch_image(self, search_type, key):
+        try:
+            self.get_image(search_type, key[1])
+        finally:
+            with lock:
+                self.__prefetching.discard(key)
+
+    @staticmethod
+    def __fetch_image(image_type, tmdbid):
+        """
+        调用Fanart API查询图片
+        :return: 图片地址，没有图片时返回空字符串，查询失败时返回None
+        """
+        if image_type == "MOV":
+            image_url = FANART_MOVIE_API_URL % tmdbid
+        else:
+            image_url = FANART_TV_API_URL % tmdbid
+        try:
+            ret = RequestUtils(proxies=Config().get_proxies()).get_res(image_url)
+            if ret is None:
+                return None
+            if ret:
+                moviethumbs = ret.json().get('moviethumb')
+                if moviethumbs:
+                    moviethumb = moviethumbs[0].get('url')
+                    if moviethumb:
+                        return moviethumb
+            elif ret.status_code != 404:
+                return None
+            return ""
+        except Exception as e:
+            log.console(str(e))
+        return None
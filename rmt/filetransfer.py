@@ -1,29 +1,35 @@
 import _thread
 import argparse
+import errno
 import os
 import re
 import traceback
-from threading import Lock
+from concurrent.futures.thread import ThreadPoolExecutor
+from threading import Lock, BoundedSemaphore
 from subprocess import call
 
 import log
-from config import RMT_SUBEXT, RMT_MEDIAEXT, RMT_FAVTYPE, Config, RMT_MIN_FILESIZE
+from config import RMT_SUBEXT, RMT_MEDIAEXT, RMT_FAVTYPE, Config, RMT_MIN_FILESIZE, RMT_COPY_CHUNK_SIZE, \
+    RMT_COPY_THREADS
 from pt.subtitle import Subtitle
 from rmt.category import Category
+from rmt.library_index import LibraryIndex
 from pt.media_server import MediaServer
-from rmt.metainfo import MetaInfo
 from utils.functions import get_dir_files_by_ext, get_free_space_gb, get_dir_level1_medias, is_invalid_path, \
-    is_path_in_path, get_system, is_bluray_dir, str_filesize
+    is_path_in_path, is_bluray_dir, str_filesize, str_timelong, get_system
 from message.send import Message
 from rmt.media import Media
+from utils.cache_utils import DirSnapshot
+from utils.file_utils import transfer_file
 from utils.sqls import insert_transfer_history, insert_transfer_unknown
 from utils.types import MediaType, DownloaderType, SyncType, RmtMode, OsType
 
 lock = Lock()
+# 每个磁盘同时复制的文件数限制：设备 -> (文件数, 信号量)
+COPY_SEMAPHORES = {}
 
 
 class FileTransfer:
-    __system = OsType.LINUX
     __pt_rmt_mode = None
     __sync_rmt_mode = None
     __movie_path = None
@@ -37,20 +43,27 @@ class FileTransfer:
     __filesize_cover = False
     __movie_multiversion = True
     __tv_multiversion = False
+    __copy_threads = RMT_COPY_THREADS
+    __copy_verify = False
+    __ignore_case = False
     media = None
     message = None
     category = None
     mediaserver = None
+    library = None
 
     def __init__(self):
         self.media = Media()
         self.message = Message()
         self.category = Category()
         self.mediaserver = MediaServer()
+        self.library = LibraryIndex()
         self.init_config()
 
     def init_config(self):
-        self.__system = get_system()
+        # Windows及监控目录为Windows共享时文件名不区分大小写
+        self.__ignore_case = get_system() == OsType.WINDOWS
+        self.library.init_config()
         config = Config()
         media = config.get_config('media')
         if media:
@@ -104,6 +117,17 @@ class FileTransfer:
             self.__movie_multiversion = True if media.get("movie_multiversion") is None or media.get("movie_multiversion") else False
             # 电视剧多分辨率
             self.__tv_multiversion = media.get("tv_multiversion")
+            # 每个磁盘同时复制的文件数
+            copy_threads = media.get('copy_threads')
+            self.__copy_threads = int(copy_threads) if str(copy_threads).isdigit() and int(copy_threads) > 0 \
+                else RMT_COPY_THREADS
+            # 配置的文件数变化时重建各磁盘的信号量，正在复制的文件仍按原信号量释放
+            with lock:
+                for device in [device for device, (threads, _) in COPY_SEMAPHORES.items()
+                               if threads != self.__copy_threads]:
+                    COPY_SEMAPHORES.pop(device)
+            # 复制后校验
+            self.__copy_verify = True if media.get('copy_verify') else False
 
         sync = config.get_config('sync')
         if sync:
@@ -118,6 +142,8 @@ class FileTransfer:
                 self.__sync_rmt_mode = RmtMode.SOFTLINK
             else:
                 self.__sync_rmt_mode = RmtMode.COPY
+            if sync.get('nas_sys') == "windows":
+                self.__ignore_case = True
         pt = config.get_config('pt')
         if pt:
             rmt_mode = pt.get('rmt_mode')
@@ -134,41 +160,65 @@ class FileTransfer:
 
     def __transfer_command(self, file_item, target_file, rmt_mode):
         """
-        使用系统命令处理单个文件
+        在进程内处理单个文件，复制时优先使用reflink和内核零拷贝，同一磁盘上同时复制的文件数受copy_threads限制
         :param file_item: 文件路径
         :param target_file: 目标文件路径
         :param rmt_mode: RmtMode转移方式
+        :return: 错误码，0为成功
         """
-        try:
-            lock.acquire()
-            if self.__system == OsType.WINDOWS:
-                if rmt_mode == RmtMode.LINK:
-                    retcode = os.system('mklink /H "%s" "%s"' % (target_file, file_item))
-                elif rmt_mode == RmtMode.SOFTLINK:
-                    retcode = os.system('mklink "%s" "%s"' % (target_file, file_item))
-                else:
-                    retcode = os.system('copy /Y "%s" "%s"' % (file_item, target_file))
-            else:
-                if rmt_mode == RmtMode.LINK:
-                    retcode = call(['ln', file_item, target_file])
-                elif rmt_mode == RmtMode.SOFTLINK:
-                    retcode = call(['ln', '-s', file_item, target_file])
-                else:
-                    retcode = call(['cp', file_item, target_file])
-        finally:
-            lock.release()
+        file_name = os.path.basename(file_item)
+        if rmt_mode != RmtMode.COPY:
+            retcode, err_msg = transfer_file(file_item, target_file, rmt_mode)
+        else:
+            progress_state = {'percent': 0}
+
+            def log_progress(info):
+                if info.get('total') <= RMT_COPY_CHUNK_SIZE:
+                    return
+                percent = int(info.get('percent')) // 10 * 10
+                if percent > progress_state['percent']:
+                    progress_state['percent'] = percent
+                    log.info("【RMT】正在复制 %s：%s%%，%s/%s，速度：%s/s，剩余时间：%s" % (
+                        file_name, percent, str_filesize(info.get('copied')), str_filesize(info.get('total')),
+                        str_filesize(info.get('speed')),
+                        str_timelong(info.get('eta')) if info.get('eta') is not None else "未知"))
+
+            with self.__get_copy_semaphore(target_file):
+                retcode, err_msg = transfer_file(file_item, target_file, rmt_mode, log_progress, self.__copy_verify)
+        # 其它转移线程已经生成了同名文件，按已存在处理
+        if retcode == errno.EEXIST:
+            log.warn("【RMT】%s 已存在" % target_file)
+            return 0
+        if retcode != 0:
+            log.error("【RMT】%s %s 到 %s 出错：%s" % (file_item, rmt_mode.value, target_file, err_msg))
         return retcode
 
-    def __transfer_subtitles(self, org_name, new_name, rmt_mode):
+    def __get_copy_semaphore(self, target_file):
+        """
+        按目的文件所在的设备获取复制并发数的信号量
+        """
+        try:
+            device = os.stat(os.path.dirname(target_file)).st_dev
+        except OSError:
+            device = None
+        with lock:
+            copy_threads, semaphore = COPY_SEMAPHORES.get(device) or (None, None)
+            if copy_threads != self.__copy_threads:
+                semaphore = BoundedSemaphore(self.__copy_threads)
+                COPY_SEMAPHORES[device] = (self.__copy_threads, semaphore)
+            return semaphore
+
+    def __transfer_subtitles(self, org_name, new_name, rmt_mode, dir_cache):
         """
         根据文件名转移对应字幕文件
         :param org_name: 原文件名
         :param new_name: 新文件名
         :param rmt_mode: RmtMode转移方式
+        :param dir_cache: 本次转移的目录快照
         """
         dir_name = os.path.dirname(org_name)
         file_name = os.path.basename(org_name)
-        file_list = get_dir_files_by_ext(dir_name, RMT_SUBEXT)
+        file_list = dir_cache.get_dir_files(dir_name, RMT_SUBEXT)
         Media_FileNum = len(file_list)
         if Media_FileNum == 0:
             log.debug("【RMT】%s 目录下没有找到字幕文件..." % dir_name)
@@ -184,9 +234,10 @@ class FileTransfer:
                         new_file = os.path.splitext(new_name)[0] + ".zh-cn" + file_ext
                     else:
                         new_file = os.path.splitext(new_name)[0] + file_ext
-                    if not os.path.exists(new_file):
+                    if not dir_cache.exists(new_file):
                         log.debug("【RMT】正在处理字幕：%s" % file_name)
                         retcode = self.__transfer_command(file_item, new_file, rmt_mode)
+                        dir_cache.invalidate(new_file)
                         if retcode == 0:
                             log.info("【RMT】字幕 %s %s完成" % (file_name, rmt_mode.value))
                         else:
@@ -208,6 +259,7 @@ class FileTransfer:
         log.info("【RMT】正在%s目录：%s 到 %s" % (rmt_mode.value, file_path, new_path))
         # 复制
         retcode = self.__transfer_dir_files(file_path, new_path, rmt_mode)
+        self.library.update_path(new_path)
         if retcode == 0:
             log.info("【RMT】文件 %s %s完成" % (file_path, rmt_mode.value))
         else:
@@ -244,7 +296,7 @@ class FileTransfer:
         :param rmt_mode: RmtMode转移方式
         """
         file_list = get_dir_files_by_ext(src_dir)
-        retcode = 0
+        transfer_files = []
         for file in file_list:
             new_file = file.replace(src_dir, target_dir)
             if os.path.exists(new_file):
@@ -252,7 +304,19 @@ class FileTransfer:
                 continue
             new_dir = os.path.dirname(new_file)
             if not os.path.exists(new_dir):
-                os.makedirs(new_dir)
+                os.makedirs(new_dir, exist_ok=True)
+            transfer_files.append((file, new_file))
+        retcode = 0
+        # 复制时多个文件并发处理
+        if rmt_mode == RmtMode.COPY and len(transfer_files) > 1:
+            with ThreadPoolExecutor(max_workers=self.__copy_threads) as executor:
+                retcodes = executor.map(lambda item: self.__transfer_command(item[0], item[1], rmt_mode),
+                                        transfer_files)
+                for ret in retcodes:
+                    if ret != 0 and retcode == 0:
+                        retcode = ret
+            return retcode
+        for file, new_file in transfer_files:
             retcode = self.__transfer_command(file, new_file, rmt_mode)
             if retcode != 0:
                 break
@@ -275,7 +339,7 @@ class FileTransfer:
         target_dir = os.path.join(target_dir, parent_name)
         if not os.path.exists(target_dir):
             log.debug("【RMT】正在创建目录：%s" % target_dir)
-            os.makedirs(target_dir)
+            os.makedirs(target_dir, exist_ok=True)
         # 目录
         if os.path.isdir(file_item):
             log.info("【RMT】正在%s目录：%s 到 %s" % (rmt_mode.value, file_item, target_dir))
@@ -293,17 +357,20 @@ class FileTransfer:
             log.error("【RMT】%s %s到unknown失败，错误码：%s" % (file_item, rmt_mode.value, retcode))
         return retcode
 
-    def __transfer_file(self, file_item, new_file, rmt_mode, over_flag=False):
+    def __transfer_file(self, file_item, new_file, rmt_mode, over_flag=False, dir_cache=None):
         """
         转移一个文件，同时处理字幕
         :param file_item: 原文件路径
         :param new_file: 新文件路径
         :param rmt_mode: RmtMode转移方式
         :param over_flag: 是否覆盖，为True时会先删除再转移
+        :param dir_cache: 本次转移的目录快照，为空时新建
         """
+        if not dir_cache:
+            dir_cache = DirSnapshot(self.__ignore_case)
         file_name = os.path.basename(file_item)
         new_file_name = os.path.basename(new_file)
-        if not over_flag and os.path.exists(new_file):
+        if not over_flag and dir_cache.exists(new_file):
             log.warn("【RMT】文件已存在：%s" % new_file_name)
             return 0
         if over_flag and os.path.isfile(new_file):
@@ -311,13 +378,15 @@ class FileTransfer:
             os.remove(new_file)
         log.info("【RMT】正在转移文件：%s 到 %s" % (file_name, new_file_name))
         retcode = self.__transfer_command(file_item, new_file, rmt_mode)
+        dir_cache.invalidate(new_file)
+        self.library.update_path(new_file)
         if retcode == 0:
             log.info("【RMT】文件 %s %s完成" % (file_name, rmt_mode.value))
         else:
             log.error("【RMT】文件 %s %s失败，错误码：%s" % (file_name, rmt_mode.value, str(retcode)))
             return retcode
         # 处理字幕
-        return self.__transfer_subtitles(file_item, new_file, rmt_mode)
+        return self.__transfer_subtitles(file_item, new_file, rmt_mode, dir_cache)
 
     def transfer_media(self,
                        in_from,
@@ -407,6 +476,8 @@ class FileTransfer:
         refresh_library_items = []
         # 需要下载字段的清单
         download_subtitle_items = []
+        # 目录快照，避免每个文件都重复查询目的目录和源目录
+        dir_cache = DirSnapshot(self.__ignore_case)
         # 处理识别后的每一个文件或单个文件夹
         for file_item, media in Medias.items():
             try:
@@ -462,7 +533,7 @@ class FileTransfer:
                     return False, "目录不存在：%s" % dist_path
 
                 # 判断文件是否已存在，返回：目录存在标志、目录名、文件存在标志、文件名
-                dir_exist_flag, ret_dir_path, file_exist_flag, ret_file_path = self.__is_media_exists(dist_path, media)
+                dir_exist_flag, ret_dir_path, file_exist_flag, ret_file_path = self.__is_media_exists(dist_path, media, dir_cache)
                 # 已存在的文件数量
                 exist_filenum = 0
                 handler_flag = False
@@ -480,7 +551,7 @@ class FileTransfer:
                         if rmt_mode != RmtMode.SOFTLINK:
                             if media.size > existfile_size and self.__filesize_cover:
                                 log.info("【RMT】文件 %s 已存在，但新文件质量更好，覆盖..." % ret_file_path)
-                                ret = self.__transfer_file(file_item, ret_file_path, rmt_mode, True)
+                                ret = self.__transfer_file(file_item, ret_file_path, rmt_mode, True, dir_cache)
                                 if ret != 0:
                                     success_flag = False
                                     error_message = "文件转移失败，错误码：%s" % ret
@@ -508,10 +579,12 @@ class FileTransfer:
                     else:
                         # 创建电录
                         log.debug("【RMT】正在创建目录：%s" % ret_dir_path)
-                        os.makedirs(ret_dir_path)
+                        os.makedirs(ret_dir_path, exist_ok=True)
+                        dir_cache.invalidate(ret_dir_path)
                 # 转移蓝光原盘
                 if bluray_disk_flag:
                     ret = self.__transfer_bluray_dir(file_item, ret_dir_path, rmt_mode)
+                    dir_cache.invalidate(ret_dir_path)
                     if ret != 0:
                         success_flag = False
                         error_message = "蓝光目录转移失败，错误码：%s" % ret
@@ -530,7 +603,7 @@ class FileTransfer:
                             failed_count += 1
                             continue
                         new_file = "%s%s" % (ret_file_path, file_ext)
-                        ret = self.__transfer_file(file_item, new_file, rmt_mode, False)
+                        ret = self.__transfer_file(file_item, new_file, rmt_mode, False, dir_cache)
                         if ret != 0:
                             success_flag = False
                             error_message = "文件转移失败，错误码：%s" % ret
@@ -606,11 +679,13 @@ class FileTransfer:
 
     def __is_media_exists(self,
                           media_dest,
-                          media):
+                          media,
+                          dir_cache):
         """
         判断媒体文件是否忆存在
         :param media_dest: 媒体文件所在目录
         :param media: 已识别的媒体信息
+        :param dir_cache: 本次转移的目录快照
         :return: 目录是否存在，目录路径，文件是否存在，文件路径
         """
         dir_exist_flag = False
@@ -626,11 +701,11 @@ class FileTransfer:
                 for m_type in [RMT_FAVTYPE, media.category]:
                     type_path = os.path.join(media_dest, m_type, dir_name)
                     # 目录是否存在
-                    if os.path.exists(type_path):
+                    if dir_cache.exists(type_path):
                         file_path = type_path
                         break
             ret_dir_path = file_path
-            if os.path.exists(file_path):
+            if dir_cache.exists(file_path):
                 dir_exist_flag = True
             file_dest = os.path.join(file_path, dir_name)
             if media.part:
@@ -638,12 +713,10 @@ class FileTransfer:
             if media.resource_pix and self.__movie_multiversion:
                 file_dest = "%s - %s" % (file_dest, media.resource_pix)
             ret_file_path = file_dest
-            for ext in RMT_MEDIAEXT:
-                ext_dest = "%s%s" % (file_dest, ext)
-                if os.path.exists(ext_dest):
-                    file_exist_flag = True
-                    ret_file_path = ext_dest
-                    break
+            ext_dest = dir_cache.find_file(file_dest, RMT_MEDIAEXT)
+            if ext_dest:
+                file_exist_flag = True
+                ret_file_path = ext_dest
         # 电视剧或者动漫
         else:
             # 剧集目录
@@ -659,7 +732,7 @@ class FileTransfer:
                 season_str = "Season %s" % seasons[0]
                 season_dir = os.path.join(media_path, season_str)
                 ret_dir_path = season_dir
-                if os.path.exists(season_dir):
+                if dir_cache.exists(season_dir):
                     dir_exist_flag = True
                 episodes = media.get_episode_list()
                 if episodes:
@@ -679,12 +752,10 @@ class FileTransfer:
                         file_path = "%s - %s%s - 第 %s 集" % (
                             file_path, media.get_season_item(), media.get_episode_items(), file_seq_num)
                     ret_file_path = file_path
-                    for ext in RMT_MEDIAEXT:
-                        ext_dest = "%s%s" % (file_path, ext)
-                        if os.path.exists(ext_dest):
-                            file_exist_flag = True
-                            ret_file_path = ext_dest
-                            break
+                    ext_dest = dir_cache.find_file(file_path, RMT_MEDIAEXT)
+                    if ext_dest:
+                        file_exist_flag = True
+                        ret_file_path = ext_dest
         return dir_exist_flag, ret_dir_path, file_exist_flag, ret_file_path
 
     def transfer_embyfav(self, item_path):
@@ -717,6 +788,8 @@ class FileTransfer:
             log.info("【EMBY】目录 %s 已存在" % new_path)
             return False, None
         ret = call(['mv', movie_dir, new_path])
+        self.library.update_path(movie_dir)
+        self.library.update_path(new_path)
         if ret == 0:
             return True, org_type
         else:
@@ -763,7 +836,7 @@ class FileTransfer:
 
     def get_no_exists_medias(self, meta_info, season=None, total_num=None):
         """
-        根据媒体库目录结构，判断媒体是否存在
+        根据媒体库目录结构，判断媒体是否存在，从媒体库索引中查询，不再遍历目录
         :param meta_info: 已识别的媒体信息
         :param season: 季号，数字，剧集时需要
         :param total_num: 该季总集数，剧集时需要
@@ -774,14 +847,12 @@ class FileTransfer:
             for dest_path in self.__movie_path:
                 # 判断精选
                 fav_path = os.path.join(dest_path, RMT_FAVTYPE, meta_info.get_title_string())
-                fav_files = get_dir_files_by_ext(fav_path, RMT_MEDIAEXT)
                 # 其它分类
                 if self.__movie_category_flag:
                     dest_path = os.path.join(dest_path, meta_info.category, meta_info.get_title_string())
                 else:
                     dest_path = os.path.join(dest_path, meta_info.get_title_string())
-                files = get_dir_files_by_ext(dest_path, RMT_MEDIAEXT)
-                if len(files) > 0 or len(fav_files) > 0:
+                if self.library.get_media_count(dest_path) or self.library.get_media_count(fav_path):
                     return [{'title': meta_info.title, 'year': meta_info.year}]
             return []
         # 电视剧
@@ -797,27 +868,15 @@ class FileTransfer:
             # 总需要的集
             total_episodes = [episode for episode in range(1, total_num + 1)]
             # 已存在的集
-            exists_episodes = []
+            exists_episodes = set()
             for dest_path in dest_paths:
                 if category_flag:
                     dest_path = os.path.join(dest_path, meta_info.category, meta_info.get_title_string(),
                                              "Season %s" % season)
                 else:
                     dest_path = os.path.join(dest_path, meta_info.get_title_string(), "Season %s" % season)
-                # 目录不存在
-                if not os.path.exists(dest_path):
-                    continue
-                files = get_dir_files_by_ext(dest_path, RMT_MEDIAEXT)
-                for file in files:
-                    file_meta_info = MetaInfo(os.path.basename(file))
-                    if not file_meta_info.get_season_list() or not file_meta_info.get_episode_list():
-                        continue
-                    if file_meta_info.get_name() != meta_info.title:
-                        continue
-                    if not file_meta_info.is_in_season(season):
-                        continue
-                    exists_episodes = list(set(exists_episodes).union(set(file_meta_info.get_episode_list())))
-            return list(set(total_episodes).difference(set(exists_episodes)))
+                exists_episodes.update(self.library.get_episodes(dest_path, meta_info.title, season))
+            return list(set(total_episodes).difference(exists_episodes))
 
     def __get_best_target_path(self, mtype, in_path=None, size=0):
         """
@@ -882,7 +941,7 @@ class FileTransfer:
         new_file = in_file.replace(src_path, target_dir)
         new_dir = os.path.dirname(new_file)
         if not os.path.exists(new_dir):
-            os.makedirs(new_dir)
+            os.makedirs(new_dir, exist_ok=True)
         return self.__transfer_command(in_file, new_file, rmt_mode)
 
 
@@ -0,0 +1,266 @@
+import os
+from threading import Lock
+
+import log
+from config import Config, RMT_MEDIAEXT
+from rmt.metainfo import MetaInfo
+from utils.functions import singleton, is_invalid_path, is_path_in_path, scan_dir_files
+from utils.sqls import get_library_files, insert_library_files, delete_library_files
+
+lock = Lock()
+build_lock = Lock()
+
+
+@singleton
+class LibraryIndex:
+    """
+    媒体库文件索引，记录电影、电视剧、动漫目录下的媒体文件及文件名中识别出的季集，持久化在数据库中，
+    由文件转移和目录监控增量维护，定时全量校对
+    """
+    # 媒体库根目录，值为是否需要识别季集
+    __roots = {}
+    # 文件路径 -> (根目录, 名称, 季列表, 集列表)
+    __files = {}
+    # 目录 -> 目录下（含子目录）的媒体文件路径集合
+    __dirs = {}
+    # (目录, 名称) -> {文件路径: (季列表, 集列表)}
+    __episodes = {}
+    __loaded = False
+
+    def __init__(self):
+        self.init_config()
+
+    def init_config(self):
+        media = Config().get_config('media') or {}
+        roots = {}
+        for path_key, parse_flag in [('movie_path', False), ('tv_path', True), ('anime_path', True)]:
+            paths = media.get(path_key) or []
+            if not isinstance(paths, list):
+                paths = [paths]
+            for path in paths:
+                if not path:
+                    continue
+                path = os.path.normpath(path)
+                roots[path] = roots.get(path) or parse_flag
+        if roots == self.__roots:
+            return
+        with build_lock:
+            with lock:
+                self.__roots = roots
+                self.__files = {}
+                self.__dirs = {}
+                self.__episodes = {}
+                self.__loaded = False
+
+    def get_media_count(self, dir_path):
+        """
+        查询目录下（含子目录）的媒体文件数量
+        :param dir_path: 媒体库中的目录
+        """
+        if not dir_path:
+            return 0
+        self.__ensure_loaded()
+        with lock:
+            return len(self.__dirs.get(os.path.normpath(dir_path)) or ())
+
+    def get_episodes(self, dir_path, name, season):
+        """
+        查询目录下（含子目录）某个名称、某一季已存在的集
+        :param dir_path: 媒体库中的目录
+        :param name: 文件名中识别出的名称
+        :param season: 季号，数字
+        :return: 集号集合
+        """
+        if not dir_path or not name or not season:
+            return set()
+        self.__ensure_loaded()
+        exists_episodes = set()
+        with lock:
+            files = self.__episodes.get((os.path.normpath(dir_path), name)) or {}
+            for seasons, episodes in files.values():
+                if int(season) in seasons:
+                    exists_episodes.update(episodes)
+        return exists_episodes
+
+    def update_path(self, path):
+        """
+        媒体库中的文件或目录发生变化时，增量更新索引
+        :param path: 新增、删除或移动的文件或目录
+        """
+        if not path:
+            return
+        path = os.path.normpath(path)
+        root = self.__get_root(path)
+        if not root:
+            return
+        self.__ensure_loaded()
+        if os.path.isdir(path):
+            exists_files = set(self.__walk_media_files(path))
+        elif os.path.exists(path) and self.__is_media_file(path):
+            exists_files = {path}
+        else:
+            exists_files = set()
+        # 只取该路径本身及其下已索引的文件比对，不遍历整个索引
+        with lock:
+            index_files = set(self.__dirs.get(path) or ())
+            if path in self.__files:
+                index_files.add(path)
+        removes = list(index_files - exists_files)
+        adds = list(exists_files - index_files)
+        self.__apply_changes(removes, self.__parse_files(adds))
+
+    def refresh(self):
+        """
+        全量校对索引：新增的文件识别后加入，已不存在的文件移除，由定时服务调用
+        """
+        if self.__ensure_loaded():
+            return
+        with build_lock:
+            self.__rebuild()
+
+    def __ensure_loaded(self):
+        """
+        首次使用时从数据库加载索引，已不在配置中的根目录的记录删除，数据库中没有记录的根目录全量建立
+        :return: 是否对所有根目录进行了全量建立
+        """
+        if self.__loaded:
+            return False
+        with build_lock:
+            if self.__loaded:
+                return False
+            rows = get_library_files()
+            invalid_paths = []
+            with lock:
+                for path, root, name, seasons, episodes in rows:
+                    if self.__roots.get(root) is None or not is_path_in_path(root, path):
+                        invalid_paths.append(path)
+                        continue
+                    self.__add_file(path, root, name, self.__str_to_nums(seasons), self.__str_to_nums(episodes))
+                loaded_roots = {file_info[0] for file_info in self.__files.values()}
+            if invalid_paths:
+                delete_library_files(invalid_paths)
+            new_roots = [root for root in self.__roots if root not in loaded_roots]
+            if new_roots:
+                log.info("【LIBRARY】建立媒体库索引：%s" % "，".join(new_roots))
+                self.__rebuild(new_roots)
+            self.__loaded = True
+            return not loaded_roots
+
+    def __rebuild(self, roots=None):
+        """
+        遍历媒体库目录，与索引比对后增量更新
+        :param roots: 需要遍历的根目录，为空时遍历全部根目录
+        """
+        if roots is None:
+            roots = list(self.__roots)
+        exists_files = set()
+        for root in roots:
+            exists_files.update(self.__walk_media_files(root))
+        with lock:
+            removes = [file for file, file_info in self.__files.items()
+                       if file_info[0] in roots and file not in exists_files]
+            adds = [file for file in exists_files if file not in self.__files]
+        if removes or adds:
+            log.info("【LIBRARY】媒体库索引更新，新增文件：%s，移除文件：%s" % (len(adds), len(removes)))
+        self.__apply_changes(removes, self.__parse_files(adds))
+
+    def __apply_changes(self, removes, adds):
+        """
+        更新内存索引并持久化
+        :param removes: 移除的文件路径列表
+        :param adds: 新增的文件列表：[(路径, 根目录, 名称, 季列表, 集列表)]
+        """
+        if not removes and not adds:
+            return
+        with lock:
+            for path in removes:
+                self.__remove_file(path)
+            for path, root, name, seasons, episodes in adds:
+                self.__add_file(path, root, name, seasons, episodes)
+        delete_library_files(removes)
+        insert_library_files([(path, root, name, self.__nums_to_str(seasons), self.__nums_to_str(episodes))
+                              for path, root, name, seasons, episodes in adds])
+
+    def __parse_files(self, paths):
+        """
+        识别文件名中的名称和季集，只处理电视剧、动漫目录下的文件
+        """
+        ret_list = []
+        for path in paths:
+            root = self.__get_root(path)
+            if not root:
+                continue
+            name = ""
+            seasons = ()
+            episodes = ()
+            if self.__roots.get(root):
+                meta_info = MetaInfo(os.path.basename(path))
+                name = meta_info.get_name()
+                seasons = tuple(meta_info.get_season_list())
+                episodes = tuple(meta_info.get_episode_list())
+            ret_list.append((path, root, name, seasons, episodes))
+        return ret_list
+
+    def __add_file(self, path, root, name, seasons, episodes):
+        if path in self.__files:
+            self.__remove_file(path)
+        self.__files[path] = (root, name, seasons, episodes)
+        for dir_path in self.__get_parent_dirs(path, root):
+            self.__dirs.setdefault(dir_path, set()).add(path)
+            if name and seasons and episodes:
+                self.__episodes.setdefault((dir_path, name), {})[path] = (seasons, episodes)
+
+    def __remove_file(self, path):
+        file_info = self.__files.pop(path, None)
+        if not file_info:
+            return
+        root, name = file_info[0], file_info[1]
+        for dir_path in self.__get_parent_dirs(path, root):
+            dir_files = self.__dirs.get(dir_path)
+            if dir_files is not None:
+                dir_files.discard(path)
+                if not dir_files:
+                    self.__dirs.pop(dir_path, None)
+            files = self.__episodes.get((dir_path, name))
+            if files is not None:
+                files.pop(path, None)
+                if not files:
+                    self.__episodes.pop((dir_path, name), None)
+
+    @staticmethod
+    def __get_parent_dirs(path, root):
+        """
+        文件所在目录到根目录之间的所有上级目录，含根目录
+        """
+        dir_path = os.path.dirname(path)
+        while True:
+            yield dir_path
+            if dir_path == root or dir_path == os.path.dirname(dir_path):
+                break
+            dir_path = os.path.dirname(dir_path)
+
+    def __get_root(self, path):
+        """
+        查询路径所属的媒体库根目录，有多个时取最深的
+        """
+        root = None
+        for root_path in self.__roots:
+            if is_path_in_path(root_path, path) and (not root or len(root_path) > len(root)):
+                root = root_path
+        return root
+
+    @staticmethod
+    def __walk_media_files(path):
+        return scan_dir_files(path, RMT_MEDIAEXT)
+
+    @staticmethod
+    def __is_media_file(path):
+        return os.path.splitext(path)[-1].lower() in RMT_MEDIAEXT and not is_invalid_path(path)
+
+    @staticmethod
+    def __nums_to_str(nums):
+        return ",".join(str(num) for num in nums)
+
+    @staticmethod
+    def __str_to_nums(nums_str):
+        return tuple(int(num) for num in str(nums_str or "").split(",") if num.isdigit())
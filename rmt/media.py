@@ -1,10 +1,11 @@
 import os
 import re
 import traceback
+from concurrent.futures.thread import ThreadPoolExecutor
 
 import log
-from config import Config
-from rmt.metainfo import MetaInfo
+from config import Config, TMDB_SEARCH_THREADS
+from rmt.metainfo import MetaInfo, parse_files_meta
 from rmt.tmdbv3api import TMDb, Search, Movie, TV
 from utils.functions import xstr, is_chinese
 from utils.meta_helper import MetaHelper
@@ -19,8 +20,11 @@ class Media:
     tv = None
     meta = None
     __rmt_match_mode = None
-    __space_chars = r"\.|-|/|:"
-    __empty_chars = r"'"
+    __parse_workers = None
+    # 名称比较前的标准化处理
+    __space_chars_re = re.compile(r"\.|-|/|:")
+    __empty_chars_re = re.compile(r"'")
+    __spaces_re = re.compile(r"\s+")
 
     def __init__(self):
         self.init_config()
@@ -49,29 +53,61 @@ class Media:
                 self.__rmt_match_mode = MatchMode.STRICT
             else:
                 self.__rmt_match_mode = MatchMode.NORMAL
+        media = config.get_config('media')
+        if media:
+            parse_workers = media.get('parse_workers')
+            self.__parse_workers = int(parse_workers) if str(parse_workers).isdigit() else None
+
+    @classmethod
+    def __normalize_name(cls, name):
+        """
+        标准化名称：去掉分隔符、引号和多余空格并转为大写
+        """
+        if not name:
+            return ""
+        name = cls.__space_chars_re.sub(' ', name)
+        name = cls.__empty_chars_re.sub('', name)
+        return cls.__spaces_re.sub(' ', name).strip().upper()
 
     def __compare_tmdb_names(self, file_name, tmdb_names):
+        """
+        比较名称是否一致
+        :param file_name: 识别出的名称
+        :param tmdb_names: TMDB的名称或名称列表，为集合时视为已标准化的名称
+        """
         if not file_name or not tmdb_names:
             return False
+        file_name = self.__normalize_name(file_name)
+        if isinstance(tmdb_names, (set, frozenset)):
+            return file_name in tmdb_names
         if not isinstance(tmdb_names, list):
             tmdb_names = [tmdb_names]
-        file_name = re.sub(r'\s+', ' ', re.sub(r"%s" % self.__empty_chars, '', re.sub(r"%s" % self.__space_chars, ' ', file_name))).strip().upper()
         for tmdb_name in tmdb_names:
-            tmdb_name = re.sub(r'\s+', ' ', re.sub(r"%s" % self.__empty_chars, '', re.sub(r"%s" % self.__space_chars, ' ', tmdb_name))).strip().upper()
-            if file_name == tmdb_name:
+            if file_name == self.__normalize_name(tmdb_name):
                 return True
         return False
 
+    @staticmethod
+    def __get_names_type(mtype):
+        """
+        译名缓存的类型，电视剧和动漫都使用电视剧的译名
+        """
+        return "MOV" if mtype == MediaType.MOVIE else "TV"
+
     def __search_tmdb_names(self, mtype, tmdb_id):
         """
-        检索tmdb中所有的译名，用于名称匹配
+        检索tmdb中所有的译名，用于名称匹配，查询结果会持久化缓存，每个TMDB ID只查询一次
         :param mtype: 类型：电影、电视剧、动漫
         :param tmdb_id: TMDB的ID
-        :return: 所有译名的清单
+        :return: 所有标准化后的译名集合
         """
         if not mtype or not tmdb_id:
-            return []
-        ret_names = []
+            return frozenset()
+        names_type = self.__get_names_type(mtype)
+        ret_names = self.meta.get_tmdb_names(names_type, tmdb_id)
+        if ret_names is not None:
+            return ret_names
+        ret_names = set()
         try:
             if mtype == MediaType.MOVIE:
                 tmdb_info = self.movie.translations(tmdb_id)
@@ -80,8 +116,8 @@ class Media:
                     for translation in translations:
                         data = translation.get("data", {})
                         title = data.get("title")
-                        if title and title not in ret_names:
-                            ret_names.append(title)
+                        if title:
+                            ret_names.add(self.__normalize_name(title))
             else:
                 tmdb_info = self.tv.translations(tmdb_id)
                 if tmdb_info:
@@ -89,10 +125,34 @@ class Media:
                     for translation in translations:
                         data = translation.get("data", {})
                         name = data.get("name")
-                        if name and name not in ret_names:
-                            ret_names.append(name)
+                        if name:
+                            ret_names.add(self.__normalize_name(name))
         except Exception as e:
             log.error("【META】连接TMDB出错：%s" % str(e))
+            return frozenset(ret_names)
+        self.meta.update_tmdb_names(names_type, tmdb_id, ret_names)
+        return frozenset(ret_names)
+
+    def __search_tmdb_names_batch(self, mtype, tmdb_infos):
+        """
+        批量获取候选媒体的译名，缓存中没有的并发查询TMDB
+        :param mtype: 类型：电影、电视剧、动漫
+        :param tmdb_infos: TMDB检索结果列表
+        :return: 与输入顺序一致的译名集合列表
+        """
+        names_type = self.__get_names_type(mtype)
+        ret_names = []
+        search_idxs = []
+        for idx, tmdb_info in enumerate(tmdb_infos):
+            names = self.meta.get_tmdb_names(names_type, tmdb_info.get("id")) if tmdb_info.get("id") else frozenset()
+            if names is None:
+                search_idxs.append(idx)
+            ret_names.append(names)
+        if search_idxs:
+            results = self.tmdb.gather([(self.__search_tmdb_names, (mtype, tmdb_infos[idx].get("id")))
+                                        for idx in search_idxs])
+            for idx, names in zip(search_idxs, results):
+                ret_names[idx] = frozenset() if isinstance(names, Exception) else names
         return ret_names
 
     def __search_tmdb(self, file_media_name, media_year, search_type, language=None):
@@ -111,18 +171,17 @@ class Media:
             return None
         if not is_chinese(file_media_name) and len(file_media_name) < 3:
             return None
-        if language:
-            self.tmdb.language = language
-        else:
-            self.tmdb.language = 'zh'
+        # 语言随请求传递，不修改全局设置，保证多线程并发识别时互不影响
+        if not language:
+            language = 'zh'
         # TMDB检索
         if search_type == MediaType.MOVIE:
             log.info("【META】正在识别%s：%s, 年份=%s ..." % (search_type.value, file_media_name, xstr(media_year)))
             try:
                 if media_year:
-                    movies = self.search.movies({"query": file_media_name, "year": media_year})
+                    movies = self.search.movies({"query": file_media_name, "year": media_year, "language": language})
                 else:
-                    movies = self.search.movies({"query": file_media_name})
+                    movies = self.search.movies({"query": file_media_name, "language": language})
             except Exception as e:
                 log.error("【META】连接TMDB出错：%s" % str(e))
                 return None
@@ -152,19 +211,15 @@ class Media:
                             info = movie
                             break
                 if not info:
-                    for movie in movies:
-                        if media_year:
-                            if not movie.get('release_date'):
-                                continue
-                            if movie.get('release_date')[0:4] != str(media_year):
-                                continue
-                            if self.__compare_tmdb_names(file_media_name, self.__search_tmdb_names(search_type, movie.get("id"))):
-                                info = movie
-                                break
-                        else:
-                            if self.__compare_tmdb_names(file_media_name, self.__search_tmdb_names(search_type, movie.get("id"))):
-                                info = movie
-                                break
+                    if media_year:
+                        movies = [movie for movie in movies
+                                  if movie.get('release_date') and movie.get('release_date')[0:4] == str(media_year)]
+                    # 批量获取所有候选的译名，按原顺序取第一个匹配的
+                    movies_names = self.__search_tmdb_names_batch(search_type, movies)
+                    for movie, movie_names in zip(movies, movies_names):
+                        if self.__compare_tmdb_names(file_media_name, movie_names):
+                            info = movie
+                            break
             if info:
                 log.info(">%sID：%s, %s名称：%s, 上映日期：%s" % (
                     search_type.value, info.get('id'), search_type.value, info.get('title'), info.get('release_date')))
@@ -173,9 +228,9 @@ class Media:
             log.info("【META】正在识别%s：%s, 年份=%s ..." % (search_type.value, file_media_name, xstr(media_year)))
             try:
                 if media_year:
-                    tvs = self.search.tv_shows({"query": file_media_name, "first_air_date_year": media_year})
+                    tvs = self.search.tv_shows({"query": file_media_name, "first_air_date_year": media_year, "language": language})
                 else:
-                    tvs = self.search.tv_shows({"query": file_media_name})
+                    tvs = self.search.tv_shows({"query": file_media_name, "language": language})
             except Exception as e:
                 log.error("【META】连接TMDB出错：%s" % str(e))
                 return None
@@ -205,19 +260,15 @@ class Media:
                             info = tv
                             break
                 if not info:
-                    for tv in tvs:
-                        if media_year:
-                            if not tv.get('first_air_date'):
-                                continue
-                            if tv.get('first_air_date')[0:4] != str(media_year):
-                                continue
-                            if self.__compare_tmdb_names(file_media_name, self.__search_tmdb_names(search_type, tv.get("id"))):
-                                info = tv
-                                break
-                        else:
-                            if self.__compare_tmdb_names(file_media_name, self.__search_tmdb_names(search_type, tv.get("id"))):
-                                info = tv
-                                break
+                    if media_year:
+                        tvs = [tv for tv in tvs
+                               if tv.get('first_air_date') and tv.get('first_air_date')[0:4] == str(media_year)]
+                    # 批量获取所有候选的译名，按原顺序取第一个匹配的
+                    tvs_names = self.__search_tmdb_names_batch(search_type, tvs)
+                    for tv, tv_names in zip(tvs, tvs_names):
+                        if self.__compare_tmdb_names(file_media_name, tv_names):
+                            info = tv
+                            break
             if info:
                 log.info(">%sID：%s, %s名称：%s, 上映日期：%s" % (
                     search_type.value, info.get('id'), search_type.value, info.get('name'), info.get('first_air_date')))
@@ -248,6 +299,8 @@ class Media:
             else:
                 tmdb_info = self.get_tmdb_tv_info(tmdbid)
         if tmdb_info:
+            # 详情来自缓存，复制后再修改
+            tmdb_info = tmdb_info.copy()
             tmdb_info['media_type'] = mtype
         return tmdb_info
 
@@ -270,9 +323,80 @@ class Media:
             return None
         if mtype:
             meta_info.type = mtype
-        media_key = "[%s]%s-%s" % (meta_info.type.value, meta_info.get_name(), meta_info.year)
+        media_key = self.__get_media_key(meta_info)
         if not self.meta.get_meta_data_by_key(media_key):
             # 缓存中没有开始查询
+            self.__search_media_key(media_key, meta_info, mtype, strict)
+        # 赋值返回
+        meta_info.set_tmdb_info(self.meta.get_meta_data_by_key(media_key))
+        return meta_info
+
+    def get_media_infos(self, title_list, mtype=None, strict=None):
+        """
+        批量识别种子名称，先解析全部名称，相同的名称、年份、类型只查询一次TMDB，并发查询缺失的媒体信息，用于RSS、检索结果等大量名称的识别
+        :param title_list: 种子名称列表，元素为种子名称或者(种子名称, 副标题)
+        :param mtype: 类型：电影、电视剧、动漫
+        :param strict: 是否严格模式，为true时，不会再去掉年份再查一次
+        :return: 与输入顺序一致的带有TMDB信息的MetaInfo对象列表，无法识别的为None
+        """
+        if not title_list:
+            return []
+        if not self.meta:
+            return [None] * len(title_list)
+        # 先识别所有名称，按媒体关键字去重
+        meta_infos = []
+        search_keys = {}
+        for item in title_list:
+            if isinstance(item, tuple):
+                title, subtitle = item
+            else:
+                title, subtitle = item, None
+            if not title:
+                meta_infos.append(None)
+                continue
+            meta_info = MetaInfo(title, subtitle=subtitle)
+            if not meta_info.get_name():
+                meta_infos.append(None)
+                continue
+            if mtype:
+                meta_info.type = mtype
+            media_key = self.__get_media_key(meta_info)
+            meta_infos.append((meta_info, media_key))
+            if media_key not in search_keys and not self.meta.get_meta_data_by_key(media_key):
+                search_keys[media_key] = meta_info
+        # 并发查询缓存中没有的媒体信息
+        if search_keys:
+            log.info("【META】批量识别 %s 个名称，需查询TMDB %s 个媒体..." % (len(title_list), len(search_keys)))
+            with ThreadPoolExecutor(max_workers=min(TMDB_SEARCH_THREADS, len(search_keys))) as executor:
+                for media_key, meta_info in search_keys.items():
+                    executor.submit(self.__search_media_key, media_key, meta_info, mtype, strict)
+        # 按输入顺序赋值返回
+        ret_infos = []
+        for item in meta_infos:
+            if not item:
+                ret_infos.append(None)
+                continue
+            meta_info, media_key = item
+            meta_info.set_tmdb_info(self.meta.get_meta_data_by_key(media_key))
+            ret_infos.append(meta_info)
+        return ret_infos
+
+    @staticmethod
+    def __get_media_key(meta_info):
+        """
+        识别缓存的关键字：类型、名称、年份
+        """
+        return "[%s]%s-%s" % (meta_info.type.value, meta_info.get_name(), meta_info.year)
+
+    def __search_media_key(self, media_key, meta_info, mtype=None, strict=None):
+        """
+        根据识别出的名称、年份、类型检索TMDB，并将结果加入缓存
+        :param media_key: 缓存的关键字
+        :param meta_info: 已识别的MetaInfo对象
+        :param mtype: 指定的类型：电影、电视剧、动漫
+        :param strict: 是否严格模式，为true时，不会再去掉年份再查一次
+        """
+        try:
             if meta_info.type in [MediaType.TV, MediaType.ANIME]:
                 # 确定是电视剧或动漫，直接按电视剧查
                 file_media_info = self.__search_tmdb(meta_info.get_name(), meta_info.year, meta_info.type)
@@ -291,15 +415,16 @@ class Media:
                     # 不带年份查电影
                     if not file_media_info and not mtype:
                         file_media_info = self.__search_tmdb(meta_info.get_name(), None, MediaType.MOVIE)
-            # 加入缓存
-            if file_media_info:
-                self.meta.update_meta_data({media_key: file_media_info})
-            else:
-                # 标记为未找到，避免再次查询
-                self.meta.update_meta_data({media_key: {'id': 0}})
-        # 赋值返回
-        meta_info.set_tmdb_info(self.meta.get_meta_data_by_key(media_key))
-        return meta_info
+        except Exception as err:
+            log.error("【META】识别 %s 发生错误：%s - %s" % (meta_info.get_name(), str(err), traceback.format_exc()))
+            return None
+        # 加入缓存
+        if file_media_info:
+            self.meta.update_meta_data({media_key: file_media_info})
+        else:
+            # 标记为未找到，避免再次查询
+            self.meta.update_meta_data({media_key: {'id': 0}})
+        return file_media_info
 
     def get_media_info_on_files(self, file_list, tmdb_info=None, media_type=None, season=None):
         """
@@ -317,36 +442,30 @@ class Media:
         # 不是list的转为list
         if not isinstance(file_list, list):
             file_list = [file_list]
-        # 遍历每个文件，看得出来的名称是不是不一样，不一样的先搜索媒体信息
+        # 检查文件是否存在
+        exists_files = []
         for file_path in file_list:
+            if not os.path.exists(file_path):
+                log.warn("【META】%s 不存在" % file_path)
+                continue
+            exists_files.append(file_path)
+        # 没有自带TMDB信息时先批量识别文件名称，文件较多时使用多进程
+        if not tmdb_info:
+            file_metas = parse_files_meta(exists_files, self.__parse_workers)
+        else:
+            file_metas = [None] * len(exists_files)
+        # 遍历每个文件，看得出来的名称是不是不一样，不一样的先搜索媒体信息
+        for file_path, file_meta in zip(exists_files, file_metas):
             try:
-                if not os.path.exists(file_path):
-                    log.warn("【META】%s 不存在" % file_path)
-                    continue
-                # 解析媒体名称
-                # 先用自己的名称
-                file_name = os.path.basename(file_path)
-                parent_name = os.path.basename(os.path.dirname(file_path))
-                parent_parent_name = os.path.basename(os.path.dirname(os.path.dirname(file_path)))
                 # 没有自带TMDB信息
                 if not tmdb_info:
-                    # 识别
-                    meta_info = MetaInfo(file_name)
-                    # 识别不到则使用上级的名称
-                    if not meta_info.get_name() or not meta_info.year or meta_info.type == MediaType.UNKNOWN:
-                        parent_info = MetaInfo(parent_name)
-                        if not parent_info.get_name() or not parent_info.year:
-                            parent_info = MetaInfo(parent_parent_name)
-                        if not meta_info.get_name():
-                            meta_info.cn_name = parent_info.cn_name
-                            meta_info.en_name = parent_info.en_name
-                        if not meta_info.year:
-                            meta_info.year = parent_info.year
-                        if parent_info.type not in [MediaType.MOVIE, MediaType.UNKNOWN] and meta_info.type in [MediaType.MOVIE, MediaType.UNKNOWN]:
-                            meta_info.type = parent_info.type
+                    # 名称识别出错的文件跳过
+                    if not file_meta:
+                        continue
+                    meta_info = file_meta.to_meta_info()
                     if not meta_info.get_name():
                         continue
-                    media_key = "[%s]%s-%s" % (meta_info.type.value, meta_info.get_name(), meta_info.year)
+                    media_key = self.__get_media_key(meta_info)
                     if not self.meta.get_meta_data_by_key(media_key):
                         # 调用TMDB API
                         file_media_info = self.__search_tmdb(meta_info.get_name(), meta_info.year, meta_info.type)
@@ -363,7 +482,7 @@ class Media:
                     meta_info.set_tmdb_info(self.meta.get_meta_data_by_key(media_key))
                 # 自带TMDB信息
                 else:
-                    meta_info = MetaInfo(file_name, mtype=MediaType.ANIME)
+                    meta_info = MetaInfo(os.path.basename(file_path), mtype=MediaType.ANIME)
                     meta_info.set_tmdb_info(tmdb_info)
                     meta_info.type = media_type
                     if season and media_type != MediaType.MOVIE:
@@ -416,35 +535,45 @@ class Media:
 
     def get_tmdb_movie_info(self, tmdbid):
         """
-        获取电影的详情
+        获取电影的详情，优先使用缓存
         :param tmdbid: TMDB ID
         :return: TMDB信息
         """
         if not self.movie:
             return {}
-        try:
-            log.info("【META】正在查询TMDB：%s ..." % tmdbid)
-            tmdbinfo = self.movie.details(tmdbid)
-            return tmdbinfo
-        except Exception as e:
-            log.console(str(e))
-            return {}
+        return self.__get_tmdb_details("MOV", tmdbid, self.movie.details)
 
     def get_tmdb_tv_info(self, tmdbid):
         """
-        获取电视剧的详情
+        获取电视剧的详情，优先使用缓存
         :param tmdbid: TMDB ID
         :return: TMDB信息
         """
         if not self.tv:
             return {}
+        return self.__get_tmdb_details("TV", tmdbid, self.tv.details)
+
+    def __get_tmdb_details(self, mtype, tmdbid, details_func):
+        """
+        按类型、TMDB ID、语言查询详情缓存，未命中时查询TMDB并缓存
+        :param mtype: 详情类型：MOV、TV
+        :param tmdbid: TMDB ID
+        :param details_func: 查询TMDB详情的方法
+        """
+        if not tmdbid or not str(tmdbid).isdigit():
+            return {}
+        tmdbinfo = self.meta.get_tmdb_details(mtype, tmdbid, self.tmdb.language)
+        if tmdbinfo:
+            return tmdbinfo
         try:
             log.info("【META】正在查询TMDB：%s ..." % tmdbid)
-            tmdbinfo = self.tv.details(tmdbid)
-            return tmdbinfo
+            tmdbinfo = details_func(tmdbid)
         except Exception as e:
             log.console(str(e))
             return {}
+        if tmdbinfo:
+            self.meta.update_tmdb_details(mtype, tmdbid, self.tmdb.language, tmdbinfo)
+        return tmdbinfo
 
     def get_tmdb_seasons_info(self, tv_info=None, tmdbid=None):
         """
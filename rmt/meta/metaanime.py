@@ -9,6 +9,7 @@ class MetaAnime(MetaBase):
     """
     识别动漫
     """
+    __slots__ = ()
     _anime_no_words = ['CHS&CHT']
 
     def __init__(self, title, subtitle=None):
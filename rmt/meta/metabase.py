@@ -1,86 +1,149 @@
-from functools import lru_cache
-import requests
-from requests import RequestException
-
-import log
-from config import FANART_TV_API_URL, FANART_MOVIE_API_URL, ANIME_GENREIDS, Config
+from config import ANIME_GENREIDS
 from rmt.category import Category
+from rmt.fanart import Fanart
 from utils.types import MediaType
 
+# 识别结果中保留的TMDB字段，其它字段需要时通过load_tmdb_info查询
+TMDB_INFO_FIELDS = ('id', 'media_type', 'title', 'name', 'original_title', 'original_name',
+                    'release_date', 'first_air_date', 'genre_ids', 'poster_path', 'backdrop_path',
+                    'vote_average', 'overview', 'original_language', 'origin_country', 'production_countries')
+
 
 class MetaBase(object):
     """
     媒体信息基类
     """
-    proxies = None
-    category_handler = None
-    # 原字符串
-    org_string = None
-    # 副标题
-    subtitle = None
-    # 类型 电影、电视剧
-    type = None
-    # 识别的中文名
-    cn_name = None
-    # 识别的英文名
-    en_name = None
-    # 总季数
-    total_seasons = 0
-    # 识别的开始季 数字
-    begin_season = None
-    # 识别的结束季 数字
-    end_season = None
-    # 总集数
-    total_episodes = 0
-    # 识别的开始集
-    begin_episode = None
-    # 识别的结束集
-    end_episode = None
-    # Partx Cd Dvd Disk Disc
-    part = None
-    # 识别的资源类型
-    resource_type = None
-    # 识别的分辨率
-    resource_pix = None
-    # 二级分类
-    category = None
-    # TMDB ID
-    tmdb_id = 0
-    # 媒体标题
-    title = None
-    # 媒体原发行标题
-    original_title = None
-    # 媒体年份
-    year = None
-    # 封面图片
-    backdrop_path = None
-    poster_path = None
-    fanart_image = None
-    # 评分
-    vote_average = 0
-    # 描述
-    overview = None
-    # TMDB 的其它信息
-    tmdb_info = {}
-    # 种子附加信息
-    site = None
-    site_order = 0
-    enclosure = None
-    res_order = 0
-    size = 0
-    seeders = 0
-    peers = 0
-    description = None
+    __slots__ = (
+        # 原字符串
+        'org_string',
+        # 副标题
+        'subtitle',
+        # 类型 电影、电视剧
+        'type',
+        # 识别的中文名
+        'cn_name',
+        # 识别的英文名
+        'en_name',
+        # 总季数
+        'total_seasons',
+        # 识别的开始季 数字
+        'begin_season',
+        # 识别的结束季 数字
+        'end_season',
+        # 总集数
+        'total_episodes',
+        # 识别的开始集
+        'begin_episode',
+        # 识别的结束集
+        'end_episode',
+        # Partx Cd Dvd Disk Disc
+        'part',
+        # 识别的资源类型
+        'resource_type',
+        # 识别的分辨率
+        'resource_pix',
+        # 二级分类
+        'category',
+        # TMDB ID
+        'tmdb_id',
+        # 媒体标题
+        'title',
+        # 媒体原发行标题
+        'original_title',
+        # 媒体年份
+        'year',
+        # 封面图片
+        'backdrop_path',
+        'poster_path',
+        '_fanart_image',
+        # 评分
+        'vote_average',
+        # 描述
+        'overview',
+        # TMDB 的其它信息，只保留TMDB_INFO_FIELDS中的字段
+        '_tmdb_info',
+        # 种子附加信息
+        'site',
+        'site_order',
+        'enclosure',
+        'res_order',
+        'size',
+        'seeders',
+        'peers',
+        'description',
+    )
 
     def __init__(self, title, subtitle=None):
+        self.org_string = None
+        self.subtitle = None
+        self.type = None
+        self.cn_name = None
+        self.en_name = None
+        self.total_seasons = 0
+        self.begin_season = None
+        self.end_season = None
+        self.total_episodes = 0
+        self.begin_episode = None
+        self.end_episode = None
+        self.part = None
+        self.resource_type = None
+        self.resource_pix = None
+        self.category = None
+        self.tmdb_id = 0
+        self.title = None
+        self.original_title = None
+        self.year = None
+        self.backdrop_path = None
+        self.poster_path = None
+        self._fanart_image = None
+        self.vote_average = 0
+        self.overview = None
+        self._tmdb_info = {}
+        self.site = None
+        self.site_order = 0
+        self.enclosure = None
+        self.res_order = 0
+        self.size = 0
+        self.seeders = 0
+        self.peers = 0
+        self.description = None
         if not title:
             return
-        config = Config()
-        self.proxies = config.get_proxies()
-        self.category_handler = Category()
         self.org_string = title
         self.subtitle = subtitle
 
+    @property
+    def category_handler(self):
+        return Category()
+
+    @property
+    def fanart_image(self):
+        if self._fanart_image is None:
+            if not self.tmdb_id:
+                return ""
+            self._fanart_image = self.get_fanart_image(search_type=self.type, tmdbid=self.tmdb_id)
+        return self._fanart_image
+
+    @fanart_image.setter
+    def fanart_image(self, fanart_image):
+        self._fanart_image = fanart_image
+
+    @property
+    def tmdb_info(self):
+        return self._tmdb_info
+
+    def load_tmdb_info(self):
+        """
+        查询完整的TMDB信息，识别结果中只保留了TMDB_INFO_FIELDS中的字段
+        """
+        if not self.tmdb_id:
+            return {}
+        from rmt.media import Media
+        if self.type == MediaType.MOVIE:
+            return Media().get_tmdb_movie_info(self.tmdb_id)
+        else:
+            return Media().get_tmdb_tv_info(self.tmdb_id)
+
     def get_name(self):
         if self.cn_name:
             return self.cn_name
@@ -243,7 +306,7 @@ class MetaBase(object):
         self.tmdb_id = info.get('id')
         if not self.tmdb_id:
             return
-        self.tmdb_info = info
+        self._tmdb_info = {key: info.get(key) for key in TMDB_INFO_FIELDS if info.get(key) is not None}
         self.vote_average = info.get('vote_average')
         self.overview = info.get('overview')
         if self.type == MediaType.MOVIE:
@@ -264,7 +327,8 @@ class MetaBase(object):
             else:
                 self.category = self.category_handler.get_anime_category(info)
         self.poster_path = "https://image.tmdb.org/t/p/w500%s" % info.get('poster_path') if info.get('poster_path') else ""
-        self.fanart_image = self.get_fanart_image(search_type=self.type, tmdbid=info.get('id'))
+        # Fanart图片在需要时才查询
+        self._fanart_image = None
         self.backdrop_path = "https://image.tmdb.org/t/p/w500%s" % info.get('backdrop_path') if info.get('backdrop_path') else ""
 
     # 整合种了信息
@@ -287,30 +351,13 @@ class MetaBase(object):
         self.description = description
 
     # 获取消息媒体图片
-    # 增加cache，优化资源检索时性能
+    # 使用持久化缓存，优化资源检索时性能
     @classmethod
-    @lru_cache(maxsize=256)
     def get_fanart_image(cls, search_type, tmdbid, default=None):
-        if not search_type:
-            return ""
-        if tmdbid:
-            if search_type == MediaType.MOVIE:
-                image_url = FANART_MOVIE_API_URL % tmdbid
-            else:
-                image_url = FANART_TV_API_URL % tmdbid
-            try:
-                ret = requests.get(image_url, timeout=10, proxies=cls.proxies)
-                if ret:
-                    moviethumbs = ret.json().get('moviethumb')
-                    if moviethumbs:
-                        moviethumb = moviethumbs[0].get('url')
-                        if moviethumb:
-                            # 有则返回FanArt的图片
-                            return moviethumb
-            except RequestException as e1:
-                log.console(str(e1))
-            except Exception as e2:
-                log.console(str(e2))
+        image_url = Fanart().get_image(search_type, tmdbid)
+        if image_url:
+            # 有则返回FanArt的图片
+            return image_url
         if default:
             # 返回一个默认图片
             return default
@@ -1,6 +1,10 @@
 import re
+from collections import OrderedDict
+from functools import lru_cache
+from threading import Lock
+
 import cn2an
-from config import RMT_MEDIAEXT
+from config import RMT_MEDIAEXT, METAINFO_PARSE_CACHE_SIZE
 from rmt.meta.metabase import MetaBase
 from utils.functions import is_chinese
 from utils.tokens import Tokens
@@ -12,43 +16,89 @@ class MetaVideo(MetaBase):
     识别电影、电视剧
     """
     # 控制标位区
-    _stop_name_flag = False
-    _last_token = ""
-    _last_token_type = ""
-    _continue_flag = True
-    _unknown_name_str = ""
-    _subtitle_flag = False
-    # 正则式区
-    _season_re = r"S(\d{2})|^S(\d{1,2})"
-    _episode_re = r"EP?(\d{2,4})|^EP?(\d{1,4})"
-    _part_re = r"(^PART[1-9]?$|^CD[1-9]?$|^DVD[1-9]?$|^DISK[1-9]?$|^DISC[1-9]?$)"
-    _resources_type_re = r"^BLURAY$|^REMUX$|^HDTV$|^HDDVD$|^WEBRIP$|^DVDRIP$|^BDRIP$|^UHD$|^SDR$|^HDR$|^DOLBY$|^BLU$|^WEB$|^BD$"
-    _name_no_begin_re = r"^\[.+?]"
+    __slots__ = ('_stop_name_flag', '_last_token', '_last_token_type',
+                 '_continue_flag', '_unknown_name_str', '_subtitle_flag')
+    # 正则式区，预编译避免每个token重复编译
+    _season_re = re.compile(r"S(\d{2})|^S(\d{1,2})", re.IGNORECASE)
+    _episode_re = re.compile(r"EP?(\d{2,4})|^EP?(\d{1,4})", re.IGNORECASE)
+    _part_re = re.compile(r"(^PART[1-9]?$|^CD[1-9]?$|^DVD[1-9]?$|^DISK[1-9]?$|^DISC[1-9]?$)", re.IGNORECASE)
+    _resources_type_re = re.compile(r"(^BLURAY$|^REMUX$|^HDTV$|^HDDVD$|^WEBRIP$|^DVDRIP$|^BDRIP$|^UHD$|^SDR$|^HDR$|^DOLBY$|^BLU$|^WEB$|^BD$)",
+                                    re.IGNORECASE)
+    _name_no_begin_re = re.compile(r"^\[.+?]")
+    _name_year_range_re = re.compile(r"[\s.]+(\d{4})-(\d{4})")
     _name_se_words = ['共', '第', '季', '集', '话', '話']
-    _name_nostring_re = r"^JADE|^AOD|^[A-Z]{1,4}TV[\-0-9UVHDK]*|HBO|\d{1,2}th|NETFLIX|IMAX|^CHC|^3D|\s+3D|^BBC|DISNEY\+|XXX" \
-                        r"|[第\s共]+[0-9一二三四五六七八九十\-\s]+季" \
-                        r"|[第\s共]+[0-9一二三四五六七八九十\-\s]+[集话話]" \
-                        r"|S\d{2}\s*-\s*S\d{2}|S\d{2}|\s+S\d{1,2}|EP?\d{2,4}\s*-\s*EP?\d{2,4}|EP?\d{2,4}|\s+EP?\d{1,4}" \
-                        r"|连载|日剧|美剧|电视剧|电影|动画片|动漫|欧美|西德|日韩|超高清|高清|蓝光|翡翠台" \
-                        r"|最终季|合集|[中国英葡法俄日韩德意西印泰台港粤双文语简繁体特效内封官译外挂]+字幕" \
-                        r"|未删减版|UNCUT|UNRATE|WITH EXTRAS|RERIP|SUBBED|PROPER|REPACK|SEASON[\s.]+|EPISODE[\s.]+" \
-                        r"|PART[\s.]*[1-9]|CD[\s.]*[1-9]|DVD[\s.]*[1-9]|DISK[\s.]*[1-9]|DISC[\s.]*[1-9]" \
-                        r"|[248]K|\d{3,4}[PIX]+"
-    _resources_pix_re = r"^[SBUHD]*(\d{3,4}[PIX]+)"
-    _resources_pix_re2 = r"(^[248]+K)"
-    _subtitle_season_re = r"[第\s]+([0-9一二三四五六七八九十\-]+)\s*季"
-    _subtitle_season_all_re = r"全\s*([0-9一二三四五六七八九十]+)\s*季|([0-9一二三四五六七八九十]+)\s*季全"
-    _subtitle_episode_re = r"[第\s]+([0-9一二三四五六七八九十\-]+)\s*[集话話]"
-    _subtitle_episode_all_re = r"([0-9一二三四五六七八九十]+)\s*集全|全\s*([0-9一二三四五六七八九十]+)\s*集"
+    _name_nostring_re = re.compile(r"^JADE|^AOD|^[A-Z]{1,4}TV[\-0-9UVHDK]*|HBO|\d{1,2}th|NETFLIX|IMAX|^CHC|^3D|\s+3D|^BBC|DISNEY\+|XXX"
+                                   r"|[第\s共]+[0-9一二三四五六七八九十\-\s]+季"
+                                   r"|[第\s共]+[0-9一二三四五六七八九十\-\s]+[集话話]"
+                                   r"|S\d{2}\s*-\s*S\d{2}|S\d{2}|\s+S\d{1,2}|EP?\d{2,4}\s*-\s*EP?\d{2,4}|EP?\d{2,4}|\s+EP?\d{1,4}"
+                                   r"|连载|日剧|美剧|电视剧|电影|动画片|动漫|欧美|西德|日韩|超高清|高清|蓝光|翡翠台"
+                                   r"|最终季|合集|[中国英葡法俄日韩德意西印泰台港粤双文语简繁体特效内封官译外挂]+字幕"
+                                   r"|未删减版|UNCUT|UNRATE|WITH EXTRAS|RERIP|SUBBED|PROPER|REPACK|SEASON[\s.]+|EPISODE[\s.]+"
+                                   r"|PART[\s.]*[1-9]|CD[\s.]*[1-9]|DVD[\s.]*[1-9]|DISK[\s.]*[1-9]|DISC[\s.]*[1-9]"
+                                   r"|[248]K|\d{3,4}[PIX]+", re.IGNORECASE)
+    _spaces_re = re.compile(r"\s+")
+    _resources_pix_re = re.compile(r"^[SBUHD]*(\d{3,4}[PIX]+)", re.IGNORECASE)
+    _resources_pix_re2 = re.compile(r"(^[248]+K)", re.IGNORECASE)
+    _subtitle_flag_re = re.compile(r"[全第季集话話]")
+    _subtitle_season_re = re.compile(r"[第\s]+([0-9一二三四五六七八九十\-]+)\s*季", re.IGNORECASE)
+    _subtitle_season_all_re = re.compile(r"全\s*([0-9一二三四五六七八九十]+)\s*季|([0-9一二三四五六七八九十]+)\s*季全", re.IGNORECASE)
+    _subtitle_episode_re = re.compile(r"[第\s]+([0-9一二三四五六七八九十\-]+)\s*[集话話]", re.IGNORECASE)
+    _subtitle_episode_all_re = re.compile(r"([0-9一二三四五六七八九十]+)\s*集全|全\s*([0-9一二三四五六七八九十]+)\s*集", re.IGNORECASE)
+    # 可能是Part、分辨率、季、集、资源类型的token，其它非数字token只可能是名称
+    _token_special_re = re.compile("|".join([_part_re.pattern,
+                                             _resources_pix_re.pattern,
+                                             _resources_pix_re2.pattern,
+                                             _season_re.pattern,
+                                             _episode_re.pattern,
+                                             _resources_type_re.pattern]), re.IGNORECASE)
+    _token_special_words = ['3D', 'SEASON', 'EPISODE', 'DL', 'RAY']
+    # 识别结果缓存，相同的名称不重复识别
+    _parsed_fields = ['type', 'cn_name', 'en_name', 'year', 'part', 'resource_type', 'resource_pix',
+                      'total_seasons', 'begin_season', 'end_season',
+                      'total_episodes', 'begin_episode', 'end_episode']
+    _parsed_cache = OrderedDict()
+    _parsed_cache_lock = Lock()
 
     def __init__(self, title, subtitle=None):
         super().__init__(title, subtitle)
         if not title:
             return
+        cache_key = (title, subtitle)
+        with self._parsed_cache_lock:
+            parsed = self._parsed_cache.get(cache_key)
+            if parsed:
+                self._parsed_cache.move_to_end(cache_key)
+        if parsed:
+            for field, value in zip(self._parsed_fields, parsed):
+                setattr(self, field, value)
+            return
+        self.__parse(title, subtitle)
+        with self._parsed_cache_lock:
+            self._parsed_cache[cache_key] = tuple(getattr(self, field) for field in self._parsed_fields)
+            while len(self._parsed_cache) > METAINFO_PARSE_CACHE_SIZE:
+                self._parsed_cache.popitem(last=False)
+
+    @classmethod
+    @lru_cache(maxsize=1024)
+    def _is_special_token(cls, token):
+        """
+        token分类：数字或者可能是Part、分辨率、季、集、资源类型的返回True，只可能是名称的返回False
+        """
+        if token.isdigit() or token.upper() in cls._token_special_words:
+            return True
+        return True if cls._token_special_re.search(token) else False
+
+    def __parse(self, title, subtitle=None):
+        self._stop_name_flag = False
+        self._last_token = ""
+        self._last_token_type = ""
+        self._continue_flag = True
+        self._unknown_name_str = ""
+        self._subtitle_flag = False
         # 去掉名称中第1个[]的内容
-        title = re.sub(r'%s' % self._name_no_begin_re, "", title, count=1)
+        title = self._name_no_begin_re.sub("", title, count=1)
         # 把xxxx-xxxx年份换成前一个年份，常出现在季集上
-        title = re.sub(r'[\s.]+(\d{4})-(\d{4})', r'\1', title)
+        title = self._name_year_range_re.sub(r'\1', title)
         # 拆分tokens
         tokens = Tokens(title)
         # 解析名称、年份、季、集、资源类型、分辨率等
@@ -56,6 +106,9 @@ class MetaVideo(MetaBase):
         while token:
             # 标题
             self.__init_name(token)
+            # 只可能是名称的token不需要再解析
+            if not self._is_special_token(token):
+                self._continue_flag = False
             # Part
             if self._continue_flag:
                 self.__init_part(token)
@@ -86,9 +139,8 @@ class MetaVideo(MetaBase):
             self.type = MediaType.MOVIE
         # 去掉名字中不需要的干扰字符，过短的纯数字不要
         if self.cn_name:
-            self.cn_name = re.sub(r'%s' % self._name_nostring_re, '', self.cn_name,
-                                  flags=re.IGNORECASE).strip()
-            self.cn_name = re.sub(r'\s+', ' ', self.cn_name)
+            self.cn_name = self._name_nostring_re.sub('', self.cn_name).strip()
+            self.cn_name = self._spaces_re.sub(' ', self.cn_name)
             if self.cn_name.isdigit() and int(self.cn_name) < 1800:
                 if self.begin_episode is None:
                     self.begin_episode = int(self.cn_name)
@@ -96,9 +148,8 @@ class MetaVideo(MetaBase):
                 elif self.is_in_episode(int(self.cn_name)):
                     self.cn_name = None
         if self.en_name:
-            self.en_name = re.sub(r'%s' % self._name_nostring_re, '', self.en_name,
-                                  flags=re.IGNORECASE).strip()
-            self.en_name = re.sub(r'\s+', ' ', self.en_name)
+            self.en_name = self._name_nostring_re.sub('', self.en_name).strip()
+            self.en_name = self._spaces_re.sub(' ', self.en_name)
             if self.en_name.isdigit() and int(self.en_name) < 1800:
                 if self.begin_episode is None:
                     self.begin_episode = int(self.en_name)
@@ -171,7 +222,7 @@ class MetaVideo(MetaBase):
     def __init_part(self, token):
         if not self.get_name():
             return
-        re_res = re.search(r"%s" % self._part_re, token, re.IGNORECASE)
+        re_res = self._part_re.search(token)
         if re_res:
             self._last_token_type = "part"
             self._continue_flag = False
@@ -203,7 +254,7 @@ class MetaVideo(MetaBase):
     def __init_resource_pix(self, token):
         if not self.get_name():
             return
-        re_res = re.search(r"%s" % self._resources_pix_re, token, re.IGNORECASE)
+        re_res = self._resources_pix_re.search(token)
         if re_res:
             self._last_token_type = "pix"
             self._continue_flag = False
@@ -213,7 +264,7 @@ class MetaVideo(MetaBase):
             elif self.resource_pix == "3D":
                 self.resource_pix = "%s 3D" % re_res.group(1).lower()
         else:
-            re_res = re.search(r"%s" % self._resources_pix_re2, token, re.IGNORECASE)
+            re_res = self._resources_pix_re2.search(token)
             if re_res:
                 self._last_token_type = "pix"
                 self._continue_flag = False
@@ -234,7 +285,7 @@ class MetaVideo(MetaBase):
     def __init_seasion(self, token):
         if not self.get_name():
             return
-        re_res = re.findall(r"%s" % self._season_re, token, re.IGNORECASE)
+        re_res = self._season_re.findall(token)
         if re_res:
             self._last_token_type = "season"
             self.type = MediaType.TV
@@ -284,7 +335,7 @@ class MetaVideo(MetaBase):
     def __init_episode(self, token):
         if not self.get_name():
             return
-        re_res = re.findall(r"%s" % self._episode_re, token, re.IGNORECASE)
+        re_res = self._episode_re.findall(token)
         if re_res:
             self._last_token_type = "episode"
             self._continue_flag = False
@@ -343,7 +394,7 @@ class MetaVideo(MetaBase):
     def __init_resource_type(self, token):
         if not self.get_name():
             return
-        re_res = re.search(r"(%s)" % self._resources_type_re, token, re.IGNORECASE)
+        re_res = self._resources_type_re.search(token)
         if re_res:
             self._last_token_type = "restype"
             self._continue_flag = False
@@ -369,9 +420,9 @@ class MetaVideo(MetaBase):
     def __init_subtitle(self, title_text):
         if not title_text:
             return
-        if re.search(r'[全第季集话話]', title_text, re.IGNORECASE):
+        if self._subtitle_flag_re.search(title_text):
             # 第x季
-            season_str = re.search(r'%s' % self._subtitle_season_re, title_text, re.IGNORECASE)
+            season_str = self._subtitle_season_re.search(title_text)
             if season_str:
                 seasons = season_str.group(1)
                 if seasons:
@@ -395,7 +446,7 @@ class MetaVideo(MetaBase):
                 self.type = MediaType.TV
                 self._subtitle_flag = True
             # 第x集
-            episode_str = re.search(r'%s' % self._subtitle_episode_re, title_text, re.IGNORECASE)
+            episode_str = self._subtitle_episode_re.search(title_text)
             if episode_str:
                 episodes = episode_str.group(1)
                 if episodes:
@@ -419,13 +470,13 @@ class MetaVideo(MetaBase):
                 self.type = MediaType.TV
                 self._subtitle_flag = True
             # x集全
-            episode_all_str = re.search(r'%s' % self._subtitle_episode_all_re, title_text, re.IGNORECASE)
+            episode_all_str = self._subtitle_episode_all_re.search(title_text)
             if episode_all_str:
                 self.begin_episode = None
                 self.end_episode = None
                 self.total_episodes = 0
             # 全x季 x季全
-            season_all_str = re.search(r"%s" % self._subtitle_season_all_re, title_text, re.IGNORECASE)
+            season_all_str = self._subtitle_season_all_re.search(title_text)
             if season_all_str:
                 season_all = season_all_str.group(1)
                 if not season_all:
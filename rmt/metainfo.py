@@ -1,9 +1,17 @@
+import multiprocessing
+import os
 import re
+from concurrent.futures.process import ProcessPoolExecutor
 
+import log
+from config import METAINFO_PARSE_PROCESS_MIN
+from rmt.meta.metabase import MetaBase
 from rmt.meta.metaanime import MetaAnime
 from rmt.meta.metavideo import MetaVideo
 from utils.types import MediaType
 
+ANIME_RE = re.compile(r'\[[0-9XVPI-]+]|\s+-\s+\d{1,4}\s+', re.IGNORECASE)
+
 
 def MetaInfo(title, subtitle=None, mtype=None):
     """
@@ -27,8 +35,76 @@ def is_anime(name):
     """
     if not name:
         return False
-    if re.search(r'\[[0-9XVPI-]+]', name, re.IGNORECASE):
-        return True
-    if re.search(r'\s+-\s+\d{1,4}\s+', name, re.IGNORECASE):
-        return True
-    return False
+    return True if ANIME_RE.search(name) else False
+
+
+class MetaParseResult(object):
+    """
+    文件名识别结果，只保存名称识别出的字段，用于在识别进程与主进程之间传递
+    """
+    __slots__ = ('anime', 'org_string', 'subtitle', 'type', 'cn_name', 'en_name', 'year', 'part',
+                 'resource_type', 'resource_pix', 'total_seasons', 'begin_season', 'end_season',
+                 'total_episodes', 'begin_episode', 'end_episode')
+
+    def __init__(self, meta_info):
+        self.anime = isinstance(meta_info, MetaAnime)
+        for field in self.__slots__[1:]:
+            setattr(self, field, getattr(meta_info, field))
+
+    def to_meta_info(self):
+        """
+        还原为MetaAnime、MetaVideo对象，不再重新识别
+        """
+        meta_info = object.__new__(MetaAnime if self.anime else MetaVideo)
+        MetaBase.__init__(meta_info, self.org_string, self.subtitle)
+        for field in self.__slots__[3:]:
+            setattr(meta_info, field, getattr(self, field))
+        return meta_info
+
+
+def parse_file_meta(file_path):
+    """
+    识别文件名称，识别不到名称、年份或类型时使用上级、上上级目录的名称补充
+    :param file_path: 文件路径
+    :return: MetaParseResult，识别出错时返回None
+    """
+    try:
+        meta_info = MetaInfo(os.path.basename(file_path))
+        if not meta_info.get_name() or not meta_info.year or meta_info.type == MediaType.UNKNOWN:
+            parent_info = MetaInfo(os.path.basename(os.path.dirname(file_path)))
+            if not parent_info.get_name() or not parent_info.year:
+                parent_info = MetaInfo(os.path.basename(os.path.dirname(os.path.dirname(file_path))))
+            if not meta_info.get_name():
+                meta_info.cn_name = parent_info.cn_name
+                meta_info.en_name = parent_info.en_name
+            if not meta_info.year:
+                meta_info.year = parent_info.year
+            if parent_info.type not in [MediaType.MOVIE, MediaType.UNKNOWN] and meta_info.type in [MediaType.MOVIE, MediaType.UNKNOWN]:
+                meta_info.type = parent_info.type
+        return MetaParseResult(meta_info)
+    except Exception as err:
+        log.error("【META】%s 名称识别出错：%s" % (file_path, str(err)))
+        return None
+
+
+def parse_files_meta(file_list, workers=None):
+    """
+    批量识别文件名称，文件数量较多时使用多进程识别
+    :param file_list: 文件路径列表
+    :param workers: 识别进程数，为空时使用CPU核数，为1时不使用多进程
+    :return: 与file_list顺序一致的MetaParseResult列表，识别出错的文件为None
+    """
+    if not file_list:
+        return []
+    workers = min(workers or os.cpu_count() or 1, len(file_list) // METAINFO_PARSE_PROCESS_MIN)
+    if workers > 1:
+        try:
+            # 使用spawn启动识别进程，避免fork时复制其它线程持有的锁
+            with ProcessPoolExecutor(max_workers=workers,
+                                     mp_context=multiprocessing.get_context("spawn")) as executor:
+                return list(executor.map(parse_file_meta,
+                                         file_list,
+                                         chunksize=max(1, len(file_list) // (workers * 4))))
+        except Exception as e:
+            log.warn("【META】多进程识别出错，转为单进程识别：%s" % str(e))
+    return [parse_file_meta(file_path) for file_path in file_list]
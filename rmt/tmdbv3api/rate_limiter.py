@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+
+class TokenBucket(object):
+    """
+    Process wide token bucket, refilled over time and corrected by the
+    X-RateLimit-* headers returned by TMDb.
+    """
+
+    def __init__(self, capacity=40, period=10):
+        self._capacity = capacity
+        self._period = period
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._blocked_until = 0
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            float(self._capacity),
+            self._tokens + (now - self._updated) * self._capacity / self._period,
+        )
+        self._updated = now
+
+    def acquire(self, wait=True):
+        """
+        Take one token.
+        :param wait: block until a token is available, otherwise return at once
+        :return: 0 when a token was taken, else the seconds to wait for the next one
+        """
+        while True:
+            with self._lock:
+                self._refill()
+                delay = self._blocked_until - time.time()
+                if delay <= 0:
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return 0
+                    delay = (1 - self._tokens) * self._period / self._capacity
+            if not wait:
+                return delay
+            time.sleep(delay)
+
+    def update(self, headers):
+        """
+        Sync the bucket with the rate limit headers of a response.
+        :param headers: response headers
+        """
+        limit = headers.get("X-RateLimit-Limit")
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+        with self._lock:
+            if limit and str(limit).isdigit() and int(limit) > 0:
+                self._capacity = int(limit)
+            if remaining is not None and str(remaining).isdigit():
+                self._tokens = min(self._tokens, float(remaining))
+                if int(remaining) < 1 and reset and str(reset).isdigit():
+                    self._blocked_until = max(self._blocked_until, int(reset))
+
+    def block(self, seconds):
+        """
+        Stop handing out tokens for the given seconds, e.g. from Retry-After.
+        """
+        with self._lock:
+            self._tokens = 0
+            self._blocked_until = max(self._blocked_until, time.time() + seconds)
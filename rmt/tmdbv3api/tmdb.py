@@ -1,14 +1,19 @@
 # -*- coding: utf-8 -*-
 
+import asyncio
+import functools
 import logging
-import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 import requests.exceptions
+from requests.adapters import HTTPAdapter
 
 from .as_obj import AsObj
 from .exceptions import TMDbException
+from .rate_limiter import TokenBucket
 
 from functools import lru_cache
 
@@ -23,93 +28,117 @@ class TMDb(object):
     TMDB_CACHE_ENABLED = "TMDB_CACHE_ENABLED"
     TMDB_PROXIES = "TMDB_PROXIES"
     REQUEST_CACHE_MAXSIZE = 256
+    REQUEST_POOL_SIZE = 10
+    REQUEST_TIMEOUT = 20
+    REQUEST_RETRIES = 3
+
+    # Settings shared by every TMDb object of the process
+    _settings = {
+        TMDB_API_KEY: None,
+        TMDB_LANGUAGE: "en-US",
+        TMDB_WAIT_ON_RATE_LIMIT: True,
+        TMDB_DEBUG_ENABLED: False,
+        TMDB_CACHE_ENABLED: True,
+        TMDB_PROXIES: None,
+    }
+    # Paging info of the last call, kept per thread
+    _local = threading.local()
+    _pool_lock = threading.Lock()
+    _pooled_session = None
+    _executor = None
+    _rate_limiter = TokenBucket()
 
     def __init__(self, obj_cached=True, session=None):
-        self._session = requests.Session() if session is None else session
+        self._session = self._get_session() if session is None else session
         self._base = "https://api.themoviedb.org/3"
-        self._remaining = 40
-        self._reset = None
         self.obj_cached = obj_cached
-        if os.environ.get(self.TMDB_LANGUAGE) is None:
-            os.environ[self.TMDB_LANGUAGE] = "en-US"
+
+    @classmethod
+    def _get_session(cls):
+        """
+        One keep-alive session per process, shared by all threads.
+        """
+        if cls._pooled_session is None:
+            with cls._pool_lock:
+                if TMDb._pooled_session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=cls.REQUEST_POOL_SIZE,
+                                          pool_maxsize=cls.REQUEST_POOL_SIZE)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    TMDb._pooled_session = session
+        return TMDb._pooled_session
+
+    @classmethod
+    def _get_executor(cls):
+        if cls._executor is None:
+            with cls._pool_lock:
+                if TMDb._executor is None:
+                    TMDb._executor = ThreadPoolExecutor(max_workers=cls.REQUEST_POOL_SIZE,
+                                                        thread_name_prefix="tmdb")
+        return TMDb._executor
 
     @property
     def page(self):
-        return os.environ["page"]
+        return getattr(self._local, "page", None)
 
     @property
     def total_results(self):
-        return os.environ["total_results"]
+        return getattr(self._local, "total_results", None)
 
     @property
     def total_pages(self):
-        return os.environ["total_pages"]
+        return getattr(self._local, "total_pages", None)
 
     @property
     def api_key(self):
-        return os.environ.get(self.TMDB_API_KEY)
+        return self._settings.get(self.TMDB_API_KEY)
 
     @property
     def proxies(self):
-        return os.environ.get(self.TMDB_PROXIES)
+        return self._settings.get(self.TMDB_PROXIES)
 
     @proxies.setter
     def proxies(self, proxies):
         if proxies:
-            proxies_strs = []
-            for key, value in proxies.items():
-                if not value:
-                    continue
-                proxies_strs.append("'%s': '%s'" % (key, value))
-            if proxies_strs:
-                os.environ[self.TMDB_PROXIES] = "{%s}" % ",".join(proxies_strs)
-            else:
-                os.environ[self.TMDB_PROXIES] = 'None'
+            proxies = tuple((key, value) for key, value in proxies.items() if value)
+        self._settings[self.TMDB_PROXIES] = proxies or None
 
     @api_key.setter
     def api_key(self, api_key):
-        os.environ[self.TMDB_API_KEY] = str(api_key)
+        self._settings[self.TMDB_API_KEY] = str(api_key)
 
     @property
     def language(self):
-        return os.environ.get(self.TMDB_LANGUAGE)
+        return self._settings.get(self.TMDB_LANGUAGE)
 
     @language.setter
     def language(self, language):
-        os.environ[self.TMDB_LANGUAGE] = language
+        self._settings[self.TMDB_LANGUAGE] = language
 
     @property
     def wait_on_rate_limit(self):
-        if os.environ.get(self.TMDB_WAIT_ON_RATE_LIMIT) == "False":
-            return False
-        else:
-            return True
+        return self._settings.get(self.TMDB_WAIT_ON_RATE_LIMIT)
 
     @wait_on_rate_limit.setter
     def wait_on_rate_limit(self, wait_on_rate_limit):
-        os.environ[self.TMDB_WAIT_ON_RATE_LIMIT] = str(wait_on_rate_limit)
+        self._settings[self.TMDB_WAIT_ON_RATE_LIMIT] = bool(wait_on_rate_limit)
 
     @property
     def debug(self):
-        if os.environ.get(self.TMDB_DEBUG_ENABLED) == "True":
-            return True
-        else:
-            return False
+        return self._settings.get(self.TMDB_DEBUG_ENABLED)
 
     @debug.setter
     def debug(self, debug):
-        os.environ[self.TMDB_DEBUG_ENABLED] = str(debug)
+        self._settings[self.TMDB_DEBUG_ENABLED] = bool(debug)
 
     @property
     def cache(self):
-        if os.environ.get(self.TMDB_CACHE_ENABLED) == "False":
-            return False
-        else:
-            return True
+        return self._settings.get(self.TMDB_CACHE_ENABLED)
 
     @cache.setter
     def cache(self, cache):
-        os.environ[self.TMDB_CACHE_ENABLED] = str(cache)
+        self._settings[self.TMDB_CACHE_ENABLED] = bool(cache)
 
     @staticmethod
     def _get_obj(result, key="results", all_details=False):
@@ -123,61 +152,81 @@ class TMDb(object):
     @staticmethod
     @lru_cache(maxsize=REQUEST_CACHE_MAXSIZE)
     def cached_request(method, url, data, proxies):
-        return requests.request(method, url, data=data, proxies=eval(proxies))
+        return TMDb._request(method, url, data, proxies)
 
     def cache_clear(self):
         return self.cached_request.cache_clear()
 
+    @classmethod
+    def _request(cls, method, url, data, proxies):
+        """
+        Send one request through the pooled session, honouring the shared
+        token bucket and retrying on 429 / connection errors.
+        :return: the decoded json of the response
+        """
+        wait = cls._settings.get(cls.TMDB_WAIT_ON_RATE_LIMIT)
+        retries = 0
+        while True:
+            delay = cls._rate_limiter.acquire(wait=wait)
+            if delay:
+                raise TMDbException(
+                    "Rate limit reached. Try again in %d seconds." % delay
+                )
+            try:
+                req = cls._get_session().request(method,
+                                                 url,
+                                                 data=data,
+                                                 proxies=dict(proxies) if proxies else None,
+                                                 timeout=cls.REQUEST_TIMEOUT)
+            except requests.exceptions.RequestException:
+                retries += 1
+                if retries >= cls.REQUEST_RETRIES:
+                    raise
+                time.sleep(2 ** retries)
+                continue
+            cls._rate_limiter.update(req.headers)
+            if req.status_code == 429 and retries < cls.REQUEST_RETRIES:
+                retries += 1
+                retry_after = req.headers.get("Retry-After")
+                sleep_time = int(retry_after) if retry_after and retry_after.isdigit() else 2 ** retries
+                logger.warning("Rate limit reached. Sleeping for: %d" % sleep_time)
+                cls._rate_limiter.block(sleep_time)
+                if not wait:
+                    raise TMDbException(
+                        "Rate limit reached. Try again in %d seconds." % sleep_time
+                    )
+                continue
+            return req.json()
+
     def _call(
             self, action, append_to_response, call_cached=True, method="GET", data=None
     ):
         if self.api_key is None or self.api_key == "":
             raise TMDbException("No API key found.")
 
-        url = "%s%s?api_key=%s&%s&language=%s" % (
+        url = "%s%s?api_key=%s&%s" % (
             self._base,
             action,
             self.api_key,
             append_to_response,
-            self.language,
         )
+        # A language passed in the query of this call wins over the default one
+        if ("&%s" % append_to_response).find("&language=") == -1:
+            url = "%s&language=%s" % (url, self.language)
 
         if self.cache and self.obj_cached and call_cached and method != "POST":
-            req = self.cached_request(method, url, data, self.proxies)
+            json = self.cached_request(method, url, data, self.proxies)
         else:
-            req = self._session.request(method, url, data=data, proxies=eval(self.proxies))
-
-        headers = req.headers
-
-        if "X-RateLimit-Remaining" in headers:
-            self._remaining = int(headers["X-RateLimit-Remaining"])
-
-        if "X-RateLimit-Reset" in headers:
-            self._reset = int(headers["X-RateLimit-Reset"])
-
-        if self._remaining < 1:
-            current_time = int(time.time())
-            sleep_time = self._reset - current_time
-
-            if self.wait_on_rate_limit:
-                logger.warning("Rate limit reached. Sleeping for: %d" % sleep_time)
-                time.sleep(abs(sleep_time))
-                self._call(action, append_to_response, call_cached, method, data)
-            else:
-                raise TMDbException(
-                    "Rate limit reached. Try again in %d seconds." % sleep_time
-                )
-
-        json = req.json()
+            json = self._request(method, url, data, self.proxies)
 
         if "page" in json:
-            os.environ["page"] = str(json["page"])
+            self._local.page = json["page"]
 
         if "total_results" in json:
-            os.environ["total_results"] = str(json["total_results"])
+            self._local.total_results = json["total_results"]
 
         if "total_pages" in json:
-            os.environ["total_pages"] = str(json["total_pages"])
+            self._local.total_pages = json["total_pages"]
 
         if self.debug:
             logger.info(json)
@@ -187,3 +236,27 @@ class TMDb(object):
             raise TMDbException(json["errors"])
 
         return json
+
+    @classmethod
+    async def async_call(cls, func, *args, **kwargs):
+        """
+        Run a blocking TMDb call on the shared request pool so it can be awaited.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(cls._get_executor(), functools.partial(func, *args, **kwargs))
+
+    @classmethod
+    def gather(cls, calls):
+        """
+        Run many TMDb calls concurrently.
+        :param calls: list of (func, args) tuples
+        :return: results in the same order as calls, exceptions are returned in place
+        """
+        if not calls:
+            return []
+
+        async def _gather():
+            return await asyncio.gather(*[cls.async_call(func, *args) for func, args in calls],
+                                        return_exceptions=True)
+
+        return asyncio.run(_gather())
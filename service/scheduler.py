@@ -1,7 +1,12 @@
+from datetime import datetime
+
 from apscheduler.schedulers.background import BackgroundScheduler
 import log
 from config import AUTO_REMOVE_TORRENTS_INTERVAL, PT_TRANSFER_INTERVAL, Config, METAINFO_SAVE_INTERVAL, \
-    RELOAD_CONFIG_INTERVAL, SYNC_TRANSFER_INTERVAL, RSS_SEARCH_INTERVAL
+    RELOAD_CONFIG_INTERVAL, SYNC_TRANSFER_INTERVAL, RSS_SEARCH_INTERVAL, PT_SITE_DATA_INTERVAL, \
+    LIBRARY_INDEX_INTERVAL
+from pt.sites import Sites
+from rmt.library_index import LibraryIndex
 from service.sync import Sync
 from service.tasks.autoremove_torrents import AutoRemoveTorrents
 from service.tasks.douban_sync import DoubanSync
@@ -71,6 +76,13 @@ class Scheduler:
                                                hours=hours)
                         log.info("【RUN】scheduler.pt_signin启动...")
 
+            # PT站流量数据刷新，启动时立即执行一次
+            self.SCHEDULER.add_job(Sites().run_schedule,
+                                   'interval',
+                                   seconds=PT_SITE_DATA_INTERVAL,
+                                   next_run_time=datetime.now().astimezone())
+            log.info("【RUN】scheduler.pt_sites_data启动...")
+
             # PT文件转移
             pt_monitor = self.__pt.get('pt_monitor')
             if pt_monitor:
@@ -122,6 +134,12 @@ class Scheduler:
         # RSS队列中检索
         self.SCHEDULER.add_job(RssSearch().run_schedule, 'interval', seconds=RSS_SEARCH_INTERVAL)
 
+        # 媒体库索引校对，启动时立即执行一次
+        self.SCHEDULER.add_job(LibraryIndex().refresh,
+                               'interval',
+                               seconds=LIBRARY_INDEX_INTERVAL,
+                               next_run_time=datetime.now().astimezone())
+
         self.SCHEDULER.print_jobs()
 
         self.SCHEDULER.start()
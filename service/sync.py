@@ -1,16 +1,25 @@
 import os
 import threading
+import time
+from collections import OrderedDict
+from concurrent.futures.thread import ThreadPoolExecutor
+
 from watchdog.observers import Observer
 from watchdog.observers.polling import PollingObserver
-from config import RMT_MEDIAEXT, Config
+from config import RMT_MEDIAEXT, Config, SYNC_FILES_MAX, SYNC_FILES_EXPIRE, SYNC_EVENT_CHECK_INTERVAL, \
+    SYNC_FILE_STABLE_TIME, SYNC_TRANSFER_THREADS
 import log
 from rmt.filetransfer import FileTransfer
+from rmt.library_index import LibraryIndex
+from utils.cache_utils import ExpiringSet
 from utils.functions import singleton, is_invalid_path, is_path_in_path, is_bluray_dir, get_dir_level1_medias
-from utils.sqls import is_transfer_in_blacklist, insert_sync_history, is_sync_in_history
+from utils.sqls import is_transfer_in_blacklist, insert_sync_history, is_sync_in_history, \
+    get_sync_transfer_queue, insert_sync_transfer_queue, delete_sync_transfer_queue
 from utils.types import SyncType, OsType
 from watchdog.events import FileSystemEventHandler
 
 lock = threading.Lock()
+event_lock = threading.Lock()
 
 
 class FileMonitorHandler(FileSystemEventHandler):
@@ -21,15 +30,22 @@ class FileMonitorHandler(FileSystemEventHandler):
         super(FileMonitorHandler, self).__init__(**kwargs)
         self._watch_path = monpath
         self.sync = sync
+        self.library = LibraryIndex()
 
     def on_created(self, event):
-        self.sync.file_change_handler(event, "创建", event.src_path)
+        self.library.update_path(event.src_path)
+        self.sync.add_file_event(event, "创建", event.src_path)
 
     def on_moved(self, event):
-        self.sync.file_change_handler(event, "移动", event.dest_path)
+        self.library.update_path(event.src_path)
+        self.library.update_path(event.dest_path)
+        self.sync.add_file_event(event, "移动", event.dest_path)
+
+    def on_deleted(self, event):
+        self.library.update_path(event.src_path)
 
     def on_modified(self, event):
-        self.sync.file_change_handler(event, "修改", event.src_path)
+        self.sync.add_file_event(event, "修改", event.src_path)
 
 
 @singleton
@@ -39,12 +55,30 @@ class Sync(object):
     __observer = []
     __sync_path = None
     __sync_sys = OsType.LINUX
-    __synced_files = []
+    __synced_files = None
     __need_sync_paths = {}
+    __file_events = {}
+    __event_thread = None
+    __event_stop = None
+    __transfer_tasks = {}
+    __transfer_devices = set()
+    __transfer_executor = None
 
     def __init__(self):
         self.filetransfer = FileTransfer()
+        # 已处理过的文件，按路径和inode记录，文件被替换后会重新处理
+        self.__synced_files = ExpiringSet(SYNC_FILES_MAX, SYNC_FILES_EXPIRE)
+        # 待批量转移的目录，files为按加入顺序排列的文件集合
+        self.__need_sync_paths = {}
+        # 等待写入完成的文件事件，路径 -> {text: 事件描述, size: 大小, mtime: 修改时间, time: 最后变化时间}
+        self.__file_events = {}
+        # 待转移的任务，按目的设备分组：设备 -> {转移路径: {target, unknown, files}}
+        self.__transfer_tasks = {}
+        # 正在执行转移任务的设备
+        self.__transfer_devices = set()
+        self.__transfer_executor = ThreadPoolExecutor(max_workers=SYNC_TRANSFER_THREADS)
         self.init_config()
+        self.__load_transfer_queue()
 
     def init_config(self):
         config = Config()
@@ -110,29 +144,71 @@ class Sync(object):
                 else:
                     log.error("【SYNC】%s 目录不存在！" % monpath)
 
-    def file_change_handler(self, event, text, event_path):
+    def add_file_event(self, event, text, event_path):
         """
-        处理文件变化
+        登记文件变化事件，同一文件的多次事件合并，文件大小和修改时间稳定后才处理
         :param event: 事件
         :param text: 事件描述
         :param event_path: 事件文件路径
         """
-        if not event.is_directory:
+        if event.is_directory:
+            return
+        with event_lock:
+            file_event = self.__file_events.get(event_path)
+            if file_event:
+                file_event.update({'text': text, 'time': time.time()})
+            else:
+                self.__file_events[event_path] = {'text': text, 'size': None, 'mtime': None, 'time': time.time()}
+
+    def __check_file_events(self):
+        """
+        定期检查等待中的文件事件，文件大小和修改时间在SYNC_FILE_STABLE_TIME内不再变化时交给file_change_handler处理
+        """
+        while not self.__event_stop.wait(SYNC_EVENT_CHECK_INTERVAL):
+            try:
+                with event_lock:
+                    event_paths = list(self.__file_events)
+                ready_events = []
+                for event_path in event_paths:
+                    try:
+                        file_stat = os.stat(event_path)
+                    except OSError:
+                        file_stat = None
+                    now = time.time()
+                    with event_lock:
+                        file_event = self.__file_events.get(event_path)
+                        if not file_event:
+                            continue
+                        if not file_stat:
+                            # 文件已不存在
+                            self.__file_events.pop(event_path)
+                            continue
+                        if file_event.get('size') != file_stat.st_size or file_event.get('mtime') != file_stat.st_mtime:
+                            file_event.update({'size': file_stat.st_size, 'mtime': file_stat.st_mtime, 'time': now})
+                        elif now - file_event.get('time') >= SYNC_FILE_STABLE_TIME:
+                            self.__file_events.pop(event_path)
+                            ready_events.append((event_path, file_event.get('text')))
+                for event_path, text in ready_events:
+                    self.file_change_handler(text, event_path)
+            except Exception as e:
+                log.error("【SYNC】检查文件事件出错：%s" % str(e))
+
+    def file_change_handler(self, text, event_path):
+        """
+        处理文件变化
+        :param text: 事件描述
+        :param event_path: 事件文件路径
+        """
+        if event_path:
             # 文件发生变化
             try:
-                if not os.path.exists(event_path):
+                try:
+                    file_stat = os.stat(event_path)
+                except OSError:
                     return
                 log.debug("【SYNC】文件%s：%s" % (text, event_path))
                 # 判断是否处理过了
-                need_handler_flag = False
-                try:
-                    lock.acquire()
-                    if event_path not in self.__synced_files:
-                        self.__synced_files.append(event_path)
-                        need_handler_flag = True
-                finally:
-                    lock.release()
-                if not need_handler_flag:
+                if not self.__synced_files.add((event_path, file_stat.st_ino)):
                     log.debug("【SYNC】文件已处理过：%s" % event_path)
                     return
                 # 不是监控目录下的文件不处理
@@ -200,70 +276,127 @@ class Sync(object):
                     # 黑名单不处理
                     if is_transfer_in_blacklist(from_dir):
                         return
-                    # 监控根目录下的文件发生变化时直接发走
+                    # 监控根目录下的文件发生变化时直接加入转移队列
                     if is_root_path:
-                        ret, ret_msg = self.filetransfer.transfer_media(in_from=SyncType.MON,
-                                                                        in_path=event_path,
-                                                                        target_dir=target_path,
-                                                                        unknown_dir=unknown_path)
-                        if not ret:
-                            log.warn("【SYNC】%s 转移失败：%s" % (event_path, ret_msg))
+                        insert_sync_transfer_queue(event_path, event_path, target_path, unknown_path)
+                        self.__add_transfer_task(event_path, {'target': target_path, 'unknown': unknown_path,
+                                                              'files': {event_path: None}})
                     else:
-                        try:
-                            lock.acquire()
+                        with lock:
                             if self.__need_sync_paths.get(from_dir):
                                 files = self.__need_sync_paths[from_dir].get('files')
-                                if not files:
-                                    files = [event_path]
-                                else:
-                                    if event_path not in files:
-                                        files.append(event_path)
-                                    else:
-                                        return
-                                self.__need_sync_paths[from_dir].update({'files': files})
+                                if event_path in files:
+                                    return
+                                files[event_path] = None
                             else:
                                 self.__need_sync_paths[from_dir] = {'target': target_path, 'unknown': unknown_path,
-                                                                    'files': [event_path]}
-                        finally:
-                            lock.release()
+                                                                    'files': {event_path: None}}
+                        insert_sync_transfer_queue(event_path, from_dir, target_path, unknown_path)
             except Exception as e:
                 log.error("【SYNC】发生错误：%s" % str(e))
 
     def transfer_mon_files(self):
         """
-        批量转移文件，由定时服务定期调用执行
+        批量转移文件，由定时服务定期调用执行，聚合的目录按目的设备分发给转移线程，不等待转移完成
         """
-        try:
-            lock.acquire()
-            items = list(self.__need_sync_paths)
-            for path in items:
-                if is_invalid_path(path):
-                    continue
-                target_info = self.__need_sync_paths.get(path)
-                if os.path.exists(path):
-                    log.info("【SYNC】开始转移监控目录文件...")
-                    if not is_bluray_dir(path):
-                        files = target_info.get('files')
-                    else:
-                        files = []
-                    target_path = target_info.get('target')
-                    unknown_path = target_info.get('unknown')
-                    ret, ret_msg = self.filetransfer.transfer_media(in_from=SyncType.MON,
-                                                                    in_path=path,
-                                                                    files=files,
-                                                                    target_dir=target_path,
-                                                                    unknown_dir=unknown_path)
-                    if not ret:
-                        log.warn("【SYNC】%s转移失败：%s" % (path, ret_msg))
-                self.__need_sync_paths.pop(path)
-        finally:
-            lock.release()
+        with lock:
+            need_sync_paths = self.__need_sync_paths
+            self.__need_sync_paths = {}
+        for path, task in need_sync_paths.items():
+            self.__add_transfer_task(path, task)
+
+    def __load_transfer_queue(self):
+        """
+        从数据库中恢复上次未转移完成的队列，由下一次定时服务转移
+        """
+        with lock:
+            for file_path, path, target_path, unknown_path in get_sync_transfer_queue():
+                if self.__need_sync_paths.get(path):
+                    self.__need_sync_paths[path]['files'][file_path] = None
+                else:
+                    self.__need_sync_paths[path] = {'target': target_path, 'unknown': unknown_path,
+                                                    'files': {file_path: None}}
+            if self.__need_sync_paths:
+                log.info("【SYNC】恢复待转移的监控目录：%s 个" % len(self.__need_sync_paths))
+
+    @staticmethod
+    def __get_device(path, target_path):
+        """
+        查询转移目的所在的设备，未指定目的目录时按源路径所在设备，硬链接只能在同一设备上进行
+        """
+        for dev_path in [target_path, path]:
+            if not dev_path:
+                continue
+            try:
+                return os.stat(dev_path).st_dev
+            except OSError:
+                continue
+        return None
+
+    def __add_transfer_task(self, path, task):
+        """
+        加入转移任务，该设备没有转移线程在运行时提交一个，不会阻塞
+        :param path: 转移的目录或文件
+        :param task: {target: 目的目录, unknown: 未识别目录, files: 文件集合}
+        """
+        device = self.__get_device(path, task.get('target'))
+        with lock:
+            tasks = self.__transfer_tasks.setdefault(device, OrderedDict())
+            if tasks.get(path):
+                tasks[path]['files'].update(task.get('files'))
+            else:
+                tasks[path] = task
+            if device in self.__transfer_devices:
+                return
+            self.__transfer_devices.add(device)
+        self.__transfer_executor.submit(self.__run_transfer_tasks, device)
+
+    def __run_transfer_tasks(self, device):
+        """
+        依次执行某个设备上的转移任务，直到队列为空
+        """
+        while True:
+            with lock:
+                tasks = self.__transfer_tasks.get(device)
+                if not tasks:
+                    self.__transfer_tasks.pop(device, None)
+                    self.__transfer_devices.discard(device)
+                    return
+                path, task = tasks.popitem(last=False)
+            try:
+                self.__transfer_task(path, task)
+            except Exception as e:
+                log.error("【SYNC】%s 转移出错：%s" % (path, str(e)))
+
+    def __transfer_task(self, path, task):
+        """
+        转移一个目录或文件，完成后从数据库队列中删除
+        """
+        files = list(task.get('files'))
+        if not is_invalid_path(path) and os.path.exists(path):
+            if os.path.isfile(path):
+                log.info("【SYNC】开始转移监控文件：%s" % path)
+                in_files = None
+            else:
+                log.info("【SYNC】开始转移监控目录文件：%s" % path)
+                in_files = [] if is_bluray_dir(path) else files
+            ret, ret_msg = self.filetransfer.transfer_media(in_from=SyncType.MON,
+                                                            in_path=path,
+                                                            files=in_files,
+                                                            target_dir=task.get('target'),
+                                                            unknown_dir=task.get('unknown'))
+            if not ret:
+                log.warn("【SYNC】%s 转移失败：%s" % (path, ret_msg))
+        delete_sync_transfer_queue(files)
 
     def run_service(self):
         """
         启动监控服务
         """
         self.__observer = []
+        self.__event_stop = threading.Event()
+        self.__event_thread = threading.Thread(target=self.__check_file_events, daemon=True)
+        self.__event_thread.start()
         for monpath in self.sync_dir_config.keys():
             if monpath and os.path.exists(monpath):
                 try:
@@ -289,6 +422,10 @@ class Sync(object):
             for observer in self.__observer:
                 observer.stop()
         self.__observer = []
+        if self.__event_stop:
+            self.__event_stop.set()
+        with event_lock:
+            self.__file_events = {}
 
     def transfer_all_sync(self):
         """
@@ -1,7 +1,8 @@
+from concurrent.futures.thread import ThreadPoolExecutor
 from threading import Lock
 
 import log
-from config import Config
+from config import Config, PT_SITE_THREADS
 from message.send import Message
 from utils.http_utils import RequestUtils
 from utils.sqls import get_config_site
@@ -40,32 +41,41 @@ class PTSignin:
 
     def __signin(self):
         """
-        PT站签到入口，由定时服务调用
+        PT站签到入口，由定时服务调用，各站点并发签到
         """
-        status = []
-        if self.__pt_sites:
-            for site_info in self.__pt_sites:
-                if not site_info:
-                    continue
-                pt_task = site_info[1]
-                try:
-                    pt_url = site_info[4]
-                    pt_cookie = site_info[5]
-                    log.info("【PT】开始PT签到：%s" % pt_task)
-                    if not pt_url or not pt_cookie:
-                        log.warn("【PT】未配置 %s 的Url或Cookie，无法签到" % str(pt_task))
-                        continue
-                    res = RequestUtils(headers=self.__user_agent, cookies=pt_cookie).get_res(url=pt_url)
-                    if res and res.status_code == 200:
-                        status.append("%s 签到成功" % pt_task)
-                    elif not res:
-                        status.append("%s 签到失败，无法打开网站" % pt_task)
-                    else:
-                        status.append("%s 签到失败，状态码：%s" % (pt_task, res.status_code))
-                except Exception as e:
-                    log.error("【PT】%s 签到出错：%s" % (pt_task, str(e)))
+        if not self.__pt_sites:
+            return
+        site_infos = [site_info for site_info in self.__pt_sites if site_info]
+        if not site_infos:
+            return
+        with ThreadPoolExecutor(max_workers=min(PT_SITE_THREADS, len(site_infos))) as executor:
+            status = [ret for ret in executor.map(self.__signin_site, site_infos) if ret]
         if not status:
             return
         else:
             msg_str = "\n".join(status)
         self.message.sendmsg(title=msg_str)
+
+    def __signin_site(self, site_info):
+        """
+        签到一个PT站
+        :return: 签到结果描述，无需签到时返回None
+        """
+        pt_task = site_info[1]
+        try:
+            pt_url = site_info[4]
+            pt_cookie = site_info[5]
+            log.info("【PT】开始PT签到：%s" % pt_task)
+            if not pt_url or not pt_cookie:
+                log.warn("【PT】未配置 %s 的Url或Cookie，无法签到" % str(pt_task))
+                return None
+            res = RequestUtils(headers=self.__user_agent, cookies=pt_cookie, verify=False).get_res(url=pt_url)
+            if res and res.status_code == 200:
+                return "%s 签到成功" % pt_task
+            elif not res:
+                return "%s 签到失败，无法打开网站" % pt_task
+            else:
+                return "%s 签到失败，状态码：%s" % (pt_task, res.status_code)
+        except Exception as e:
+            log.error("【PT】%s 签到出错：%s" % (pt_task, str(e)))
+        return None
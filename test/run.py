@@ -1,11 +1,90 @@
+import os
+import shutil
+import tempfile
+import time
+
 from pt.client.qbittorrent import Qbittorrent
 from pt.client.transmission import Transmission
 from pt.searcher import Searcher
 from rmt.media import Media
+from rmt.meta.metavideo import MetaVideo
 from rmt.metainfo import MetaInfo
+from config import RMT_MEDIAEXT
+from utils.functions import get_dir_files_by_ext, is_invalid_path
 from utils.sqls import get_system_messages
 
+
+def meta_info_benchmark(rounds=3):
+    """
+    识别性能测试，使用torrentnames.txt和filenames.txt中的名称，输出每秒识别的名称数
+    首轮为不命中识别缓存的速度，后续轮次为命中识别缓存后的速度
+    """
+    names = []
+    for file_name in ['torrentnames.txt', 'filenames.txt']:
+        with open(os.path.join(os.path.dirname(__file__), file_name), 'r', encoding='utf-8') as f:
+            names += [name.strip() for name in f.readlines() if name.strip()]
+    if not names:
+        return
+    MetaVideo._parsed_cache.clear()
+    for i in range(rounds):
+        start_time = time.perf_counter()
+        for name in names:
+            MetaInfo(name)
+        cost = time.perf_counter() - start_time
+        print("第%s轮%s：%s 条，耗时 %.3f 秒，%.0f 条/秒" % (i + 1,
+                                                   "（无缓存）" if i == 0 else "（有缓存）",
+                                                   len(names),
+                                                   cost,
+                                                   len(names) / cost))
+
+
+def dir_scan_benchmark(file_count=100000, files_per_dir=50):
+    """
+    目录遍历性能测试，在临时目录中生成file_count个文件（含回收站和隐藏目录），
+    对比按os.walk逐个判断的旧方式与get_dir_files_by_ext的耗时
+    """
+    def walk_dir_files(in_path, exts, filesize):
+        ret_list = []
+        for root, dirs, files in os.walk(in_path):
+            for file in files:
+                if os.path.splitext(file)[-1].lower() in exts:
+                    cur_path = os.path.join(root, file)
+                    if is_invalid_path(cur_path):
+                        continue
+                    if cur_path not in ret_list and os.path.getsize(cur_path) >= filesize:
+                        ret_list.append(cur_path)
+        return ret_list
+
+    tmp_path = tempfile.mkdtemp()
+    try:
+        exts = ['.mkv', '.srt', '.nfo', '.jpg']
+        dir_path = tmp_path
+        for i in range(file_count):
+            if i % files_per_dir == 0:
+                index = i // files_per_dir
+                dir_path = os.path.join(tmp_path, "Season %s" % (index // 100), "Show %s" % index)
+                if index % 20 < 2:
+                    dir_path = os.path.join(os.path.dirname(dir_path), ['@Recycle', '.hidden'][index % 2],
+                                            os.path.basename(dir_path))
+                os.makedirs(dir_path)
+            with open(os.path.join(dir_path, "S01E%s%s" % (i, exts[i % len(exts)])), 'w') as f:
+                f.write("x" * (i % 3))
+        print("目录遍历：%s 个文件" % file_count)
+        results = []
+        for name, func in [("os.walk", walk_dir_files), ("scandir", get_dir_files_by_ext)]:
+            start_time = time.perf_counter()
+            files = func(tmp_path, RMT_MEDIAEXT, 1)
+            cost = time.perf_counter() - start_time
+            results.append(set(files))
+            print("%s：找到 %s 个文件，耗时 %.3f 秒" % (name, len(files), cost))
+        print("结果一致" if results[0] == results[1] else "结果不一致")
+    finally:
+        shutil.rmtree(tmp_path)
+
+
 if __name__ == "__main__":
+    meta_info_benchmark()
+    dir_scan_benchmark()
     '''
     with open('torrentnames.txt', 'r', encoding='utf-8') as f:
         names = f.readlines()
@@ -0,0 +1,165 @@
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from utils.functions import scan_dir_files
+
+
+class ExpiringSet:
+    """
+    有容量上限、元素超时自动失效的集合，线程安全，查询和加入均为O(1)
+    """
+    __maxsize = 0
+    __expire = 0
+    __data = None
+    __lock = None
+
+    def __init__(self, maxsize, expire):
+        """
+        :param maxsize: 最多保留的元素个数，超出时淘汰最早加入的
+        :param expire: 元素的有效期，秒
+        """
+        self.__maxsize = maxsize
+        self.__expire = expire
+        self.__data = OrderedDict()
+        self.__lock = Lock()
+
+    def add(self, key):
+        """
+        加入元素
+        :return: 元素不存在或已过期时加入并返回True，已存在时返回False
+        """
+        now = time.time()
+        with self.__lock:
+            self.__purge(now)
+            if key in self.__data:
+                return False
+            self.__data[key] = now + self.__expire
+            while len(self.__data) > self.__maxsize:
+                self.__data.popitem(last=False)
+            return True
+
+    def discard(self, key):
+        with self.__lock:
+            self.__data.pop(key, None)
+
+    def clear(self):
+        with self.__lock:
+            self.__data.clear()
+
+    def __contains__(self, key):
+        with self.__lock:
+            self.__purge(time.time())
+            return key in self.__data
+
+    def __len__(self):
+        with self.__lock:
+            self.__purge(time.time())
+            return len(self.__data)
+
+    def __purge(self, now):
+        """
+        按加入顺序清理已过期的元素
+        """
+        while self.__data:
+            key, expire_time = next(iter(self.__data.items()))
+            if expire_time > now:
+                break
+            self.__data.popitem(last=False)
+
+
+class DirSnapshot:
+    """
+    一次转移过程中的目录内容快照，每个目录只读取一次，之后的存在性判断和同名文件查找都在内存中完成，
+    转移写入文件或创建目录后需要调用invalidate使相关目录的快照失效
+    """
+    __names = None
+    __files = None
+    __ignore_case = False
+
+    def __init__(self, ignore_case=False):
+        """
+        :param ignore_case: 文件名是否不区分大小写，Windows及挂载的SMB共享目录与os.path.exists的行为一致
+        """
+        self.__ignore_case = ignore_case
+        # 目录 -> 目录下一级的文件及目录名集合，目录不存在时为None
+        self.__names = {}
+        # (目录, 后缀) -> 目录下（含子目录）按后缀过滤的文件列表
+        self.__files = {}
+
+    def exists(self, path):
+        """
+        判断文件或目录是否存在
+        """
+        if not path:
+            return False
+        path = os.path.normpath(path)
+        dir_path, name = os.path.split(path)
+        if not name:
+            return os.path.exists(path)
+        names = self.__list_dir(dir_path)
+        return names is not None and self.__get_key(name) in names
+
+    def find_file(self, path, exts):
+        """
+        按后缀顺序查找与path同名的文件
+        :param path: 不含后缀的文件路径
+        :param exts: 后缀列表
+        :return: 第一个存在的文件路径，都不存在时返回None
+        """
+        if not path:
+            return None
+        dir_path, name = os.path.split(os.path.normpath(path))
+        names = self.__list_dir(dir_path)
+        if not names:
+            return None
+        for ext in exts:
+            if self.__get_key("%s%s" % (name, ext)) in names:
+                return "%s%s" % (path, ext)
+        return None
+
+    def get_dir_files(self, dir_path, exts=""):
+        """
+        查询目录下（含子目录）按后缀过滤的文件列表，同一目录只遍历一次
+        """
+        key = (os.path.normpath(dir_path), tuple(exts))
+        if key not in self.__files:
+            self.__files[key] = list(scan_dir_files(dir_path, exts))
+        return self.__files[key]
+
+    def invalidate(self, path):
+        """
+        文件或目录发生变化后，使该路径、其上级目录及其下级目录的快照失效
+        """
+        if not path:
+            return
+        path = os.path.normpath(path)
+        for dir_path in list(self.__names):
+            if self.__is_related(dir_path, path):
+                self.__names.pop(dir_path)
+        for key in list(self.__files):
+            if self.__is_related(key[0], path):
+                self.__files.pop(key)
+
+    def __list_dir(self, dir_path):
+        if dir_path not in self.__names:
+            try:
+                with os.scandir(dir_path) as entries:
+                    self.__names[dir_path] = {self.__get_key(entry.name) for entry in entries}
+            except OSError:
+                self.__names[dir_path] = None
+        return self.__names[dir_path]
+
+    def __get_key(self, name):
+        return name.lower() if self.__ignore_case else name
+
+    def __is_related(self, dir_path, path):
+        """
+        两个路径是否为同一路径或存在上下级关系
+        """
+        dir_path = self.__get_key(dir_path)
+        path = self.__get_key(path)
+        return dir_path == path \
+            or path.startswith(dir_path.rstrip(os.sep) + os.sep) \
+            or dir_path.startswith(path.rstrip(os.sep) + os.sep)
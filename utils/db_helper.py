@@ -177,6 +177,25 @@ class DBHelper:
                                                            CONTENT    TEXT,
                                                            DATE     TEXT);''')
             cursor.execute('''CREATE INDEX IF NOT EXISTS INDX_MESSAGES_DATE ON MESSAGES (DATE);''')
+            # RSS增量处理游标，ITEMS为上次处理的种子链接摘要
+            cursor.execute('''CREATE TABLE IF NOT EXISTS RSS_CURSOR
+                                                           (URL    TEXT PRIMARY KEY     NOT NULL,
+                                                           ETAG    TEXT,
+                                                           LAST_MODIFIED    TEXT,
+                                                           ITEMS    TEXT);''')
+            # 媒体库文件索引，SEASONS、EPISODES为逗号分隔的季集号
+            cursor.execute('''CREATE TABLE IF NOT EXISTS LIBRARY_FILES
+                                                           (PATH    TEXT PRIMARY KEY     NOT NULL,
+                                                           ROOT    TEXT,
+                                                           NAME    TEXT,
+                                                           SEASONS    TEXT,
+                                                           EPISODES    TEXT);''')
+            # 目录监控待转移队列表
+            cursor.execute('''CREATE TABLE IF NOT EXISTS SYNC_TRANSFER_QUEUE
+                                                           (FILE_PATH    TEXT PRIMARY KEY     NOT NULL,
+                                                           PATH    TEXT,
+                                                           TARGET    TEXT,
+                                                           UNKNOWN    TEXT);''')
             # 提交
             self.__connection.commit()
 
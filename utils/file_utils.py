@@ -0,0 +1,226 @@
+import errno
+import hashlib
+import json
+import os
+import shutil
+import time
+from threading import Lock
+
+from config import RMT_COPY_CHUNK_SIZE, RMT_COPY_TEMP_EXT
+from utils.types import RmtMode
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Linux的FICLONE ioctl，btrfs、xfs等支持reflink的文件系统上复制时只共享数据块，不实际写入数据
+FICLONE = 0x40049409
+# 零拷贝不可用时回退到普通读写的错误码
+COPY_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP,
+                        errno.EBADF, errno.EPERM}
+
+lock = Lock()
+# 正在复制的文件：目的文件路径 -> 进度信息
+COPY_PROGRESS = {}
+
+
+def transfer_file(src, dest, rmt_mode, progress=None, verify=False):
+    """
+    在进程内硬链接、软链接或复制单个文件，不调用系统命令
+    :param src: 源文件路径
+    :param dest: 目的文件路径
+    :param rmt_mode: RmtMode转移方式
+    :param progress: 复制时的进度回调，参数为进度信息，见get_copy_progress
+    :param verify: 复制时是否校验目的文件与源文件一致
+    :return: 错误码、错误信息，成功时错误码为0
+    """
+    try:
+        if rmt_mode == RmtMode.LINK:
+            os.link(src, dest)
+        elif rmt_mode == RmtMode.SOFTLINK:
+            os.symlink(src, dest)
+        else:
+            copy_file(src, dest, progress, verify)
+    except OSError as e:
+        return e.errno or -1, e.strerror or str(e)
+    except Exception as e:
+        return -1, str(e)
+    return 0, ""
+
+
+def copy_file(src, dest, progress=None, verify=False):
+    """
+    复制文件，先写入临时文件，完成后再重命名为目的文件。临时文件旁记录源文件的路径、大小、修改时间和已落盘的字节数，
+    中断后再次复制时只有源文件一致才从已落盘的位置续传，否则丢弃临时文件重新复制。
+    优先使用reflink，其次使用copy_file_range、sendfile在内核中复制，都不支持或需要校验时按块读写
+    :param src: 源文件路径
+    :param dest: 目的文件路径
+    :param progress: 进度回调，参数为进度信息，见get_copy_progress
+    :param verify: 是否在复制时计算源文件的哈希，完成后与临时文件的哈希比对
+    """
+    temp_file = dest + RMT_COPY_TEMP_EXT
+    info_file = temp_file + ".json"
+    src_stat = os.stat(src)
+    src_info = {'src': os.path.abspath(src), 'size': src_stat.st_size, 'mtime': src_stat.st_mtime_ns}
+    offset = _get_resume_offset(temp_file, info_file, src_info)
+    state = {'src': src, 'dest': dest, 'total': src_stat.st_size, 'copied': offset, 'offset': offset,
+             'start': time.time(), 'info_file': info_file, 'src_info': src_info}
+    with lock:
+        COPY_PROGRESS[dest] = state
+    try:
+        hasher = hashlib.sha1() if verify else None
+        with open(src, 'rb') as fsrc, open(temp_file, 'r+b' if offset else 'wb') as fdst:
+            _save_copy_info(state)
+            if offset:
+                fdst.truncate(offset)
+                fdst.seek(offset)
+                if hasher:
+                    _hash_data(fsrc, hasher, offset)
+                fsrc.seek(offset)
+            if hasher or offset or not _reflink(fsrc, fdst):
+                _copy_data(fsrc, fdst, state, progress, hasher)
+            fdst.flush()
+            os.fsync(fdst.fileno())
+        if hasher:
+            with open(temp_file, 'rb') as fdst:
+                dest_hasher = hashlib.sha1()
+                _hash_data(fdst, dest_hasher)
+            if dest_hasher.digest() != hasher.digest():
+                _remove_files(temp_file, info_file)
+                raise OSError(errno.EIO, "复制后文件校验不一致")
+        shutil.copymode(src, temp_file)
+        os.replace(temp_file, dest)
+        _remove_files(info_file)
+    finally:
+        with lock:
+            COPY_PROGRESS.pop(dest, None)
+
+
+def _get_resume_offset(temp_file, info_file, src_info):
+    """
+    根据临时文件旁的记录计算可以续传的位置，记录缺失、与源文件不一致时删除临时文件从头复制
+    """
+    if not os.path.isfile(temp_file):
+        _remove_files(info_file)
+        return 0
+    try:
+        with open(info_file, 'r', encoding='utf-8') as f:
+            copy_info = json.load(f)
+        if all(copy_info.get(key) == value for key, value in src_info.items()):
+            return min(int(copy_info.get('copied') or 0), os.path.getsize(temp_file))
+    except (OSError, ValueError, TypeError, AttributeError):
+        pass
+    _remove_files(temp_file, info_file)
+    return 0
+
+
+def _save_copy_info(state):
+    """
+    记录源文件信息和已落盘的字节数，先写临时文件再替换，避免中断时记录不完整
+    """
+    info_file = state.get('info_file')
+    copy_info = dict(state.get('src_info'), copied=state.get('copied'))
+    with open(info_file + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(copy_info, f)
+    os.replace(info_file + ".tmp", info_file)
+
+
+def _remove_files(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def get_copy_progress():
+    """
+    查询正在复制的文件的进度
+    :return: [{src, dest, total: 总字节数, copied: 已复制字节数, percent: 百分比, speed: 字节/秒, eta: 剩余秒数}]
+    """
+    with lock:
+        states = [state.copy() for state in COPY_PROGRESS.values()]
+    return [_get_progress_info(state) for state in states]
+
+
+def _get_progress_info(state):
+    """
+    根据已复制字节数和耗时计算进度、速度和剩余时间，续传的部分不计入速度
+    """
+    total = state.get('total')
+    copied = state.get('copied')
+    elapsed = time.time() - state.get('start')
+    speed = int((copied - state.get('offset')) / elapsed) if elapsed > 0 else 0
+    eta = int((total - copied) / speed) if speed else None
+    percent = round(copied * 100 / total, 1) if total else 100
+    return {'src': state.get('src'), 'dest': state.get('dest'), 'total': total, 'copied': copied,
+            'percent': percent, 'speed': speed, 'eta': eta}
+
+
+def _reflink(fsrc, fdst):
+    """
+    尝试以reflink方式复制，文件系统不支持时返回False
+    """
+    if not fcntl:
+        return False
+    try:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return True
+    except OSError:
+        return False
+
+
+def _hash_data(fobj, hasher, size=None):
+    """
+    按块读取文件计算哈希
+    :param size: 读取的字节数，为空时读到文件末尾
+    """
+    fobj.seek(0)
+    remain = size
+    while remain is None or remain > 0:
+        data = fobj.read(RMT_COPY_CHUNK_SIZE if remain is None else min(remain, RMT_COPY_CHUNK_SIZE))
+        if not data:
+            break
+        hasher.update(data)
+        if remain is not None:
+            remain -= len(data)
+
+
+def _copy_data(fsrc, fdst, state, progress=None, hasher=None):
+    """
+    从当前位置按块复制文件数据，每块完成后回调进度，需要计算哈希时只能在用户空间读写
+    """
+    in_fd = fsrc.fileno()
+    out_fd = fdst.fileno()
+    copied = state.get('copied')
+    zero_copy = not hasher and (hasattr(os, 'copy_file_range') or hasattr(os, 'sendfile'))
+    while True:
+        if zero_copy:
+            try:
+                if hasattr(os, 'copy_file_range'):
+                    size = os.copy_file_range(in_fd, out_fd, RMT_COPY_CHUNK_SIZE, copied)
+                else:
+                    size = os.sendfile(out_fd, in_fd, copied, RMT_COPY_CHUNK_SIZE)
+            except OSError as e:
+                # 本次还未写入数据时可以安全回退为普通读写
+                if copied == state.get('offset') and e.errno in COPY_FALLBACK_ERRNOS:
+                    zero_copy = False
+                    continue
+                raise
+        else:
+            data = fsrc.read(RMT_COPY_CHUNK_SIZE)
+            fdst.write(data)
+            if hasher:
+                hasher.update(data)
+            size = len(data)
+        if not size:
+            break
+        copied += size
+        # 数据落盘后再记录续传位置，掉电后未落盘的数据不会被当作已复制
+        fdst.flush()
+        os.fsync(out_fd)
+        state['copied'] = copied
+        _save_copy_info(state)
+        if progress:
+            progress(_get_progress_info(state))
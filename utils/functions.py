@@ -120,31 +120,48 @@ def system_exec_command(cmd, timeout=60):
 
 # 获得目录下的媒体文件列表List，按后缀过滤
 def get_dir_files_by_ext(in_path, exts="", filesize=0):
+    return list(scan_dir_files(in_path, exts, filesize))
+
+
+# 遍历目录下的文件，按后缀和大小过滤，回收站及隐藏的目录在遍历时直接跳过，以生成器返回文件路径
+def scan_dir_files(in_path, exts="", filesize=0):
     if not in_path:
-        return []
-    if not os.path.exists(in_path):
-        return []
-    ret_list = []
-    if os.path.isdir(in_path):
-        for root, dirs, files in os.walk(in_path):
-            for file in files:
-                ext = os.path.splitext(file)[-1]
-                if not exts or ext.lower() in exts:
-                    cur_path = os.path.join(root, file)
-                    if is_invalid_path(cur_path):
+        return
+    if exts:
+        exts = frozenset(ext.lower() for ext in exts)
+    if not os.path.isdir(in_path):
+        if not os.path.exists(in_path) or is_invalid_path(in_path):
+            return
+        if not exts or os.path.splitext(in_path)[-1].lower() in exts:
+            if not filesize or os.path.getsize(in_path) >= filesize:
+                yield in_path
+        return
+    if is_invalid_path(os.path.join(in_path, "")):
+        return
+    dir_stack = [in_path]
+    while dir_stack:
+        sub_dirs = []
+        try:
+            with os.scandir(dir_stack.pop()) as entries:
+                for entry in entries:
+                    if is_invalid_name(entry.name):
                         continue
-                    file_size = os.path.getsize(cur_path)
-                    if cur_path not in ret_list and file_size >= filesize:
-                        ret_list.append(cur_path)
-    else:
-        if is_invalid_path(in_path):
-            return []
-        ext = os.path.splitext(in_path)[-1]
-        if not exts or ext.lower() in exts:
-            file_size = os.path.getsize(in_path)
-            if in_path not in ret_list and file_size >= filesize:
-                ret_list.append(in_path)
-    return ret_list
+                    try:
+                        if entry.is_dir():
+                            # 与os.walk一致，不进入软链接的目录
+                            if not entry.is_symlink():
+                                sub_dirs.append(entry.path)
+                            continue
+                        if exts and os.path.splitext(entry.name)[-1].lower() not in exts:
+                            continue
+                        if filesize and entry.stat().st_size < filesize:
+                            continue
+                    except OSError:
+                        continue
+                    yield entry.path
+        except OSError:
+            continue
+        dir_stack.extend(reversed(sub_dirs))
 
 
 # 根据后缀，返回目录下所有的文件及文件夹列表（只查询一级）
@@ -255,6 +272,15 @@ def is_invalid_path(path):
     return False
 
 
+# 判断文件或目录名是否为回收站、群晖缩略图或隐藏的文件，与is_invalid_path的规则一致
+def is_invalid_name(name):
+    if not name:
+        return True
+    if name in ['@Recycle', '#recycle'] or name.startswith('.') or name.startswith('@eaDir'):
+        return True
+    return False
+
+
 # 判断两个路径是否包含关系 path1 in path2
 def is_path_in_path(path1, path2):
     if not path1 or not path2:
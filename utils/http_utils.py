@@ -1,7 +1,20 @@
+import time
+from email.utils import parsedate_to_datetime
+from http.cookiejar import DefaultCookiePolicy
+from threading import Lock
+from urllib.parse import urlparse
+
 import requests
 import urllib3
+from requests.adapters import HTTPAdapter
+
+import log
+from config import DEFAULT_HEADERS, HTTP_POOL_SIZE, HTTP_TIMEOUT, HTTP_RETRIES, HTTP_RETRY_BACKOFF, \
+    HTTP_RETRY_AFTER_MAX
 
-from config import DEFAULT_HEADERS
+lock = Lock()
+# 按站点和代理共享的连接池会话
+_sessions = {}
 
 
 class RequestUtils:
@@ -9,8 +22,10 @@ class RequestUtils:
     __headers = None
     __cookies = None
     __proxies = None
+    __timeout = HTTP_TIMEOUT
+    __verify = True
 
-    def __init__(self, headers, cookies, proxies=False):
+    def __init__(self, headers=None, cookies=None, proxies=False, timeout=None, verify=True):
         if headers:
             if isinstance(headers, str):
                 self.__headers = {"User-Agent": f"{headers}"}
@@ -26,45 +41,94 @@ class RequestUtils:
                 self.__cookies = cookies
         if proxies:
             self.__proxies = proxies
+        if timeout:
+            self.__timeout = timeout
+        # 是否校验HTTPS证书，只有PT站点等自签证书较多的场景才关闭
+        self.__verify = verify
 
     def post(self, url, params, json=None):
         if json is None:
             json = {}
-        i = 0
-        while i < 3:
-            try:
-                r = requests.post(url, data=params, verify=False, headers=self.__headers, proxies=self.__proxies, json=json)
-                return r
-            except requests.exceptions.RequestException:
-                i += 1
+        return self.__request("POST", url, data=params, json=json)
 
     def get(self, url, params=None):
-        i = 0
-        while i < 3:
-            try:
-                r = requests.get(url, verify=False, headers=self.__headers, proxies=self.__proxies, params=params, timeout=10)
-                return str(r.content, 'UTF-8')
-            except requests.exceptions.RequestException:
-                i += 1
+        r = self.__request("GET", url, params=params)
+        if r is not None:
+            return str(r.content, 'UTF-8')
+
+    def get_res(self, url, params=None, stream=False):
+        return self.__request("GET", url, params=params, stream=stream)
+
+    def post_res(self, url, params=None, allow_redirects=True, data=None, json=None):
+        return self.__request("POST", url, params=params, data=data, json=json, allow_redirects=allow_redirects)
 
-    def get_res(self, url, params=None):
-        i = 0
-        while i < 3:
+    def __request(self, method, url, **kwargs):
+        """
+        使用共享会话发送请求，网络异常时按指数退避重试，429/503时按服务端的Retry-After等待后重试
+        :return: 请求结果，重试次数用完仍失败时返回None
+        """
+        session = self.get_session(url, self.__proxies)
+        for i in range(HTTP_RETRIES):
+            last_try = i == HTTP_RETRIES - 1
             try:
-                return requests.get(url, params=params, verify=False, headers=self.__headers, proxies=self.__proxies, cookies=self.__cookies, timeout=10)
+                res = session.request(method, url,
+                                      verify=self.__verify,
+                                      headers=self.__headers,
+                                      proxies=self.__proxies,
+                                      cookies=self.__cookies,
+                                      timeout=self.__timeout,
+                                      **kwargs)
             except requests.exceptions.RequestException as e:
-                print(e)
-                i += 1
+                log.console("%s %s 请求出错：%s" % (method, url, str(e)))
+                if not last_try:
+                    time.sleep(HTTP_RETRY_BACKOFF * 2 ** i)
+                continue
+            if res.status_code in [429, 503] and not last_try:
+                retry_after = self.__get_retry_after(res)
+                res.close()
+                time.sleep(retry_after if retry_after is not None else HTTP_RETRY_BACKOFF * 2 ** i)
+                continue
+            return res
+        return None
 
-    def post_res(self, url, params=None, allow_redirects=True):
-        i = 0
-        while i < 3:
+    @staticmethod
+    def __get_retry_after(res):
+        """
+        解析Retry-After响应头，支持秒数和HTTP日期两种格式
+        """
+        retry_after = res.headers.get("Retry-After")
+        if not retry_after:
+            return None
+        if retry_after.strip().isdigit():
+            seconds = int(retry_after.strip())
+        else:
             try:
-                return requests.post(url, params=params, verify=False, headers=self.__headers, proxies=self.__proxies, cookies=self.__cookies,
-                                     allow_redirects=allow_redirects)
-            except requests.exceptions.RequestException as e:
-                print(e)
-                i += 1
+                seconds = parsedate_to_datetime(retry_after).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return None
+        return min(max(seconds, 0), HTTP_RETRY_AFTER_MAX)
+
+    @staticmethod
+    def get_session(url, proxies=None):
+        """
+        按站点和代理获取共享的会话，复用连接
+        :param url: 请求地址
+        :param proxies: 代理设置
+        :return: requests.Session
+        """
+        url_info = urlparse(url)
+        key = ("%s://%s" % (url_info.scheme, url_info.netloc), tuple(sorted((proxies or {}).items())))
+        with lock:
+            session = _sessions.get(key)
+            if not session:
+                session = requests.Session()
+                # 服务端下发的Cookie不保存在共享会话中，避免不同调用之间串用
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _sessions[key] = session
+            return session
 
     @staticmethod
     def cookie_parse(cookies_str):
@@ -1,8 +1,14 @@
+import json
 import os
 import pickle
+import sqlite3
+import time
+from collections import OrderedDict
 from threading import Lock
 
-from config import Config
+import log
+from config import Config, METAINFO_CACHE_SIZE, METAINFO_NONE_EXPIRE, FANART_IMAGE_EXPIRE, TMDB_DETAILS_EXPIRE, \
+    TMDB_DETAILS_ENDED_EXPIRE, TMDB_DETAILS_CACHE_SIZE
 from utils.functions import singleton
 
 lock = Lock()
@@ -10,48 +16,338 @@ lock = Lock()
 
 @singleton
 class MetaHelper(object):
-    __meta_data = {}
+    """
+    TMDB识别结果缓存，持久化存储在配置目录下的meta.db中，内存中只保留最近使用的热点数据
+    """
+    __meta_data = OrderedDict()
+    __dirty_data = {}
+    __names_data = OrderedDict()
+    __fanart_data = OrderedDict()
+    __details_data = OrderedDict()
     __meta_path = None
+    __db_path = None
+    __connection = None
 
     def __init__(self):
         self.init_config()
 
     def init_config(self):
         config = Config()
-        self.__meta_path = os.path.join(os.path.dirname(config.get_config_path()), 'meta.dat')
-        self.__meta_data = self.__load_meta_data(self.__meta_path)
+        config_dir = os.path.dirname(config.get_config_path())
+        self.__meta_path = os.path.join(config_dir, 'meta.dat')
+        self.__db_path = os.path.join(config_dir, 'meta.db')
+        with lock:
+            self.__meta_data = OrderedDict()
+            self.__dirty_data = {}
+            self.__names_data = OrderedDict()
+            self.__fanart_data = OrderedDict()
+            self.__details_data = OrderedDict()
+            if self.__connection:
+                self.__connection.close()
+            self.__connection = sqlite3.connect(self.__db_path, check_same_thread=False)
+            self.__init_tables()
+        self.__migrate_meta_dat()
 
-    def __get_meta_data(self):
-        return self.__meta_data
+    def __init_tables(self):
+        cursor = self.__connection.cursor()
+        try:
+            # TMDB识别结果表，TMDBID为0表示未识别到
+            cursor.execute('''CREATE TABLE IF NOT EXISTS MEDIA_META
+                                   (KEY TEXT PRIMARY KEY     NOT NULL,
+                                   TMDBID    INTEGER,
+                                   DATA    BLOB,
+                                   TIME    INTEGER);''')
+            cursor.execute('''CREATE INDEX IF NOT EXISTS INDX_MEDIA_META_TMDBID ON MEDIA_META (TMDBID);''')
+            # TMDB译名表，NAMES为标准化后的所有译名
+            cursor.execute('''CREATE TABLE IF NOT EXISTS MEDIA_NAMES
+                                   (TYPE    TEXT     NOT NULL,
+                                   TMDBID    INTEGER     NOT NULL,
+                                   NAMES    TEXT,
+                                   PRIMARY KEY (TYPE, TMDBID));''')
+            # Fanart图片表，URL为空表示没有图片
+            cursor.execute('''CREATE TABLE IF NOT EXISTS MEDIA_FANART
+                                   (TYPE    TEXT     NOT NULL,
+                                   TMDBID    INTEGER     NOT NULL,
+                                   URL    TEXT,
+                                   TIME    INTEGER,
+                                   PRIMARY KEY (TYPE, TMDBID));''')
+            # TMDB详情表，EXPIRE为按连载状态计算的有效期
+            cursor.execute('''CREATE TABLE IF NOT EXISTS MEDIA_DETAILS
+                                   (TYPE    TEXT     NOT NULL,
+                                   TMDBID    INTEGER     NOT NULL,
+                                   LANGUAGE    TEXT     NOT NULL,
+                                   DATA    BLOB,
+                                   TIME    INTEGER,
+                                   EXPIRE    INTEGER,
+                                   PRIMARY KEY (TYPE, TMDBID, LANGUAGE));''')
+            self.__connection.commit()
+        except Exception as e:
+            log.error("【META】创建缓存数据库错误：%s" % str(e))
+        finally:
+            cursor.close()
 
-    def get_meta_data_by_key(self, key):
-        with lock:
-            return self.__get_meta_data().get(key)
+    def __migrate_meta_dat(self):
+        """
+        将旧版本的meta.dat导入数据库，导入后重命名为meta.dat.bak
+        """
+        if not os.path.exists(self.__meta_path):
+            return
+        try:
+            with open(self.__meta_path, 'rb') as f:
+                meta_data = pickle.load(f)
+        except Exception as e:
+            log.error("【META】读取 %s 出错：%s" % (self.__meta_path, str(e)))
+            return
+        if meta_data:
+            now = int(time.time())
+            data_list = [(key, item.get("id") or 0, pickle.dumps(item, pickle.HIGHEST_PROTOCOL), now)
+                         for key, item in meta_data.items() if item]
+            with lock:
+                if not self.__excute_many("INSERT OR IGNORE INTO MEDIA_META(KEY, TMDBID, DATA, TIME) VALUES (?, ?, ?, ?)",
+                                          data_list):
+                    return
+            log.info("【META】已从 %s 导入 %s 条识别缓存" % (self.__meta_path, len(data_list)))
+        os.replace(self.__meta_path, "%s.bak" % self.__meta_path)
 
-    @staticmethod
-    def __load_meta_data(path):
+    def __excute_many(self, sql, data_list):
+        if not data_list:
+            return True
+        cursor = self.__connection.cursor()
         try:
-            with open(path, 'rb') as f:
-                data = pickle.load(f)
-            return data
+            cursor.executemany(sql, data_list)
+            self.__connection.commit()
         except Exception as e:
-            return {}
+            log.error("【META】写入缓存数据库出错：%s" % str(e))
+            return False
+        finally:
+            cursor.close()
+        return True
+
+    def __select_meta_data(self, key):
+        cursor = self.__connection.cursor()
+        try:
+            ret = cursor.execute("SELECT DATA, TIME FROM MEDIA_META WHERE KEY = ?", (key,)).fetchone()
+        except Exception as e:
+            log.error("【META】查询缓存数据库出错：%s" % str(e))
+            return None
+        finally:
+            cursor.close()
+        if not ret:
+            return None
+        return pickle.loads(ret[0]), ret[1]
+
+    @staticmethod
+    def __is_expired(item, save_time):
+        """
+        未识别到的记录超过有效期后需要重新查询
+        """
+        if item.get("id") != 0:
+            return False
+        return int(time.time()) - int(save_time or 0) > METAINFO_NONE_EXPIRE
+
+    def __cache_meta_data(self, key, item, save_time):
+        self.__meta_data[key] = (item, save_time)
+        self.__meta_data.move_to_end(key)
+        while len(self.__meta_data) > METAINFO_CACHE_SIZE:
+            self.__meta_data.popitem(last=False)
+
+    def __get_meta_data(self, key):
+        if key in self.__meta_data:
+            self.__meta_data.move_to_end(key)
+            item, save_time = self.__meta_data.get(key)
+        elif key in self.__dirty_data:
+            item, save_time = self.__dirty_data.get(key)
+            self.__cache_meta_data(key, item, save_time)
+        else:
+            ret = self.__select_meta_data(key)
+            if not ret:
+                return None
+            item, save_time = ret
+            self.__cache_meta_data(key, item, save_time)
+        if self.__is_expired(item, save_time):
+            self.__meta_data.pop(key, None)
+            return None
+        return item
+
+    def get_meta_data_by_key(self, key):
+        with lock:
+            return self.__get_meta_data(key)
 
     def update_meta_data(self, meta_data):
         with lock:
+            now = int(time.time())
             for key, item in meta_data.items():
-                if not self.__meta_data.get(key):
-                    self.__meta_data[key] = item
+                if not self.__get_meta_data(key):
+                    self.__cache_meta_data(key, item, now)
+                    self.__dirty_data[key] = (item, now)
 
     def save_meta_data(self):
+        """
+        将新增的识别结果增量写入数据库，由定时服务调用
+        """
         with lock:
-            meta_data = self.__load_meta_data(self.__meta_path)
-            save_flag = False
-            for key, item in self.__meta_data.items():
-                if not meta_data.get(key) and item.get("id") != 0:
-                    save_flag = True
-                    meta_data[key] = item
-            if not save_flag:
+            if not self.__dirty_data:
                 return
-            with open(self.__meta_path, 'wb') as f:
-                pickle.dump(meta_data, f, pickle.HIGHEST_PROTOCOL)
+            data_list = [(key, item.get("id") or 0, pickle.dumps(item, pickle.HIGHEST_PROTOCOL), save_time)
+                         for key, (item, save_time) in self.__dirty_data.items()]
+            if self.__excute_many("INSERT OR REPLACE INTO MEDIA_META(KEY, TMDBID, DATA, TIME) VALUES (?, ?, ?, ?)",
+                                  data_list):
+                self.__dirty_data = {}
+
+    def get_tmdb_names(self, mtype, tmdb_id):
+        """
+        查询缓存的TMDB译名
+        :param mtype: 译名类型：MOV、TV
+        :param tmdb_id: TMDB的ID
+        :return: 标准化后的译名集合，未缓存时返回None
+        """
+        key = (mtype, int(tmdb_id))
+        with lock:
+            if key in self.__names_data:
+                self.__names_data.move_to_end(key)
+                return self.__names_data.get(key)
+            cursor = self.__connection.cursor()
+            try:
+                ret = cursor.execute("SELECT NAMES FROM MEDIA_NAMES WHERE TYPE = ? AND TMDBID = ?", key).fetchone()
+            except Exception as e:
+                log.error("【META】查询缓存数据库出错：%s" % str(e))
+                return None
+            finally:
+                cursor.close()
+            if not ret:
+                return None
+            names = frozenset(json.loads(ret[0]))
+            self.__cache_tmdb_names(key, names)
+            return names
+
+    def update_tmdb_names(self, mtype, tmdb_id, names):
+        """
+        保存TMDB译名，每个TMDB ID只需要查询一次
+        :param mtype: 译名类型：MOV、TV
+        :param tmdb_id: TMDB的ID
+        :param names: 标准化后的译名集合
+        """
+        key = (mtype, int(tmdb_id))
+        names = frozenset(names)
+        with lock:
+            self.__cache_tmdb_names(key, names)
+            self.__excute_many("INSERT OR REPLACE INTO MEDIA_NAMES(TYPE, TMDBID, NAMES) VALUES (?, ?, ?)",
+                               [(key[0], key[1], json.dumps(sorted(names), ensure_ascii=False))])
+
+    def __cache_tmdb_names(self, key, names):
+        self.__names_data[key] = names
+        self.__names_data.move_to_end(key)
+        while len(self.__names_data) > METAINFO_CACHE_SIZE:
+            self.__names_data.popitem(last=False)
+
+    def get_fanart_image(self, mtype, tmdb_id):
+        """
+        查询缓存的Fanart图片地址
+        :param mtype: 图片类型：MOV、TV
+        :param tmdb_id: TMDB的ID
+        :return: 图片地址，没有图片时返回空字符串，未缓存或已过期时返回None
+        """
+        key = (mtype, int(tmdb_id))
+        with lock:
+            if key in self.__fanart_data:
+                self.__fanart_data.move_to_end(key)
+                url, save_time = self.__fanart_data.get(key)
+            else:
+                cursor = self.__connection.cursor()
+                try:
+                    ret = cursor.execute("SELECT URL, TIME FROM MEDIA_FANART WHERE TYPE = ? AND TMDBID = ?", key).fetchone()
+                except Exception as e:
+                    log.error("【META】查询缓存数据库出错：%s" % str(e))
+                    return None
+                finally:
+                    cursor.close()
+                if not ret:
+                    return None
+                url, save_time = ret[0] or "", ret[1]
+                self.__cache_fanart_image(key, url, save_time)
+            expire = FANART_IMAGE_EXPIRE if url else METAINFO_NONE_EXPIRE
+            if int(time.time()) - int(save_time or 0) > expire:
+                self.__fanart_data.pop(key, None)
+                return None
+            return url
+
+    def update_fanart_image(self, mtype, tmdb_id, url):
+        """
+        保存Fanart图片地址
+        :param mtype: 图片类型：MOV、TV
+        :param tmdb_id: TMDB的ID
+        :param url: 图片地址，没有图片时为空
+        """
+        key = (mtype, int(tmdb_id))
+        url = url or ""
+        now = int(time.time())
+        with lock:
+            self.__cache_fanart_image(key, url, now)
+            self.__excute_many("INSERT OR REPLACE INTO MEDIA_FANART(TYPE, TMDBID, URL, TIME) VALUES (?, ?, ?, ?)",
+                               [(key[0], key[1], url, now)])
+
+    def __cache_fanart_image(self, key, url, save_time):
+        self.__fanart_data[key] = (url, save_time)
+        self.__fanart_data.move_to_end(key)
+        while len(self.__fanart_data) > METAINFO_CACHE_SIZE:
+            self.__fanart_data.popitem(last=False)
+
+    def get_tmdb_details(self, mtype, tmdb_id, language):
+        """
+        查询缓存的TMDB详情
+        :param mtype: 详情类型：MOV、TV
+        :param tmdb_id: TMDB的ID
+        :param language: 查询详情时使用的语言
+        :return: TMDB详情，未缓存或已过期时返回None
+        """
+        key = (mtype, int(tmdb_id), language or "")
+        with lock:
+            if key in self.__details_data:
+                self.__details_data.move_to_end(key)
+                details, save_time, expire = self.__details_data.get(key)
+            else:
+                cursor = self.__connection.cursor()
+                try:
+                    ret = cursor.execute("SELECT DATA, TIME, EXPIRE FROM MEDIA_DETAILS "
+                                         "WHERE TYPE = ? AND TMDBID = ? AND LANGUAGE = ?", key).fetchone()
+                except Exception as e:
+                    log.error("【META】查询缓存数据库出错：%s" % str(e))
+                    return None
+                finally:
+                    cursor.close()
+                if not ret:
+                    return None
+                details, save_time, expire = pickle.loads(ret[0]), ret[1], ret[2]
+                self.__cache_tmdb_details(key, details, save_time, expire)
+            if int(time.time()) - int(save_time or 0) > int(expire or 0):
+                self.__details_data.pop(key, None)
+                return None
+            return details
+
+    def update_tmdb_details(self, mtype, tmdb_id, language, details):
+        """
+        保存TMDB详情，连载中的电视剧有效期较短，已完结的电视剧及电影有效期较长
+        :param mtype: 详情类型：MOV、TV
+        :param tmdb_id: TMDB的ID
+        :param language: 查询详情时使用的语言
+        :param details: TMDB详情
+        """
+        if not details:
+            return
+        key = (mtype, int(tmdb_id), language or "")
+        if mtype == "TV" and details.get("in_production", True) and details.get("status") not in ["Ended", "Canceled"]:
+            expire = TMDB_DETAILS_EXPIRE
+        else:
+            expire = TMDB_DETAILS_ENDED_EXPIRE
+        now = int(time.time())
+        with lock:
+            self.__cache_tmdb_details(key, details, now, expire)
+            self.__excute_many("INSERT OR REPLACE INTO MEDIA_DETAILS(TYPE, TMDBID, LANGUAGE, DATA, TIME, EXPIRE) "
+                               "VALUES (?, ?, ?, ?, ?, ?)",
+                               [(key[0], key[1], key[2], pickle.dumps(details, pickle.HIGHEST_PROTOCOL), now, expire)])
+
+    def __cache_tmdb_details(self, key, details, save_time, expire):
+        self.__details_data[key] = (details, save_time, expire)
+        self.__details_data.move_to_end(key)
+        while len(self.__details_data) > TMDB_DETAILS_CACHE_SIZE:
+            self.__details_data.popitem(last=False)
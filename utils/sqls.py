@@ -1,11 +1,19 @@
 import datetime
 import os.path
 import time
+from threading import Lock
 
 from utils.db_helper import update_by_sql, select_by_sql, update_by_sql_batch
 from utils.functions import str_filesize, xstr, str_sql
 from utils.types import MediaType
 
+# RSS订阅匹配索引，订阅变化时失效
+RSS_MATCH_INDEX = {}
+rss_index_lock = Lock()
+# RSS处理过的种子链接，首次使用时从数据库加载
+RSS_TORRENT_URLS = None
+rss_torrents_lock = Lock()
+
 
 # 将返回信息插入数据库
 def insert_search_results(media_items):
@@ -80,35 +88,52 @@ def get_search_results():
     return select_by_sql(sql)
 
 
-# 查询RSS是否处理过，根据链接
+# 查询RSS是否处理过，根据链接，处理过的链接缓存在内存中
 def is_torrent_rssd_by_url(url):
-    sql = "SELECT 1 FROM RSS_TORRENTS WHERE ENCLOSURE = ?"
-    ret = select_by_sql(sql, (url,))
-    if not ret:
+    global RSS_TORRENT_URLS
+    if not url:
         return False
-    if len(ret) > 0:
-        return True
-    return False
+    with rss_torrents_lock:
+        if RSS_TORRENT_URLS is None:
+            RSS_TORRENT_URLS = {ret[0] for ret in select_by_sql("SELECT DISTINCT ENCLOSURE FROM RSS_TORRENTS") if ret[0]}
+        return url in RSS_TORRENT_URLS
 
 
-# 查询RSS是否处理过，根据名称
-def is_torrent_rssd(media_info):
-    if not media_info:
-        return True
+# 生成RSS去重的关键字，电影为(标题, 年份)，电视剧为(标题, 年份, 季, 集)
+def get_rss_torrent_key(media_info):
     if media_info.type == MediaType.MOVIE:
-        sql = "SELECT COUNT(1) FROM RSS_TORRENTS WHERE TITLE = ? AND YEAR = ?"
-        rets = select_by_sql(sql, (str_sql(media_info.title), media_info.year))
-
+        return str_sql(media_info.title), xstr(media_info.year)
     else:
-        sql = "SELECT COUNT(1) FROM RSS_TORRENTS WHERE TITLE = ? AND YEAR = ? AND SEASON = ? AND EPISODE = ?"
+        return str_sql(media_info.title), xstr(media_info.year), \
+            media_info.get_season_string(), media_info.get_episode_string()
+
+
+# 批量查询RSS是否处理过，根据名称
+def get_rssd_torrent_keys(media_infos):
+    """
+    :param media_infos: 已识别的媒体信息列表
+    :return: 已处理过的关键字集合，同get_rss_torrent_key
+    """
+    titles = list({str_sql(media_info.title) for media_info in media_infos if media_info and media_info.title})
+    rssd_keys = set()
+    # 分批查询，避免超过SQLite参数数量限制
+    for i in range(0, len(titles), 500):
+        sub_titles = titles[i:i + 500]
+        sql = "SELECT DISTINCT TITLE, YEAR, SEASON, EPISODE FROM RSS_TORRENTS WHERE TITLE IN (%s)" \
+              % ",".join("?" * len(sub_titles))
+        for title, year, season, episode in select_by_sql(sql, tuple(sub_titles)):
+            year = xstr(year)
+            rssd_keys.add((title, year, season, episode))
+            # 电影只比较标题和年份
+            rssd_keys.add((title, year))
+    return rssd_keys
 
-        rets = select_by_sql(sql, (str_sql(media_info.title), media_info.year, media_info.get_season_string(),
-                                   media_info.get_episode_string()))
 
-    if rets and rets[0][0] > 0:
+# 查询RSS是否处理过，根据名称
+def is_torrent_rssd(media_info):
+    if not media_info:
         return True
-    else:
-        return False
+    return get_rss_torrent_key(media_info) in get_rssd_torrent_keys([media_info])
 
 
 # 删除所有搜索的记录
@@ -116,13 +141,83 @@ def delete_all_search_torrents():
     return update_by_sql("DELETE FROM SEARCH_TORRENTS")
 
 
-# 将RSS的记录插入数据库
-def insert_rss_torrents(media_info):
+# 将RSS的记录批量插入数据库
+def insert_rss_torrents(media_infos):
+    if not media_infos:
+        return False
+    if not isinstance(media_infos, list):
+        media_infos = [media_infos]
     sql = "INSERT INTO RSS_TORRENTS(TORRENT_NAME, ENCLOSURE, TYPE, TITLE, YEAR, SEASON, EPISODE) " \
           "VALUES (?, ?, ?, ?, ?, ?, ?)"
-    return update_by_sql(sql, (str_sql(media_info.org_string), media_info.enclosure, media_info.type.value,
-                               str_sql(media_info.title), media_info.year,
-                               media_info.get_season_string(), media_info.get_episode_string()))
+    data_list = [(str_sql(media_info.org_string), media_info.enclosure, media_info.type.value,
+                  str_sql(media_info.title), media_info.year,
+                  media_info.get_season_string(), media_info.get_episode_string()) for media_info in media_infos]
+    ret = update_by_sql_batch(sql, data_list)
+    if ret:
+        with rss_torrents_lock:
+            if RSS_TORRENT_URLS is not None:
+                RSS_TORRENT_URLS.update(media_info.enclosure for media_info in media_infos if media_info.enclosure)
+    return ret
+
+
+# 查询RSS增量处理游标
+def get_rss_cursor(url):
+    if not url:
+        return None
+    ret = select_by_sql("SELECT ETAG,LAST_MODIFIED,ITEMS FROM RSS_CURSOR WHERE URL = ?", (url,))
+    if not ret:
+        return None
+    return {"etag": ret[0][0], "last_modified": ret[0][1], "items": set(str(ret[0][2] or "").split("\n")) - {""}}
+
+
+# 更新RSS增量处理游标
+def update_rss_cursor(url, rss_cursor):
+    if not url or not rss_cursor:
+        return False
+    sql = "INSERT OR REPLACE INTO RSS_CURSOR(URL,ETAG,LAST_MODIFIED,ITEMS) VALUES (?, ?, ?, ?)"
+    return update_by_sql(sql, (url,
+                               rss_cursor.get("etag"),
+                               rss_cursor.get("last_modified"),
+                               "\n".join(rss_cursor.get("items") or [])))
+
+
+# 查询媒体库文件索引
+def get_library_files():
+    return select_by_sql("SELECT PATH,ROOT,NAME,SEASONS,EPISODES FROM LIBRARY_FILES")
+
+
+# 批量更新媒体库文件索引
+def insert_library_files(data_list):
+    if not data_list:
+        return False
+    sql = "INSERT OR REPLACE INTO LIBRARY_FILES(PATH,ROOT,NAME,SEASONS,EPISODES) VALUES (?, ?, ?, ?, ?)"
+    return update_by_sql_batch(sql, data_list)
+
+
+# 批量删除媒体库文件索引
+def delete_library_files(paths):
+    if not paths:
+        return False
+    return update_by_sql_batch("DELETE FROM LIBRARY_FILES WHERE PATH = ?", [(path,) for path in paths])
+
+
+# 查询目录监控待转移队列
+def get_sync_transfer_queue():
+    return select_by_sql("SELECT FILE_PATH,PATH,TARGET,UNKNOWN FROM SYNC_TRANSFER_QUEUE")
+
+
+# 加入目录监控待转移队列
+def insert_sync_transfer_queue(file_path, path, target, unknown):
+    sql = "INSERT OR REPLACE INTO SYNC_TRANSFER_QUEUE(FILE_PATH,PATH,TARGET,UNKNOWN) VALUES (?, ?, ?, ?)"
+    return update_by_sql(sql, (file_path, path, target, unknown))
+
+
+# 从目录监控待转移队列中删除已处理的文件
+def delete_sync_transfer_queue(file_paths):
+    if not file_paths:
+        return False
+    return update_by_sql_batch("DELETE FROM SYNC_TRANSFER_QUEUE WHERE FILE_PATH = ?",
+                               [(file_path,) for file_path in file_paths])
 
 
 # 将豆瓣的数据插入数据库
@@ -434,12 +529,14 @@ def insert_rss_movie(media_info, state='D'):
     if is_exists_rss_movie(media_info.title, media_info.year):
         return True
     sql = "INSERT INTO RSS_MOVIES(NAME,YEAR,TMDBID,IMAGE,DESC,STATE) VALUES (?, ?, ?, ?, ?, ?)"
-    return update_by_sql(sql, (str_sql(media_info.title),
-                               str_sql(media_info.year),
-                               str_sql(media_info.tmdb_id),
-                               str_sql(media_info.get_backdrop_path()),
-                               str_sql(media_info.overview),
-                               state))
+    ret = update_by_sql(sql, (str_sql(media_info.title),
+                              str_sql(media_info.year),
+                              str_sql(media_info.tmdb_id),
+                              str_sql(media_info.get_backdrop_path()),
+                              str_sql(media_info.overview),
+                              state))
+    clear_rss_match_index()
+    return ret
 
 
 # 删除RSS电影
@@ -447,7 +544,9 @@ def delete_rss_movie(title, year):
     if not title:
         return False
     sql = "DELETE FROM RSS_MOVIES WHERE NAME = ? AND YEAR = ?"
-    return update_by_sql(sql, (str_sql(title), year))
+    ret = update_by_sql(sql, (str_sql(title), year))
+    clear_rss_match_index()
+    return ret
 
 
 # 判断RSS电视剧是否存在
@@ -471,15 +570,17 @@ def insert_rss_tv(media_info, total, lack=0, state="D"):
     if is_exists_rss_tv(media_info.title, media_info.year, media_info.get_season_string()):
         return True
     sql = "INSERT INTO RSS_TVS(NAME,YEAR,SEASON,TMDBID,IMAGE,DESC,TOTAL,LACK,STATE) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
-    return update_by_sql(sql, (str_sql(media_info.title),
-                               str_sql(media_info.year),
-                               media_info.get_season_string(),
-                               str_sql(media_info.tmdb_id),
-                               str_sql(media_info.get_backdrop_path()),
-                               str_sql(media_info.overview),
-                               total,
-                               lack,
-                               state))
+    ret = update_by_sql(sql, (str_sql(media_info.title),
+                              str_sql(media_info.year),
+                              media_info.get_season_string(),
+                              str_sql(media_info.tmdb_id),
+                              str_sql(media_info.get_backdrop_path()),
+                              str_sql(media_info.overview),
+                              total,
+                              lack,
+                              state))
+    clear_rss_match_index()
+    return ret
 
 
 # 更新电视剧缺失的集数
@@ -495,7 +596,9 @@ def delete_rss_tv(title, year, season):
     if not title:
         return False
     sql = "DELETE FROM RSS_TVS WHERE NAME = ? AND YEAR = ? AND SEASON = ?"
-    return update_by_sql(sql, (str_sql(title), year, season))
+    ret = update_by_sql(sql, (str_sql(title), year, season))
+    clear_rss_match_index()
+    return ret
 
 
 # 更新电影订阅状态
@@ -503,7 +606,9 @@ def update_rss_movie_state(title, year, state):
     if not title:
         return False
     sql = "UPDATE RSS_MOVIES SET STATE = ? WHERE NAME = ? AND YEAR = ?"
-    return update_by_sql(sql, (state, str_sql(title), year))
+    ret = update_by_sql(sql, (state, str_sql(title), year))
+    clear_rss_match_index()
+    return ret
 
 
 # 更新电视剧订阅状态
@@ -511,7 +616,30 @@ def update_rss_tv_state(title, year, season, state):
     if not title:
         return False
     sql = "UPDATE RSS_TVS SET STATE = ? WHERE NAME = ? AND YEAR = ? AND SEASON = ?"
-    return update_by_sql(sql, (state, str_sql(title), year, season))
+    ret = update_by_sql(sql, (state, str_sql(title), year, season))
+    clear_rss_match_index()
+    return ret
+
+
+# 查询订阅的匹配索引，订阅未变化时不重复查询数据库
+def get_rss_match_index(state='R'):
+    """
+    :param state: 订阅状态
+    :return: 电影索引{(名称, 年份)}、电视剧索引{(名称, 年份, 季)}
+    """
+    with rss_index_lock:
+        rss_index = RSS_MATCH_INDEX.get(state)
+        if rss_index is None:
+            movie_index = {(movie[0], str(movie[1])) for movie in get_rss_movies(state=state) if movie}
+            tv_index = {(tv[0], str(tv[1]), tv[2]) for tv in get_rss_tvs(state=state) if tv}
+            rss_index = RSS_MATCH_INDEX[state] = (movie_index, tv_index)
+        return rss_index
+
+
+# 清除订阅的匹配索引
+def clear_rss_match_index():
+    with rss_index_lock:
+        RSS_MATCH_INDEX.clear()
 
 
 # 查询是否存在同步历史记录
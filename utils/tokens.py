@@ -1,5 +1,8 @@
 import re
 
+# 分隔符
+SPLIT_RE = re.compile(r'\.|\s+|\(|\)|\[|]|-|\+|【|】|/|～|;|&|\||#|_|「|」|（|）')
+
 
 class Tokens:
     __text = ""
@@ -12,10 +15,7 @@ class Tokens:
         self.load_text(text)
 
     def load_text(self, text):
-        splited_text = re.split(r'\.|\s+|\(|\)|\[|]|-|\+|【|】|/|～|;|&|\||#|_|「|」|（|）', text)
-        for sub_text in splited_text:
-            if sub_text:
-                self.__tokens.append(sub_text)
+        self.__tokens.extend([sub_text for sub_text in SPLIT_RE.split(text) if sub_text])
 
     def get_next(self):
         if self.__index >= len(self.__tokens):
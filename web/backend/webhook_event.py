@@ -1,12 +1,12 @@
 import time
 from datetime import datetime
-import requests
 
 import log
 from config import RMT_FAVTYPE
 from message.send import Message
 from rmt.filetransfer import FileTransfer
 from pt.media_server import MediaServer
+from utils.http_utils import RequestUtils
 from utils.types import MediaType
 
 PLAY_LIST = []
@@ -38,6 +38,7 @@ class WebhookEvent:
             return
         # 事件信息
         Item = input_json.get('Item', {})
+        self.item = Item
         self.provider_ids = Item.get('ProviderIds', {})
         self.item_type = Item.get('Type')
         if self.item_type == 'Episode':
@@ -68,13 +69,13 @@ class WebhookEvent:
               '&oe=gbk&cb=op_aladdin_callback&format=json&tn=baidu&' \
               'cb=jQuery110203920624944751099_1529894588086&_=1529894588088&query=%s' % ip
         try:
-            r = requests.get(url, timeout=10)
+            r = RequestUtils().get_res(url)
             r.encoding = 'gbk'
             html = r.text
             c1 = html.split('location":"')[1]
             c2 = c1.split('","')[0]
             return c2
-        except requests.exceptions:
+        except Exception:
             return ''
 
     def report_to_discord(self):
@@ -122,6 +123,10 @@ class WebhookEvent:
                            + '\nIP地址：' + self.ip \
                            + '\n位置：' + self.get_location(self.ip) \
                            + '\n时间：' + time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time()))
+        # 媒体库事件，更新媒体库快照
+        if self.category == 'library':
+            self.mediaserver.update_library_snapshot(self.action, self.item)
+            return
         # 小红心事件
         if self.category == 'item':
             if self.action == 'rate':
@@ -7,7 +7,6 @@ import subprocess
 import importlib
 from math import floor
 from subprocess import call
-import requests
 from flask import Flask, request, json, render_template, make_response
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -23,6 +22,7 @@ from pt.client.transmission import Transmission
 from pt.downloader import Downloader
 from pt.rss import Rss
 from pt.searcher import Searcher
+from pt.torrent import Torrent
 from rmt.filetransfer import FileTransfer
 from rmt.media import Media
 from pt.media_server import MediaServer
@@ -39,6 +39,8 @@ from config import WECHAT_MENU, PT_TRANSFER_INTERVAL, LOG_QUEUE
 from service.run import stop_scheduler, restart_scheduler
 from service.scheduler import Scheduler
 from utils.functions import get_used_of_partition, str_filesize, str_timelong, get_system, get_dir_files_by_ext
+from utils.file_utils import get_copy_progress
+from utils.http_utils import RequestUtils
 from utils.sqls import get_search_result_by_id, get_search_results, \
     get_transfer_history, get_transfer_unknown_paths, \
     update_transfer_unknown_state, delete_transfer_unknown, get_transfer_path_by_id, insert_transfer_blacklist, \
@@ -780,9 +782,19 @@ def create_flask_app(config):
         scheduler_cfg_list.append(
             {'name': '实时日志', 'time': '', 'state': 'OFF', 'id': 'logging', 'svg': svg, 'color': 'indigo'})
 
+        # 正在复制的文件
+        copy_tasks = []
+        for copy_info in get_copy_progress():
+            copy_tasks.append({'name': os.path.basename(copy_info.get('dest')),
+                               'percent': copy_info.get('percent'),
+                               'size': "%s/%s" % (str_filesize(copy_info.get('copied')), str_filesize(copy_info.get('total'))),
+                               'speed': "%s/s" % str_filesize(copy_info.get('speed')),
+                               'eta': str_timelong(copy_info.get('eta')) if copy_info.get('eta') is not None else "未知"})
+
         return render_template("service.html",
                                Count=len(scheduler_cfg_list),
-                               SchedulerTasks=scheduler_cfg_list)
+                               SchedulerTasks=scheduler_cfg_list,
+                               CopyTasks=copy_tasks)
 
     # 历史记录页面
     @App.route('/history', methods=['POST', 'GET'])
@@ -1273,8 +1285,8 @@ def create_flask_app(config):
                 info = ""
                 code = 0
                 try:
-                    response = requests.get("https://api.github.com/repos/jxxghp/nas-tools/releases/latest", timeout=10,
-                                            proxies=config.get_proxies())
+                    response = RequestUtils(proxies=config.get_proxies()).get_res(
+                        "https://api.github.com/repos/jxxghp/nas-tools/releases/latest")
                     if response:
                         ver_json = response.json()
                         version = ver_json["tag_name"]
@@ -1317,6 +1329,7 @@ def create_flask_app(config):
                                              exclude=exclude,
                                              size=size,
                                              note=note)
+                Torrent.clear_resource_rules()
                 return {"code": ret}
 
             # 查询单个站点信息
@@ -1333,6 +1346,7 @@ def create_flask_app(config):
                 tid = data.get("id")
                 if tid:
                     ret = delete_config_site(tid)
+                    Torrent.clear_resource_rules()
                     return {"code": ret}
                 else:
                     return {"code": 0}
@@ -1349,6 +1363,7 @@ def create_flask_app(config):
                 note = data.get('search_note')
                 size = data.get('search_size')
                 ret = update_config_search_rule(include=include, exclude=exclude, note=note, size=size)
+                Torrent.clear_resource_rules()
                 return {"code": ret}
 
             # 查询RSS全局过滤规则
@@ -1360,6 +1375,7 @@ def create_flask_app(config):
             if cmd == "update_rss_rule":
                 note = data.get('rss_note')
                 ret = update_config_rss_rule(note=note)
+                Torrent.clear_resource_rules()
                 return {"code": ret}
 
             # 重启